@@ -1,24 +1,76 @@
-from flask import Flask, jsonify, render_template, redirect, url_for, session, request
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    render_template,
+    redirect,
+    url_for,
+    session,
+    request,
+)
 from models import init_db_sqlite
-from database_utils import inicializar_dados_exemplo, obter_estatisticas
+from database_utils import (
+    clonar_banco,
+    configurar_pool,
+    inicializar_dados_exemplo,
+    obter_estatisticas,
+    estatisticas_pool,
+    estatisticas_pool_leitura,
+    somente_leitura,
+    resumir_consultas_lentas,
+    init_app as init_db_app,
+)
+from cache_dashboard import estatisticas_cache, obter_estatisticas_em_cache
+from eventos import estatisticas_eventos, fluxo_eventos
+from escritor import estatisticas_escritor, init_app as init_escritor
+from backup import (
+    BackupEmAndamento,
+    criar_backup,
+    estatisticas_backup,
+    init_app as init_backup,
+)
 from datetime import timedelta, datetime
-import logging
-from logging.handlers import RotatingFileHandler
 import os
+import sqlite3
 from dotenv import load_dotenv
 
 
-from auth import auth_bp
+from auth import auth_bp, acesso_requerido
 from produtos import produtos_bp
 from estoque import estoque_bp
 from fornecedores import fornecedores_bp
 from relatorios import relatorios_bp
+from comandos import registrar_comandos
+from registro_logs import configurar_logs
+import metricas
 
 
 load_dotenv()
 
 
-def create_app():
+def create_app(config=None):
+    """
+    Cria a aplicação.
+
+    Args:
+        config (dict, opcional): Valores que sobrescrevem app.config. Chaves
+            do banco de dados:
+            DATABASE: caminho ou URI SQLite do banco (padrão: variável de
+                ambiente DATABASE ou estoque.db). Aceita banco em memória
+                compartilhado, ex. "file::memory:?cache=shared" ou
+                "file:teste_1?mode=memory&cache=shared".
+            DATABASE_MODELO: banco já migrado copiado para DATABASE (API de
+                backup do SQLite) antes das migrações; com ele, cada teste
+                parte de um banco novo sem reaplicar o esquema.
+            ESCRITOR_UNICO: se True, movimentos e vendas são gravados pela
+                thread do escritor único, com group commit (ver escritor.py;
+                padrão: variável de ambiente ESCRITOR_UNICO).
+            BACKUP_INTERVALO_MIN, BACKUP_DIR: backup agendado (ver
+                backup.py; padrão: variáveis de ambiente de mesmo nome).
+
+    O pool de conexões é global ao processo: criar uma aplicação com
+    DATABASE aponta todo o processo para esse banco.
+    """
     app = Flask(__name__)
 
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", os.urandom(24).hex())
@@ -26,16 +78,18 @@ def create_app():
         "FLASK_ENV") != "development"
     app.config["SESSION_COOKIE_HTTPONLY"] = True
     app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=8)
+    app.config.update(config or {})
 
-    if not os.path.exists("logs"):
-        os.makedirs("logs")
-    log_handler = RotatingFileHandler(
-        "logs/app.log", maxBytes=10240, backupCount=3)
-    log_formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(message)s")
-    log_handler.setFormatter(log_formatter)
-    app.logger.addHandler(log_handler)
-    app.logger.setLevel(logging.INFO)
+    if app.config.get("DATABASE"):
+        configurar_pool(database=app.config["DATABASE"])
+    if app.config.get("DATABASE_MODELO"):
+        clonar_banco(app.config["DATABASE_MODELO"])
+
+    configurar_logs(app)
+
+    init_db_app(app)
+    init_escritor(app)
+    metricas.init_app(app)
 
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(produtos_bp, url_prefix="/produtos")
@@ -43,12 +97,15 @@ def create_app():
     app.register_blueprint(relatorios_bp, url_prefix="/relatorios")
     app.register_blueprint(fornecedores_bp, url_prefix="/fornecedores")
 
+    registrar_comandos(app)
+
     with app.app_context():
         init_db_sqlite()
+    init_backup(app)
 
     @app.before_request
     def require_login():
-        allowed_endpoints = ["auth.login", "static", "init_data"]
+        allowed_endpoints = ["auth.login", "static", "init_data", "metricas"]
         if request.endpoint and (
             request.endpoint.startswith("auth.")
             or request.endpoint in allowed_endpoints
@@ -71,10 +128,82 @@ def create_app():
         return render_template("dashboard.html", now=now)
 
     @app.route("/api/dashboard/stats")
+    @somente_leitura
     def dashboard_stats():
-        with app.app_context():
-            estatisticas = obter_estatisticas()
-        return jsonify(estatisticas)
+        # Com o cabeçalho X-Debug-Timing: 1 a resposta inclui "tempos_ms",
+        # a duração de cada seção das estatísticas.
+        incluir_tempos = request.headers.get("X-Debug-Timing", "").lower() in (
+            "1",
+            "true",
+        )
+        if incluir_tempos:
+            return jsonify(obter_estatisticas(incluir_tempos=True))
+        # Instantâneo compartilhado entre os processos; X-Cache indica se
+        # veio atualizado (HIT), desatualizado em renovação (STALE) ou se foi
+        # calculado agora (MISS).
+        estatisticas, situacao = obter_estatisticas_em_cache()
+        resposta = jsonify(estatisticas)
+        resposta.headers["X-Cache"] = situacao
+        return resposta
+
+    @app.route("/api/eventos")
+    def eventos_stream():
+        # Server-Sent Events: movimentos, vendas, cancelamentos e variações
+        # dos contadores do dashboard, sem polling.
+        return Response(
+            fluxo_eventos(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/api/admin/pool")
+    @acesso_requerido(["admin"])
+    def pool_stats():
+        return jsonify({**estatisticas_pool(), "leitura": estatisticas_pool_leitura()})
+
+    @app.route("/api/admin/cache")
+    @acesso_requerido(["admin"])
+    def cache_stats():
+        return jsonify(estatisticas_cache())
+
+    @app.route("/api/admin/consultas-lentas")
+    @acesso_requerido(["admin"])
+    def consultas_lentas():
+        limite = request.args.get("limite", 20, type=int)
+        try:
+            return jsonify(
+                resumir_consultas_lentas(
+                    limite=max(1, min(limite, 200)),
+                    ordenar_por=request.args.get("ordenar", "total"),
+                )
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.route("/api/admin/eventos")
+    @acesso_requerido(["admin"])
+    def eventos_stats():
+        return jsonify(estatisticas_eventos())
+
+    @app.route("/api/admin/escritor")
+    @acesso_requerido(["admin"])
+    def escritor_stats():
+        return jsonify(estatisticas_escritor())
+
+    @app.route("/api/admin/backup", methods=["GET", "POST"])
+    @acesso_requerido(["admin"])
+    def backup_banco():
+        if request.method == "GET":
+            return jsonify(estatisticas_backup())
+        try:
+            return jsonify(criar_backup()), 201
+        except BackupEmAndamento as e:
+            return jsonify({"error": str(e)}), 409
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except (sqlite3.Error, OSError) as e:
+            app.logger.error("Erro ao criar backup: %s", e, exc_info=True)
+            return jsonify({"error": "Erro ao criar backup."}), 500
 
     @app.route("/api/init-data", methods=["GET"])
     def init_data():
@@ -88,9 +217,22 @@ def create_app():
     return app
 
 
-app = create_app()
+_app = None
+
+
+def __getattr__(nome):
+    # `app` é criada no primeiro acesso (flask --app app, gunicorn app:app),
+    # não na importação: quem só precisa de create_app(config) não abre o
+    # banco padrão.
+    global _app
+    if nome == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
 
 if __name__ == "__main__":
 
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    create_app().run(host="0.0.0.0", port=port, debug=True)
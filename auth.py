@@ -8,7 +8,12 @@ from flask import (
     session,
     flash,
 )
-from database_utils import get_db
+from database_utils import (
+    get_db,
+    atualizar_registro,
+    excluir_registro,
+    inserir_registro,
+)
 from datetime import datetime
 from functools import wraps
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -172,11 +177,9 @@ def login():
             return render_template("login.html")
 
         try:
-            db.execute(
-                "UPDATE usuario SET ultimo_acesso = ? WHERE id = ?",
-                (datetime.now(), usuario["id"]),
+            atualizar_registro(
+                "usuario", usuario["id"], {"ultimo_acesso": datetime.now()}
             )
-            db.commit()
         except Exception as e:
 
             print(f"Erro ao atualizar ultimo_acesso: {e}")
@@ -312,19 +315,17 @@ def novo_usuario():
             if session.get("user_level") == "gerente":
                 manager_id = session.get("user_id")
 
-            cursor = db.execute(
-                "INSERT INTO usuario (nome, email, senha_hash, nivel_acesso, ativo, manager_id) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    nome,
-                    email,
-                    senha_hash,
-                    nivel_acesso,
-                    1,
-                    manager_id,
-                ),
+            novo_usuario_id = inserir_registro(
+                "usuario",
+                {
+                    "nome": nome,
+                    "email": email,
+                    "senha_hash": senha_hash,
+                    "nivel_acesso": nivel_acesso,
+                    "ativo": 1,
+                    "manager_id": manager_id,
+                },
             )
-            db.commit()
-            novo_usuario_id = cursor.lastrowid
 
             if request.is_json:
                 usuario_criado = db.execute(
@@ -448,16 +449,8 @@ def usuario(id):
                 400,
             )
 
-        set_clauses = [f"{key} = ?" for key in updates.keys()]
-        param_values = list(updates.values())
-        param_values.append(id)
-
         try:
-            db.execute(
-                f"UPDATE usuario SET {', '.join(set_clauses)} WHERE id = ?",
-                param_values,
-            )
-            db.commit()
+            atualizar_registro("usuario", id, updates)
             usuario_atualizado = db.execute(
                 "SELECT id, nome, email, nivel_acesso, ativo FROM usuario WHERE id = ?",
                 (id,),
@@ -483,8 +476,7 @@ def usuario(id):
 
         try:
 
-            db.execute("DELETE FROM usuario WHERE id = ?", (id,))
-            db.commit()
+            excluir_registro("usuario", id)
             db.close()
             return jsonify({"message": "Usuário excluído com sucesso!"})
         except Exception as e:
@@ -564,11 +556,9 @@ def alterar_senha():
         hashed_nova_senha = generate_password_hash(nova_senha)
 
         try:
-            db.execute(
-                "UPDATE usuario SET senha_hash = ? WHERE id = ?",
-                (hashed_nova_senha, usuario["id"]),
+            atualizar_registro(
+                "usuario", usuario["id"], {"senha_hash": hashed_nova_senha}
             )
-            db.commit()
             db.close()
             flash_msg = "Senha alterada com sucesso!"
             if request.is_json:
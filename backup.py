@@ -0,0 +1,339 @@
+"""
+Backup online do banco com a API de backup do SQLite (flask backup,
+POST /api/admin/backup e agendamento opcional).
+
+A cópia é feita em passos de BACKUP_PAGINAS_POR_PASSO páginas, com uma
+pausa de BACKUP_PAUSA_MS entre eles, a partir de uma conexão que mantém uma
+transação de leitura aberta: no WAL ela fixa um instantâneo consistente sem
+bloquear os escritores. Sem essa transação, cada escrita feita por outra
+conexão durante a cópia faz o SQLite recomeçá-la, e sob escrita contínua o
+backup não termina. Enquanto o instantâneo estiver aberto o checkpoint não
+avança além dele, então o WAL cresce durante a cópia.
+
+Cada cópia passa por PRAGMA integrity_check antes de ser comprimida (gzip)
+e só então ganha o nome definitivo; cópias parciais ou inválidas são
+descartadas. Depois de cada backup ficam apenas os BACKUP_RETENCAO mais
+recentes.
+
+Com BACKUP_INTERVALO_MIN > 0, cada processo da aplicação mantém uma thread
+que verifica periodicamente a idade do último backup; a trava de arquivo no
+diretório garante que só um processo faça a cópia, e a idade é conferida de
+novo sob a trava.
+"""
+
+import datetime
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import database_utils
+from database_utils import banco_em_memoria, caminho_arquivo_banco, trava_arquivo
+
+
+logger = logging.getLogger(__name__)
+
+
+# Padrão: subdiretório "backups" ao lado do arquivo do banco.
+BACKUP_DIR = os.environ.get("BACKUP_DIR")
+BACKUP_RETENCAO = int(os.environ.get("BACKUP_RETENCAO", 7))
+BACKUP_PAGINAS_POR_PASSO = int(os.environ.get("BACKUP_PAGINAS_POR_PASSO", 1024))
+BACKUP_PAUSA_MS = float(os.environ.get("BACKUP_PAUSA_MS", 5))
+BACKUP_INTERVALO_MIN = float(os.environ.get("BACKUP_INTERVALO_MIN", 0))
+BACKUP_COMPRIMIR = os.environ.get("BACKUP_COMPRIMIR", "1").lower() not in ("0", "false", "nao")
+# Nível 1: em um banco de 60 MB, ~4x mais rápido que o 6 por ~7% a mais de
+# tamanho; a compressão ocupa a CPU do processo da aplicação.
+BACKUP_COMPRESSAO_NIVEL = int(os.environ.get("BACKUP_COMPRESSAO_NIVEL", 1))
+# Maior intervalo entre verificações do agendador.
+BACKUP_VERIFICACAO_MAXIMA_S = 60
+
+_ultimo_resultado = None
+
+
+class BackupEmAndamento(RuntimeError):
+    """Outro processo ou thread já está fazendo um backup."""
+
+
+def _prefixo(database):
+    caminho = caminho_arquivo_banco(database)
+    return os.path.splitext(os.path.basename(caminho))[0] or "banco"
+
+
+def diretorio_padrao(database=None):
+    """BACKUP_DIR, ou "backups" ao lado do arquivo do banco."""
+    if BACKUP_DIR:
+        return BACKUP_DIR
+    caminho = caminho_arquivo_banco(database or database_utils.DATABASE_NAME)
+    return os.path.join(os.path.dirname(os.path.abspath(caminho)), "backups")
+
+
+def listar_backups(diretorio=None, database=None):
+    """
+    Backups do banco no diretório, do mais recente para o mais antigo.
+
+    Returns:
+        list[dict]: {"arquivo", "caminho", "bytes", "criado_em"} por backup.
+    """
+    database = database or database_utils.DATABASE_NAME
+    diretorio = diretorio or diretorio_padrao(database)
+    prefixo = _prefixo(database)
+    backups = []
+    for caminho in glob.glob(os.path.join(glob.escape(diretorio), f"{glob.escape(prefixo)}-*.db*")):
+        if not caminho.endswith((".db", ".db.gz")):
+            continue
+        estado = os.stat(caminho)
+        backups.append(
+            {
+                "arquivo": os.path.basename(caminho),
+                "caminho": caminho,
+                "bytes": estado.st_size,
+                "criado_em": datetime.datetime.fromtimestamp(estado.st_mtime)
+                .astimezone()
+                .isoformat(timespec="seconds"),
+            }
+        )
+    # O nome leva data e hora com milissegundos: a ordem alfabética é a
+    # cronológica.
+    return sorted(backups, key=lambda b: b["arquivo"], reverse=True)
+
+
+def aplicar_retencao(diretorio=None, retencao=None, database=None):
+    """Remove os backups além dos `retencao` mais recentes; retorna os removidos."""
+    retencao = BACKUP_RETENCAO if retencao is None else retencao
+    if retencao <= 0:
+        return []
+    removidos = []
+    for backup in listar_backups(diretorio, database)[retencao:]:
+        try:
+            os.remove(backup["caminho"])
+            removidos.append(backup["arquivo"])
+        except OSError:
+            logger.warning("Não foi possível remover o backup %s.", backup["caminho"], exc_info=True)
+    return removidos
+
+
+def _copiar(database, destino, paginas_por_passo, pausa):
+    origem = sqlite3.connect(
+        database,
+        uri=database.startswith("file:"),
+        timeout=database_utils.get_pool().busy_timeout_ms / 1000,
+    )
+    copia = sqlite3.connect(destino)
+    passos = 0
+
+    def progresso(status, restantes, total):
+        nonlocal passos
+        passos += 1
+        if pausa and restantes:
+            time.sleep(pausa)
+
+    try:
+        # Transação de leitura aberta durante toda a cópia: instantâneo fixo.
+        origem.execute("BEGIN")
+        origem.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        origem.backup(copia, pages=paginas_por_passo, progress=progresso)
+        origem.rollback()
+        paginas = copia.execute("PRAGMA page_count").fetchone()[0]
+        # A cópia herda o modo WAL do cabeçalho; como arquivo avulso ela deve
+        # ser autossuficiente.
+        copia.execute("PRAGMA journal_mode = DELETE")
+        return copia, paginas, passos
+    except BaseException:
+        copia.close()
+        raise
+    finally:
+        origem.close()
+
+
+def criar_backup(
+    diretorio=None,
+    retencao=None,
+    comprimir=None,
+    verificar=True,
+    paginas_por_passo=None,
+    pausa_ms=None,
+    idade_minima_s=None,
+):
+    """
+    Copia o banco atual para `diretorio` (padrão diretorio_padrao()).
+
+    Args:
+        diretorio (str, opcional): Destino dos backups.
+        retencao (int, opcional): Backups mantidos (padrão BACKUP_RETENCAO;
+            0 mantém todos).
+        comprimir (bool, opcional): Grava .db.gz (padrão BACKUP_COMPRIMIR).
+        verificar (bool): Roda PRAGMA integrity_check na cópia.
+        paginas_por_passo (int, opcional): Páginas copiadas por passo.
+        pausa_ms (float, opcional): Pausa entre passos.
+        idade_minima_s (float, opcional): Só copia se o backup mais recente
+            for mais antigo que isso (conferido já com a trava, para que
+            processos agendados não copiem duas vezes).
+
+    Returns:
+        dict | None: Arquivo gerado, tamanhos, páginas, passos, tempos e
+        backups removidos pela retenção; None se idade_minima_s dispensou
+        a cópia.
+
+    Raises:
+        ValueError: Se o banco for em memória.
+        BackupEmAndamento: Se outro backup estiver em andamento.
+        sqlite3.DatabaseError: Se a cópia falhar no integrity_check.
+    """
+    global _ultimo_resultado
+    database = database_utils.DATABASE_NAME
+    if banco_em_memoria(database):
+        raise ValueError("Banco em memória não tem backup em arquivo.")
+    diretorio = diretorio or diretorio_padrao(database)
+    comprimir = BACKUP_COMPRIMIR if comprimir is None else comprimir
+    paginas_por_passo = max(1, int(paginas_por_passo or BACKUP_PAGINAS_POR_PASSO))
+    pausa = (BACKUP_PAUSA_MS if pausa_ms is None else pausa_ms) / 1000
+    os.makedirs(diretorio, exist_ok=True)
+
+    try:
+        with trava_arquivo(os.path.join(diretorio, ".backup.lock"), bloquear=False):
+            if idade_minima_s is not None and _segundos_ate_proximo(idade_minima_s, diretorio) > 0:
+                return None
+            resultado = _criar_backup(
+                database, diretorio, comprimir, verificar, paginas_por_passo, pausa
+            )
+    except BlockingIOError:
+        raise BackupEmAndamento("Já há um backup em andamento.")
+    resultado["removidos"] = aplicar_retencao(diretorio, retencao, database)
+    _ultimo_resultado = resultado
+    logger.info(
+        "Backup %s criado: %d páginas em %.2f s (%d bytes).",
+        resultado["arquivo"],
+        resultado["paginas"],
+        resultado["tempos"]["total_s"],
+        resultado["bytes"],
+    )
+    return resultado
+
+
+def _criar_backup(database, diretorio, comprimir, verificar, paginas_por_passo, pausa):
+    inicio = time.perf_counter()
+    carimbo = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+    nome = f"{_prefixo(database)}-{carimbo}.db"
+    final = os.path.join(diretorio, nome + (".gz" if comprimir else ""))
+    parcial = os.path.join(diretorio, nome + ".parcial")
+    tempos = {}
+
+    try:
+        copia, paginas, passos = _copiar(database, parcial, paginas_por_passo, pausa)
+        tempos["copia_s"] = round(time.perf_counter() - inicio, 3)
+        try:
+            integridade = None
+            if verificar:
+                marco = time.perf_counter()
+                linhas = [linha[0] for linha in copia.execute("PRAGMA integrity_check")]
+                tempos["verificacao_s"] = round(time.perf_counter() - marco, 3)
+                if linhas != ["ok"]:
+                    raise sqlite3.DatabaseError(
+                        "Backup reprovado no integrity_check: " + "; ".join(linhas[:5])
+                    )
+                integridade = "ok"
+        finally:
+            copia.close()
+
+        bytes_banco = os.path.getsize(parcial)
+        if comprimir:
+            marco = time.perf_counter()
+            temporario = final + ".parcial"
+            try:
+                with open(parcial, "rb") as entrada, gzip.open(
+                    temporario, "wb", compresslevel=BACKUP_COMPRESSAO_NIVEL
+                ) as saida:
+                    shutil.copyfileobj(entrada, saida, 1024 * 1024)
+                os.replace(temporario, final)
+            finally:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+            os.remove(parcial)
+            tempos["compressao_s"] = round(time.perf_counter() - marco, 3)
+        else:
+            os.replace(parcial, final)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+
+    tempos["total_s"] = round(time.perf_counter() - inicio, 3)
+    return {
+        "arquivo": os.path.basename(final),
+        "caminho": final,
+        "bytes_banco": bytes_banco,
+        "bytes": os.path.getsize(final),
+        "paginas": paginas,
+        "passos": passos,
+        "integridade": integridade,
+        "criado_em": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        "tempos": tempos,
+    }
+
+
+def estatisticas_backup(diretorio=None):
+    """Backups existentes e o último resultado deste processo."""
+    return {
+        "diretorio": os.path.abspath(diretorio or diretorio_padrao()),
+        "retencao": BACKUP_RETENCAO,
+        "intervalo_min": BACKUP_INTERVALO_MIN,
+        "ultimo": _ultimo_resultado,
+        "backups": [
+            {k: v for k, v in b.items() if k != "caminho"} for b in listar_backups(diretorio)
+        ],
+    }
+
+
+# --- Agendamento ------------------------------------------------------------
+
+def _segundos_ate_proximo(intervalo, diretorio):
+    backups = listar_backups(diretorio)
+    if not backups:
+        return 0.0
+    idade = time.time() - os.path.getmtime(backups[0]["caminho"])
+    return max(0.0, intervalo - idade)
+
+
+def _agendador(intervalo, diretorio):
+    while True:
+        try:
+            restante = _segundos_ate_proximo(intervalo, diretorio)
+            if restante > 0:
+                time.sleep(min(restante, BACKUP_VERIFICACAO_MAXIMA_S))
+                continue
+            criar_backup(diretorio, idade_minima_s=intervalo)
+        except BackupEmAndamento:
+            # Outro processo está copiando; a próxima verificação já verá o
+            # backup dele.
+            time.sleep(BACKUP_VERIFICACAO_MAXIMA_S)
+        except Exception:
+            logger.error("Falha no backup agendado.", exc_info=True)
+            time.sleep(BACKUP_VERIFICACAO_MAXIMA_S)
+
+
+_agendador_thread = None
+
+
+def init_app(app):
+    """
+    Inicia o backup agendado deste processo se app.config["BACKUP_INTERVALO_MIN"]
+    (ou a variável de ambiente) for maior que zero.
+    """
+    global _agendador_thread
+    intervalo = float(app.config.get("BACKUP_INTERVALO_MIN", BACKUP_INTERVALO_MIN))
+    if intervalo <= 0 or banco_em_memoria(database_utils.DATABASE_NAME):
+        return
+    if _agendador_thread is not None and _agendador_thread.is_alive():
+        return
+    diretorio = app.config.get("BACKUP_DIR") or diretorio_padrao()
+    _agendador_thread = threading.Thread(
+        target=_agendador,
+        args=(intervalo * 60, diretorio),
+        name="agendador-backup",
+        daemon=True,
+    )
+    _agendador_thread.start()
+    app.logger.info("Backup agendado a cada %g min em %s.", intervalo, diretorio)
@@ -0,0 +1,347 @@
+"""
+Benchmark dos endpoints principais (flask benchmark).
+
+Roda o cliente de teste do Flask contra um banco gerado por gerador_dados
+(ou uma cópia de um banco existente), mede cada endpoint e registra p50, p95,
+p99 e consultas SQL por requisição. O resultado pode ser gravado como linha
+de base em JSON; as execuções seguintes são comparadas com ela e um
+endpoint cujo p95 piore além da tolerância, ou que passe a fazer mais
+consultas, é reportado como regressão.
+"""
+
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from flask import g, request_finished
+from werkzeug.security import generate_password_hash
+
+import database_utils
+from database_utils import configurar_pool, get_db, registrar_movimento
+from gerador_dados import gerar_dados
+from models import init_db_sqlite
+
+
+# Volume padrão do banco gerado: pequeno o bastante para alguns segundos de
+# geração, grande o bastante para que varreduras e ordenações apareçam.
+DADOS_PADRAO = {
+    "produtos": 5_000,
+    "fornecedores": 100,
+    "categorias": 20,
+    "usuarios": 10,
+    "movimentos": 300_000,
+    "vendas": 30_000,
+    "semente": 42,
+}
+TOLERANCIA_PADRAO = 0.25
+# Diferenças abaixo deste valor são ruído, qualquer que seja a porcentagem.
+DIFERENCA_MINIMA_MS = 2.0
+
+EMAIL_BENCHMARK = "benchmark@gep.local"
+SENHA_BENCHMARK = "benchmark"
+TERMOS_BUSCA = ("caderno", "caneta", "mochila", "univ", "premium", "faber", "esc", "lapis")
+
+
+def _percentil(valores, p):
+    """Percentil por interpolação linear (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    posicao = (len(valores) - 1) * p
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def _endpoints(contexto):
+    """
+    Endpoints medidos: nome -> função(rng) que devolve (método, url, kwargs).
+    `contexto` tem os ids usados nos parâmetros.
+    """
+    produtos_com_estoque = contexto["produtos_com_estoque"]
+    produto_popular = contexto["produto_popular"]
+
+    def nova_venda(rng):
+        itens = [
+            {"produto_id": pid, "quantidade": rng.randint(1, 3), "preco_unitario": preco}
+            for pid, preco in rng.sample(produtos_com_estoque, rng.randint(1, 4))
+        ]
+        return "post", "/estoque/vendas", {"json": {"itens": itens, "forma_pagamento": "pix"}}
+
+    def get(url):
+        return lambda rng: ("get", url, {})
+
+    return {
+        "produtos_busca": lambda rng: (
+            "get", f"/produtos/busca?termo={rng.choice(TERMOS_BUSCA)}", {}),
+        "estoque_movimentacoes": get("/estoque/movimentacoes"),
+        "estoque_movimentacoes_produto": get(
+            f"/estoque/movimentacoes?produto_id={produto_popular}"),
+        "estoque_vendas_post": nova_venda,
+        "dashboard_stats": get("/api/dashboard/stats"),
+        "dashboard_stats_sem_cache": lambda rng: (
+            "get", "/api/dashboard/stats", {"headers": {"X-Debug-Timing": "1"}}),
+        "produtos_mais_vendidos": get("/produtos/mais-vendidos"),
+        "produtos_menos_vendidos": get("/produtos/menos-vendidos"),
+        "relatorios_vendas_produtos": get("/relatorios/vendas/produtos"),
+        "relatorios_estoque_niveis": get("/relatorios/estoque/niveis"),
+        "relatorios_fornecedores_resumo": get("/relatorios/fornecedores/resumo"),
+        "relatorios_fornecedores_produtos": get("/relatorios/fornecedores/produtos"),
+        "relatorios_vendas_operadores": get("/relatorios/vendas/operadores"),
+        "relatorios_registros_gerais": get("/relatorios/registros/gerais"),
+    }
+
+
+def preparar_banco(diretorio, banco_origem, dados, progresso):
+    """
+    Cria (ou copia) em `diretorio` o banco das medições, com um usuário
+    admin (EMAIL_BENCHMARK) e estoque folgado nos 50 produtos mais vendidos.
+    Aponta o pool para o novo banco; quem chama restaura o anterior.
+
+    Returns:
+        dict: produtos_com_estoque [(id, preco)] e produto_popular (id).
+    """
+    destino = os.path.join(diretorio, "benchmark.db")
+    if banco_origem:
+        origem = sqlite3.connect(banco_origem)
+        copia = sqlite3.connect(destino)
+        try:
+            origem.backup(copia)
+        finally:
+            copia.close()
+            origem.close()
+        configurar_pool(database=destino)
+        init_db_sqlite()
+    else:
+        configurar_pool(database=destino)
+        gerar_dados(**dados, progresso=progresso)
+
+    conn = get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO usuario (nome, email, senha_hash, nivel_acesso, ativo)
+            VALUES ('Benchmark', ?, ?, 'admin', 1)
+            ON CONFLICT (email) DO UPDATE SET senha_hash = excluded.senha_hash,
+                nivel_acesso = 'admin', ativo = 1
+            """,
+            (EMAIL_BENCHMARK, generate_password_hash(SENHA_BENCHMARK)),
+        )
+        conn.commit()
+        cursor.execute(
+            """
+            SELECT p.id, p.preco FROM produto p
+            WHERE p.ativo = 1
+            ORDER BY (SELECT COUNT(*) FROM item_venda i WHERE i.produto_id = p.id) DESC, p.id
+            LIMIT 50
+            """
+        )
+        produtos = [(row["id"], row["preco"]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    if not produtos:
+        raise ValueError("O banco do benchmark não tem produtos ativos.")
+
+    # Estoque folgado para as vendas do benchmark, lançado como entrada
+    # normal para manter o histórico coerente.
+    for produto_id, _ in produtos:
+        registrar_movimento(
+            produto_id, "entrada", 100_000, observacao="Estoque para benchmark",
+            classificacao="reposicao",
+        )
+    return {"produtos_com_estoque": produtos, "produto_popular": produtos[0][0]}
+
+
+def _medir(app, endpoints, repeticoes, aquecimento, semente, progresso):
+    rng = random.Random(semente)
+    cliente = app.test_client()
+    # Cookies de sessão são "Secure" fora do modo de desenvolvimento.
+    base_url = "https://localhost"
+    resposta = cliente.post(
+        "/auth/login",
+        json={"email": EMAIL_BENCHMARK, "senha": SENHA_BENCHMARK},
+        base_url=base_url,
+    )
+    if resposta.status_code != 200:
+        raise RuntimeError(f"Login do benchmark falhou: {resposta.status_code}")
+
+    consultas = []
+
+    def ao_terminar(sender, response, **extra):
+        consultas.append(g.get("consultas_sql", 0))
+
+    resultados = {}
+    request_finished.connect(ao_terminar, app)
+    try:
+        for nome, montar in endpoints.items():
+            duracoes = []
+            consultas_endpoint = []
+            erros = 0
+            for i in range(aquecimento + repeticoes):
+                metodo, url, kwargs = montar(rng)
+                consultas.clear()
+                inicio = time.perf_counter()
+                resposta = getattr(cliente, metodo)(url, base_url=base_url, **kwargs)
+                resposta.get_data()
+                duracao = time.perf_counter() - inicio
+                if i < aquecimento:
+                    continue
+                duracoes.append(duracao * 1000)
+                consultas_endpoint.append(consultas[-1] if consultas else 0)
+                if resposta.status_code >= 400:
+                    erros += 1
+            duracoes.sort()
+            resultados[nome] = {
+                "requisicoes": repeticoes,
+                "erros": erros,
+                "p50_ms": round(_percentil(duracoes, 0.50), 3),
+                "p95_ms": round(_percentil(duracoes, 0.95), 3),
+                "p99_ms": round(_percentil(duracoes, 0.99), 3),
+                "media_ms": round(statistics.fmean(duracoes), 3),
+                "consultas_por_requisicao": round(statistics.median(consultas_endpoint), 1),
+            }
+            progresso(
+                f"{nome:34s} p50 {resultados[nome]['p50_ms']:9.2f} ms  "
+                f"p95 {resultados[nome]['p95_ms']:9.2f} ms  "
+                f"p99 {resultados[nome]['p99_ms']:9.2f} ms  "
+                f"consultas {resultados[nome]['consultas_por_requisicao']:g}"
+                + (f"  erros {erros}" if erros else "")
+            )
+    finally:
+        request_finished.disconnect(ao_terminar, app)
+    return resultados
+
+
+def executar_benchmark(
+    app,
+    repeticoes=50,
+    aquecimento=5,
+    endpoints=None,
+    banco=None,
+    dados=None,
+    semente=42,
+    progresso=None,
+):
+    """
+    Mede os endpoints em um banco temporário.
+
+    Deve ser executada fora de um contexto Flask (ver
+    comandos._executar_fora_de_contexto): cada requisição do cliente de
+    teste precisa do próprio contexto de aplicação.
+
+    Args:
+        app (Flask): Aplicação a medir.
+        repeticoes (int): Requisições medidas por endpoint.
+        aquecimento (int): Requisições descartadas antes da medição.
+        endpoints (list, opcional): Nomes dos endpoints; padrão todos.
+        banco (str, opcional): Banco a copiar em vez de gerar dados.
+        dados (dict, opcional): Parâmetros de gerar_dados (padrão DADOS_PADRAO).
+        semente (int): Semente dos parâmetros das requisições.
+        progresso (callable, opcional): Recebe mensagens de andamento.
+
+    Returns:
+        dict: {"ambiente": {...}, "dados": {...}, "endpoints": {nome: {...}}}
+
+    Raises:
+        ValueError: Endpoint desconhecido ou banco sem produtos.
+    """
+    avisar = progresso or (lambda mensagem: None)
+    dados = {**DADOS_PADRAO, **(dados or {})}
+    database_anterior = database_utils.DATABASE_NAME
+    diretorio = tempfile.mkdtemp(prefix="gep_benchmark_")
+    # Os registros INFO de cada venda não interessam aqui; consultas lentas
+    # (WARNING) continuam aparecendo.
+    nivel_log_anterior = database_utils.logger.level
+    database_utils.logger.setLevel("WARNING")
+    try:
+        inicio = time.perf_counter()
+        contexto = preparar_banco(diretorio, banco, dados, avisar)
+        avisar(f"Banco preparado em {time.perf_counter() - inicio:.1f} s")
+
+        todos = _endpoints(contexto)
+        nomes = endpoints or list(todos)
+        desconhecidos = [n for n in nomes if n not in todos]
+        if desconhecidos:
+            raise ValueError(f"Endpoints desconhecidos: {', '.join(desconhecidos)}")
+        resultados = _medir(
+            app, {n: todos[n] for n in nomes}, repeticoes, aquecimento, semente, avisar)
+    finally:
+        database_utils.logger.setLevel(nivel_log_anterior)
+        configurar_pool(database=database_anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    return {
+        "ambiente": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "repeticoes": repeticoes,
+        },
+        "dados": {"banco": banco} if banco else dados,
+        "endpoints": resultados,
+    }
+
+
+def comparar_com_linha_base(resultado, linha_base, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Compara um resultado com a linha de base.
+
+    Um endpoint regride quando o p50 passa de p50_base * (1 + tolerancia),
+    quando o p95 passa de p95_base * (1 + 2 * tolerancia) (a cauda oscila
+    mais entre execuções), em ambos os casos só se a diferença superar
+    DIFERENCA_MINIMA_MS, ou quando a mediana de consultas por requisição
+    aumenta.
+
+    Returns:
+        tuple: (regressoes, avisos), listas de mensagens.
+    """
+    regressoes = []
+    avisos = []
+    if resultado.get("dados") != linha_base.get("dados"):
+        avisos.append("Os dados da linha de base são diferentes dos desta execução.")
+    if resultado["ambiente"]["sqlite"] != linha_base.get("ambiente", {}).get("sqlite"):
+        avisos.append("A versão do SQLite da linha de base é diferente desta.")
+
+    base_endpoints = linha_base.get("endpoints", {})
+    for nome, atual in resultado["endpoints"].items():
+        base = base_endpoints.get(nome)
+        if base is None:
+            avisos.append(f"{nome}: sem linha de base.")
+            continue
+        for chave, tolerancia_chave in (("p50_ms", tolerancia), ("p95_ms", 2 * tolerancia)):
+            if (
+                atual[chave] > base[chave] * (1 + tolerancia_chave)
+                and atual[chave] - base[chave] > DIFERENCA_MINIMA_MS
+            ):
+                regressoes.append(
+                    f"{nome}: {chave[:3]} {atual[chave]:.2f} ms > {base[chave]:.2f} ms "
+                    f"(+{(atual[chave] / base[chave] - 1) * 100:.0f}%)"
+                )
+        if atual["consultas_por_requisicao"] > base["consultas_por_requisicao"]:
+            regressoes.append(
+                f"{nome}: {atual['consultas_por_requisicao']:g} consultas por requisição "
+                f"(antes {base['consultas_por_requisicao']:g})"
+            )
+        if atual["erros"] > base.get("erros", 0):
+            regressoes.append(f"{nome}: {atual['erros']} respostas de erro")
+    return regressoes, avisos
+
+
+def carregar_linha_base(caminho):
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def gravar_linha_base(caminho, resultado):
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2, sort_keys=True)
+        arquivo.write("\n")
@@ -0,0 +1,358 @@
+"""
+Cache stale-while-revalidate das estatísticas do dashboard.
+
+O instantâneo fica em um pequeno banco SQLite próprio (ao lado do banco
+principal), de modo que todos os processos de trabalho o compartilham. Cada
+instantâneo guarda a versão de `versao_dados` (contador de escritas mantido
+por gatilhos) do momento em que foi calculado:
+
+- mesma versão e idade abaixo de DASHBOARD_CACHE_IDADE_MAXIMA: HIT;
+- caso contrário o instantâneo é servido assim mesmo (STALE) e, passada a
+  idade mínima DASHBOARD_CACHE_IDADE, um único processo obtém a concessão de
+  renovação e recalcula em segundo plano;
+- sem instantâneo: cálculo síncrono (MISS).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import database_utils
+from database_utils import (
+    banco_em_memoria,
+    caminho_arquivo_banco,
+    get_db,
+    obter_estatisticas,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+CHAVE_ESTATISTICAS = "dashboard_stats"
+
+# Idade a partir da qual um instantâneo desatualizado dispara renovação.
+DASHBOARD_CACHE_IDADE = float(os.environ.get("DASHBOARD_CACHE_IDADE", 5))
+# Idade máxima de um instantâneo mesmo sem escritas (a janela de 30 dias
+# das vendas avança sozinha).
+DASHBOARD_CACHE_IDADE_MAXIMA = float(
+    os.environ.get("DASHBOARD_CACHE_IDADE_MAXIMA", 300))
+# Duração da concessão de renovação; se o processo que a obteve morrer, outro
+# assume depois deste prazo.
+DASHBOARD_CACHE_CONCESSAO = 30.0
+# Intervalo mínimo entre gravações dos contadores de um processo.
+INTERVALO_GRAVACAO_CONTADORES = 1.0
+# Contadores de processos sem gravação há mais que isso (processos que já
+# terminaram) saem das estatísticas.
+DASHBOARD_CACHE_CONTADORES_TTL = float(
+    os.environ.get("DASHBOARD_CACHE_CONTADORES_TTL", 3600))
+
+NOMES_CONTADORES = ("hits", "hits_stale", "misses", "renovacoes", "erros_renovacao")
+
+SQL_CREATE_CACHE = """
+CREATE TABLE IF NOT EXISTS cache_snapshot (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL,
+    versao INTEGER NOT NULL,
+    gerado_em REAL NOT NULL,
+    renovando_ate REAL
+);
+
+CREATE TABLE IF NOT EXISTS cache_contadores (
+    processo TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    valor INTEGER NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (processo, nome)
+) WITHOUT ROWID;
+"""
+
+_lock = threading.Lock()
+_conexao = None
+_contadores = dict.fromkeys(NOMES_CONTADORES, 0)
+_contadores_gravados_em = 0.0
+_iniciado_em = int(time.time())
+# Conexões herdadas de um processo pai: nunca usadas nem fechadas aqui.
+_conexoes_herdadas = []
+
+
+def _reiniciar_apos_fork():
+    # Um worker criado por fork (gunicorn --preload) herda os contadores, a
+    # conexão e a trava do pai; recomeça com os seus.
+    global _lock, _conexao, _contadores, _contadores_gravados_em, _iniciado_em
+    _lock = threading.Lock()
+    if _conexao is not None:
+        _conexoes_herdadas.append(_conexao[1])
+    _conexao = None
+    _contadores = dict.fromkeys(NOMES_CONTADORES, 0)
+    _contadores_gravados_em = 0.0
+    _iniciado_em = int(time.time())
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+
+def _chave_processo():
+    # O pid sozinho pode ser reutilizado por um processo novo.
+    return f"{os.getpid()}-{_iniciado_em}"
+
+
+def caminho_cache(database=None):
+    """
+    Caminho do banco de cache: DASHBOARD_CACHE_PATH ou, por padrão,
+    `<banco>-cache.db` ao lado do banco principal. Para bancos em memória,
+    um banco em memória compartilhado dentro do processo, próprio do pool
+    atual (um banco em memória novo não herda o cache do anterior).
+    """
+    database = database or database_utils.DATABASE_NAME
+    caminho = os.environ.get("DASHBOARD_CACHE_PATH")
+    if caminho:
+        return caminho
+    if banco_em_memoria(database):
+        return (
+            f"file:dashboard_cache_{database_utils.get_pool().identificador}"
+            "?mode=memory&cache=shared"
+        )
+    raiz, _ = os.path.splitext(caminho_arquivo_banco(database))
+    return f"{raiz}-cache.db"
+
+
+def _conexao_cache():
+    """
+    Conexão com o banco de cache (protegida por _lock). Se o banco principal
+    mudou (configurar_pool), a conexão do cache anterior é fechada.
+    """
+    global _conexao
+    caminho = caminho_cache()
+    if _conexao is not None and _conexao[0] != caminho:
+        _conexao[1].close()
+        _conexao = None
+    if _conexao is None:
+        conn = sqlite3.connect(
+            caminho,
+            uri=caminho.startswith("file:"),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=5.0,
+        )
+        if not banco_em_memoria(caminho):
+            conn.execute("PRAGMA journal_mode = WAL;")
+        # O cache é descartável: perdê-lo numa queda só custa um recálculo.
+        conn.execute("PRAGMA synchronous = OFF;")
+        conn.executescript(SQL_CREATE_CACHE)
+        _conexao = (caminho, conn)
+    return _conexao[1]
+
+
+def _versao_dados():
+    """Versão atual do contador de escritas do banco principal."""
+    conn = get_db()
+    try:
+        linha = conn.execute(
+            "SELECT versao FROM versao_dados WHERE id = 1").fetchone()
+        return linha[0] if linha else 0
+    finally:
+        conn.close()
+
+
+def _contar(nome):
+    global _contadores_gravados_em
+    with _lock:
+        _contadores[nome] += 1
+        agora = time.time()
+        if agora - _contadores_gravados_em < INTERVALO_GRAVACAO_CONTADORES:
+            return
+        _contadores_gravados_em = agora
+        try:
+            _gravar_contadores(_conexao_cache(), agora)
+        except sqlite3.Error as e:
+            logger.warning("Falha ao gravar contadores do cache: %s", e)
+
+
+def _gravar_contadores(conn, agora):
+    conn.executemany(
+        """
+        INSERT INTO cache_contadores (processo, nome, valor, atualizado_em)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (processo, nome) DO UPDATE SET
+            valor = excluded.valor, atualizado_em = excluded.atualizado_em
+        """,
+        [
+            (_chave_processo(), nome, valor, agora)
+            for nome, valor in _contadores.items()
+        ],
+    )
+
+
+def _gravar_instantaneo(conn, estatisticas, versao):
+    conn.execute(
+        """
+        INSERT INTO cache_snapshot (chave, valor, versao, gerado_em, renovando_ate)
+        VALUES (?, ?, ?, ?, NULL)
+        ON CONFLICT (chave) DO UPDATE SET
+            valor = excluded.valor,
+            versao = excluded.versao,
+            gerado_em = excluded.gerado_em,
+            renovando_ate = NULL
+        WHERE excluded.versao >= cache_snapshot.versao
+        """,
+        (CHAVE_ESTATISTICAS, json.dumps(estatisticas), versao, time.time()),
+    )
+
+
+def _calcular_e_gravar():
+    """
+    Recalcula as estatísticas e grava o instantâneo. A versão é lida antes do
+    cálculo: uma escrita concorrente deixa o instantâneo com versão antiga e
+    provoca nova renovação, nunca um instantâneo "novo" com dados velhos.
+    Resultados com erro não são gravados.
+    """
+    versao = _versao_dados()
+    estatisticas = obter_estatisticas()
+    if "error" in estatisticas:
+        with _lock:
+            _conexao_cache().execute(
+                "UPDATE cache_snapshot SET renovando_ate = NULL WHERE chave = ?",
+                (CHAVE_ESTATISTICAS,),
+            )
+        return estatisticas, False
+    with _lock:
+        _gravar_instantaneo(_conexao_cache(), estatisticas, versao)
+    return estatisticas, True
+
+
+def _renovar_em_segundo_plano():
+    try:
+        _, gravado = _calcular_e_gravar()
+        _contar("renovacoes" if gravado else "erros_renovacao")
+    except Exception:
+        logger.error("Erro ao renovar o cache do dashboard.", exc_info=True)
+        _contar("erros_renovacao")
+
+
+def _obter_concessao(conn, agora):
+    """Marca o instantâneo como em renovação; só um processo consegue."""
+    cursor = conn.execute(
+        """
+        UPDATE cache_snapshot SET renovando_ate = ?
+        WHERE chave = ? AND (renovando_ate IS NULL OR renovando_ate < ?)
+        """,
+        (agora + DASHBOARD_CACHE_CONCESSAO, CHAVE_ESTATISTICAS, agora),
+    )
+    return cursor.rowcount == 1
+
+
+def obter_estatisticas_em_cache():
+    """
+    Retorna as estatísticas do dashboard a partir do cache compartilhado.
+
+    Returns:
+        tuple: (estatisticas, situacao), com situacao "HIT", "STALE", "MISS"
+            ou "BYPASS" (banco de cache indisponível).
+    """
+    try:
+        return _obter_do_cache()
+    except sqlite3.Error as e:
+        logger.error("Cache do dashboard indisponível: %s", e)
+        return obter_estatisticas(), "BYPASS"
+
+
+def _obter_do_cache():
+    versao_atual = _versao_dados()
+    agora = time.time()
+    with _lock:
+        conn = _conexao_cache()
+        linha = conn.execute(
+            "SELECT valor, versao, gerado_em FROM cache_snapshot WHERE chave = ?",
+            (CHAVE_ESTATISTICAS,),
+        ).fetchone()
+        renovar = False
+        if linha is not None:
+            valor, versao, gerado_em = linha
+            idade = agora - gerado_em
+            atual = versao == versao_atual and idade < DASHBOARD_CACHE_IDADE_MAXIMA
+            if not atual and idade >= DASHBOARD_CACHE_IDADE:
+                renovar = _obter_concessao(conn, agora)
+
+    if linha is None:
+        estatisticas, _ = _calcular_e_gravar()
+        _contar("misses")
+        return estatisticas, "MISS"
+
+    if atual:
+        _contar("hits")
+        return json.loads(valor), "HIT"
+
+    if renovar:
+        threading.Thread(
+            target=_renovar_em_segundo_plano,
+            name="renovacao-cache-dashboard",
+            daemon=True,
+        ).start()
+    _contar("hits_stale")
+    return json.loads(valor), "STALE"
+
+
+def estatisticas_cache():
+    """
+    Contadores do cache somados entre todos os processos, mais a situação do
+    instantâneo atual.
+    """
+    versao_atual = _versao_dados()
+    with _lock:
+        conn = _conexao_cache()
+        agora = time.time()
+        _gravar_contadores(conn, agora)
+        conn.execute(
+            "DELETE FROM cache_contadores WHERE atualizado_em < ?",
+            (agora - DASHBOARD_CACHE_CONTADORES_TTL,),
+        )
+        totais = dict.fromkeys(NOMES_CONTADORES, 0)
+        for nome, valor in conn.execute(
+            "SELECT nome, SUM(valor) FROM cache_contadores GROUP BY nome"
+        ):
+            totais[nome] = valor
+        processos = conn.execute(
+            "SELECT COUNT(DISTINCT processo) FROM cache_contadores"
+        ).fetchone()[0]
+        linha = conn.execute(
+            "SELECT versao, gerado_em, renovando_ate FROM cache_snapshot WHERE chave = ?",
+            (CHAVE_ESTATISTICAS,),
+        ).fetchone()
+
+    consultas = totais["hits"] + totais["hits_stale"] + totais["misses"]
+    agora = time.time()
+    return {
+        "caminho": caminho_cache(),
+        "idade_renovacao_s": DASHBOARD_CACHE_IDADE,
+        "idade_maxima_s": DASHBOARD_CACHE_IDADE_MAXIMA,
+        "processos": processos,
+        "contadores": totais,
+        "taxa_acerto": (
+            round((totais["hits"] + totais["hits_stale"]) / consultas, 4)
+            if consultas
+            else 0.0
+        ),
+        "versao_dados": versao_atual,
+        "instantaneo": (
+            {
+                "versao": linha[0],
+                "idade_s": round(agora - linha[1], 3),
+                "atualizado": linha[0] == versao_atual,
+                "em_renovacao": bool(linha[2] and linha[2] > agora),
+            }
+            if linha
+            else None
+        ),
+    }
+
+
+def invalidar_cache():
+    """Remove o instantâneo; a próxima leitura recalcula."""
+    with _lock:
+        _conexao_cache().execute(
+            "DELETE FROM cache_snapshot WHERE chave = ?", (CHAVE_ESTATISTICAS,))
@@ -0,0 +1,562 @@
+"""
+Comandos de linha de comando da aplicação (flask <comando>).
+"""
+
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import click
+from flask import current_app
+
+import database_utils
+from backup import BackupEmAndamento, criar_backup, listar_backups
+from benchmark import (
+    TOLERANCIA_PADRAO,
+    carregar_linha_base,
+    comparar_com_linha_base,
+    executar_benchmark,
+    gravar_linha_base,
+)
+from database_utils import (
+    configurar_pool,
+    get_db,
+    reconstruir_agregados,
+    registrar_movimento,
+    verificar_contadores_dashboard,
+)
+from gerador_dados import gerar_dados
+from models import init_db_sqlite
+from planos_consulta import verificar_planos
+from teste_carga import executar_teste_carga, interpretar_mistura
+
+
+def _executar_fora_de_contexto(funcao, *args, **kwargs):
+    """
+    Executa `funcao` em uma thread sem contexto Flask, de modo que get_db()
+    empreste conexões diretamente do pool em vez de vinculá-las a `g`.
+    """
+    saida = {}
+
+    def alvo():
+        try:
+            saida["resultado"] = funcao(*args, **kwargs)
+        except BaseException as e:
+            saida["erro"] = e
+
+    thread = threading.Thread(target=alvo)
+    thread.start()
+    thread.join()
+    if "erro" in saida:
+        raise saida["erro"]
+    return saida["resultado"]
+
+
+def executar_estresse_movimentos(threads=8, movimentos_por_thread=200, estoque_inicial=500, semente=None):
+    """
+    Dispara movimentos concorrentes de entrada e saída sobre um único
+    produto, em um banco temporário, e confere se nenhuma atualização de
+    estoque foi perdida.
+
+    Returns:
+        dict: Resultado com contagens, vazão e inconsistências encontradas.
+    """
+    return _executar_fora_de_contexto(
+        _estresse_movimentos, threads, movimentos_por_thread, estoque_inicial, semente
+    )
+
+
+def _estresse_movimentos(threads, movimentos_por_thread, estoque_inicial, semente):
+    database_anterior = database_utils.DATABASE_NAME
+    diretorio = tempfile.mkdtemp(prefix="gep_estresse_")
+    caminho = os.path.join(diretorio, "estresse.db")
+    rng = random.Random(semente)
+
+    nivel_log_anterior = database_utils.logger.level
+    database_utils.logger.setLevel("CRITICAL")
+    try:
+        configurar_pool(database=caminho, tamanho_maximo=threads + 1)
+        init_db_sqlite()
+
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO categoria (nome) VALUES (?)", ("Estresse",))
+        cursor.execute(
+            "INSERT INTO produto (codigo, nome, categoria_id, preco, estoque) VALUES (?, ?, ?, ?, ?)",
+            ("EST001", "Produto de estresse", cursor.lastrowid, 1.0, estoque_inicial),
+        )
+        produto_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+
+        planos = [
+            [
+                (rng.choice(["entrada", "saida"]), rng.randint(1, 5))
+                for _ in range(movimentos_por_thread)
+            ]
+            for _ in range(threads)
+        ]
+        lock = threading.Lock()
+        resultado = {
+            "sucessos": 0,
+            "estoque_insuficiente": 0,
+            "erros_banco": 0,
+            "delta_esperado": 0,
+        }
+        barreira = threading.Barrier(threads)
+
+        def trabalhador(plano):
+            sucessos = insuficientes = erros = delta = 0
+            barreira.wait()
+            for tipo, quantidade in plano:
+                try:
+                    registrar_movimento(
+                        produto_id=produto_id,
+                        tipo=tipo,
+                        quantidade=quantidade,
+                        observacao="Teste de estresse",
+                    )
+                    sucessos += 1
+                    delta += quantidade if tipo == "entrada" else -quantidade
+                except ValueError:
+                    insuficientes += 1
+                except sqlite3.Error:
+                    erros += 1
+            with lock:
+                resultado["sucessos"] += sucessos
+                resultado["estoque_insuficiente"] += insuficientes
+                resultado["erros_banco"] += erros
+                resultado["delta_esperado"] += delta
+
+        workers = [
+            threading.Thread(target=trabalhador, args=(plano,)) for plano in planos
+        ]
+        inicio = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        duracao = time.perf_counter() - inicio
+
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT estoque FROM produto WHERE id = ?", (produto_id,))
+        estoque_final = cursor.fetchone()["estoque"]
+        cursor.execute(
+            "SELECT COUNT(*), COALESCE(SUM(quantidade), 0) FROM estoque_movimentacao WHERE produto_id = ?",
+            (produto_id,),
+        )
+        total_movimentos, soma_movimentos = cursor.fetchone()
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM estoque_movimentacao
+            WHERE produto_id = ? AND estoque_atual - estoque_anterior != quantidade
+            """,
+            (produto_id,),
+        )
+        movimentos_incoerentes = cursor.fetchone()[0]
+        conn.close()
+
+        esperado = estoque_inicial + resultado["delta_esperado"]
+        resultado.update(
+            {
+                "threads": threads,
+                "movimentos_solicitados": threads * movimentos_por_thread,
+                "duracao_s": round(duracao, 3),
+                "movimentos_por_segundo": (
+                    round(resultado["sucessos"] / duracao, 1) if duracao else 0.0
+                ),
+                "estoque_inicial": estoque_inicial,
+                "estoque_final": estoque_final,
+                "estoque_esperado": esperado,
+                "atualizacoes_perdidas": esperado != estoque_final,
+                "movimentos_gravados": total_movimentos,
+                "soma_movimentos": soma_movimentos,
+                "movimentos_incoerentes": movimentos_incoerentes,
+            }
+        )
+        resultado["consistente"] = (
+            not resultado["atualizacoes_perdidas"]
+            and total_movimentos == resultado["sucessos"]
+            and soma_movimentos == resultado["delta_esperado"]
+            and movimentos_incoerentes == 0
+        )
+        return resultado
+    finally:
+        database_utils.logger.setLevel(nivel_log_anterior)
+        configurar_pool(database=database_anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def _verificar_planos_em_banco_novo():
+    database_anterior = database_utils.DATABASE_NAME
+    diretorio = tempfile.mkdtemp(prefix="gep_planos_")
+    try:
+        configurar_pool(database=os.path.join(diretorio, "planos.db"))
+        init_db_sqlite()
+        conn = get_db()
+        try:
+            return verificar_planos(conn)
+        finally:
+            conn.close()
+    finally:
+        configurar_pool(database=database_anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def registrar_comandos(app):
+    """Registra os comandos de linha de comando na aplicação."""
+
+    @app.cli.command("migrar")
+    @click.option(
+        "--medir",
+        default=0,
+        show_default=True,
+        help="Repete a verificação N vezes e mostra o tempo médio do caminho rápido.",
+    )
+    def migrar(medir):
+        """Aplica as migrações pendentes do esquema do banco."""
+        resultado = init_db_sqlite()
+        click.echo(
+            f"Versão do esquema: {resultado['versao_anterior']} -> {resultado['versao_atual']} "
+            f"(migrações aplicadas: {resultado['migracoes_aplicadas'] or 'nenhuma'}) "
+            f"em {resultado['duracao_ms']:.3f} ms"
+        )
+        if medir > 0:
+            duracoes = [init_db_sqlite()["duracao_ms"] for _ in range(medir)]
+            click.echo(
+                f"Caminho rápido: média {sum(duracoes) / len(duracoes):.3f} ms, "
+                f"máximo {max(duracoes):.3f} ms em {medir} execuções"
+            )
+
+    @app.cli.command("reconstruir-agregados")
+    @click.option(
+        "--tabela",
+        "tabelas",
+        multiple=True,
+        type=click.Choice(sorted(database_utils.AGREGADOS_MOVIMENTOS)),
+        help="Recalcula apenas esta tabela (pode repetir). Padrão: todas.",
+    )
+    def reconstruir_agregados_comando(tabelas):
+        """Recalcula as tabelas derivadas das movimentações de estoque."""
+        resultado = reconstruir_agregados(tabelas or None)
+        for tabela, linhas in resultado["linhas"].items():
+            click.echo(f"{tabela}: {linhas} linhas")
+        click.echo(f"Concluído em {resultado['duracao_ms']} ms.")
+
+    @app.cli.command("verificar-contadores")
+    @click.option(
+        "--corrigir",
+        is_flag=True,
+        help="Grava os valores recalculados quando houver divergência.",
+    )
+    def verificar_contadores_comando(corrigir):
+        """Compara os contadores do dashboard com um recálculo completo."""
+        resultado = verificar_contadores_dashboard(corrigir=corrigir)
+        for d in resultado["divergencias"]:
+            click.echo(
+                f"{d['tabela']}.{d['chave']}: armazenado={d['armazenado']} "
+                f"recalculado={d['recalculado']}"
+            )
+        if not resultado["divergencias"]:
+            click.echo("Contadores do dashboard consistentes.")
+        elif resultado["corrigido"]:
+            click.echo(f"{len(resultado['divergencias'])} divergência(s) corrigida(s).")
+        else:
+            raise click.ClickException(
+                f"{len(resultado['divergencias'])} divergência(s) encontrada(s); "
+                "use --corrigir para regravar os contadores."
+            )
+
+    @app.cli.command("verificar-planos")
+    @click.option(
+        "--banco-atual",
+        is_flag=True,
+        help="Analisa o banco configurado em vez de um banco novo migrado.",
+    )
+    @click.option("--detalhes", is_flag=True, help="Mostra o plano completo de cada consulta.")
+    def verificar_planos_comando(banco_atual, detalhes):
+        """Falha se alguma consulta crítica fizer varredura completa de tabela."""
+        if banco_atual:
+            conn = get_db()
+            resultados = verificar_planos(conn)
+        else:
+            resultados = _executar_fora_de_contexto(
+                _verificar_planos_em_banco_novo)
+
+        falhas = [r for r in resultados if r["varreduras"]]
+        for r in resultados:
+            situacao = "FALHA" if r["varreduras"] else "ok"
+            click.echo(f"[{situacao}] {r['nome']} ({r['origem']})")
+            if detalhes or r["varreduras"]:
+                for linha in r["plano"]:
+                    click.echo(f"        {linha}")
+        if falhas:
+            raise click.ClickException(
+                f"{len(falhas)} consulta(s) com varredura completa de tabela: "
+                + ", ".join(r["nome"] for r in falhas)
+            )
+        click.echo(f"{len(resultados)} consultas verificadas, nenhuma varredura completa.")
+
+    @app.cli.command("estresse-movimentos")
+    @click.option("--threads", default=8, show_default=True, help="Threads concorrentes.")
+    @click.option("--movimentos", default=200, show_default=True, help="Movimentos por thread.")
+    @click.option("--estoque-inicial", default=500, show_default=True)
+    @click.option("--semente", default=None, type=int, help="Semente do gerador aleatório.")
+    def estresse_movimentos(threads, movimentos, estoque_inicial, semente):
+        """Teste de estresse multithread de registrar_movimento."""
+        resultado = executar_estresse_movimentos(
+            threads=threads,
+            movimentos_por_thread=movimentos,
+            estoque_inicial=estoque_inicial,
+            semente=semente,
+        )
+        for chave, valor in resultado.items():
+            click.echo(f"{chave}: {valor}")
+        if not resultado["consistente"]:
+            raise click.ClickException(
+                "Inconsistência detectada: atualizações de estoque perdidas."
+            )
+
+    @app.cli.command("gerar-dados")
+    @click.option("--produtos", default=10_000, show_default=True)
+    @click.option("--fornecedores", default=200, show_default=True)
+    @click.option("--categorias", default=30, show_default=True)
+    @click.option("--usuarios", default=20, show_default=True)
+    @click.option(
+        "--movimentos",
+        default=1_000_000,
+        show_default=True,
+        help="Tamanho aproximado do histórico de estoque (inclui os itens das vendas).",
+    )
+    @click.option("--vendas", default=100_000, show_default=True)
+    @click.option("--itens-por-venda", default=2.5, show_default=True, help="Média de itens por venda.")
+    @click.option("--dias", default=365, show_default=True, help="Período coberto pelo histórico.")
+    @click.option(
+        "--alfa",
+        default=1.16,
+        show_default=True,
+        help="Parâmetro da Pareto da popularidade dos produtos (1.16 ~ 80/20).",
+    )
+    @click.option("--semente", default=None, type=int, help="Semente do gerador aleatório.")
+    @click.option("--lote", default=100_000, show_default=True, help="Linhas por transação.")
+    @click.option("--anexar", is_flag=True, help="Permite gerar em um banco que já tem produtos.")
+    def gerar_dados_comando(
+        produtos, fornecedores, categorias, usuarios, movimentos, vendas,
+        itens_por_venda, dias, alfa, semente, lote, anexar,
+    ):
+        """Gera dados sintéticos em volume para testes de desempenho."""
+        if produtos < 1 or categorias < 1:
+            raise click.BadParameter("--produtos e --categorias devem ser ao menos 1.")
+        init_db_sqlite()
+        conn = get_db()
+        existentes = conn.execute("SELECT COUNT(*) FROM produto").fetchone()[0]
+        conn.close()
+        if existentes and not anexar:
+            raise click.ClickException(
+                f"O banco já tem {existentes} produtos; use --anexar para gerar mesmo assim."
+            )
+        try:
+            resultado = gerar_dados(
+                produtos=produtos,
+                fornecedores=fornecedores,
+                categorias=categorias,
+                usuarios=usuarios,
+                movimentos=movimentos,
+                vendas=vendas,
+                itens_por_venda=itens_por_venda,
+                dias=dias,
+                alfa=alfa,
+                semente=semente,
+                tamanho_lote=lote,
+                progresso=click.echo,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        tempos = resultado.pop("tempos")
+        for chave, valor in resultado.items():
+            click.echo(f"{chave}: {valor}")
+        for chave, valor in tempos.items():
+            click.echo(f"{chave}: {valor}")
+
+    @app.cli.command("benchmark")
+    @click.option("--repeticoes", default=50, show_default=True, help="Requisições medidas por endpoint.")
+    @click.option("--aquecimento", default=5, show_default=True, help="Requisições descartadas antes da medição.")
+    @click.option(
+        "--endpoint", "endpoints", multiple=True,
+        help="Mede só este endpoint (pode repetir). Padrão: todos.",
+    )
+    @click.option(
+        "--banco", type=click.Path(exists=True, dir_okay=False), default=None,
+        help="Usa uma cópia deste banco em vez de gerar dados.",
+    )
+    @click.option("--produtos", default=None, type=int, help="Produtos do banco gerado.")
+    @click.option("--movimentos", default=None, type=int, help="Movimentos do banco gerado.")
+    @click.option("--vendas", default=None, type=int, help="Vendas do banco gerado.")
+    @click.option(
+        "--linha-base", default="benchmark_linha_base.json", show_default=True,
+        type=click.Path(dir_okay=False), help="Arquivo JSON da linha de base.",
+    )
+    @click.option("--salvar", is_flag=True, help="Grava o resultado como nova linha de base.")
+    @click.option(
+        "--tolerancia", default=TOLERANCIA_PADRAO, show_default=True,
+        help="Piora aceita no p50 (o dobro no p95) antes de acusar regressão.",
+    )
+    def benchmark_comando(
+        repeticoes, aquecimento, endpoints, banco, produtos, movimentos, vendas,
+        linha_base, salvar, tolerancia,
+    ):
+        """Mede os endpoints principais e compara com a linha de base."""
+        dados = {
+            chave: valor
+            for chave, valor in (
+                ("produtos", produtos), ("movimentos", movimentos), ("vendas", vendas))
+            if valor is not None
+        }
+        try:
+            resultado = _executar_fora_de_contexto(
+                executar_benchmark,
+                current_app._get_current_object(),
+                repeticoes=repeticoes,
+                aquecimento=aquecimento,
+                endpoints=list(endpoints) or None,
+                banco=banco,
+                dados=dados,
+                progresso=click.echo,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        if salvar:
+            gravar_linha_base(linha_base, resultado)
+            click.echo(f"Linha de base gravada em {linha_base}.")
+            return
+        if not os.path.exists(linha_base):
+            click.echo(f"Sem linha de base ({linha_base}); use --salvar para criá-la.")
+            return
+
+        regressoes, avisos = comparar_com_linha_base(
+            resultado, carregar_linha_base(linha_base), tolerancia=tolerancia)
+        for aviso in avisos:
+            click.echo(f"Aviso: {aviso}")
+        if regressoes:
+            for regressao in regressoes:
+                click.echo(f"[REGRESSÃO] {regressao}")
+            raise click.ClickException(
+                f"{len(regressoes)} regressão(ões) em relação a {linha_base}.")
+        click.echo(f"Nenhuma regressão em relação a {linha_base} (tolerância {tolerancia:.0%}).")
+
+    @app.cli.command("teste-carga")
+    @click.option("--clientes", default=8, show_default=True, help="Clientes concorrentes.")
+    @click.option("--processos", is_flag=True, help="Clientes em processos em vez de threads.")
+    @click.option(
+        "--servidores", default=1, show_default=True,
+        help="Processos servidores (werkzeug) no mesmo arquivo SQLite.",
+    )
+    @click.option(
+        "--sem-threads-servidor", is_flag=True,
+        help="Cada servidor atende uma requisição por vez.",
+    )
+    @click.option(
+        "--escritor-unico", is_flag=True,
+        help="Grava movimentos e vendas pelo escritor único (group commit).",
+    )
+    @click.option("--duracao", default=10.0, show_default=True, help="Segundos de tráfego.")
+    @click.option(
+        "--mistura", default="venda=40,saida=25,entrada=5,leitura=30", show_default=True,
+        help="Pesos das operações.",
+    )
+    @click.option(
+        "--banco", type=click.Path(exists=True, dir_okay=False), default=None,
+        help="Usa uma cópia deste banco em vez de gerar dados.",
+    )
+    @click.option("--semente", default=42, show_default=True)
+    @click.option("--json", "saida_json", is_flag=True, help="Imprime o resultado em JSON.")
+    def teste_carga_comando(
+        clientes, processos, servidores, sem_threads_servidor, escritor_unico, duracao,
+        mistura, banco, semente, saida_json,
+    ):
+        """Carga concorrente de vendas/movimentos contra servidores WSGI reais."""
+        try:
+            resultado = executar_teste_carga(
+                clientes=clientes,
+                processos=processos,
+                servidores=servidores,
+                threads_servidor=not sem_threads_servidor,
+                escritor_unico=escritor_unico,
+                duracao=duracao,
+                mistura=interpretar_mistura(mistura),
+                banco=banco,
+                semente=semente,
+                progresso=click.echo,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        if saida_json:
+            click.echo(json.dumps(resultado, ensure_ascii=False, indent=2))
+        else:
+            for chave in (
+                "clientes", "modo_clientes", "servidores", "duracao_s", "requisicoes",
+                "requisicoes_por_segundo", "sucessos_por_segundo", "erros_busy_locked",
+                "transacoes_repetidas", "transacoes_desistidas",
+            ):
+                click.echo(f"{chave}: {resultado[chave]}")
+            click.echo(f"erros_sql: {resultado['erros_sql']}")
+            if escritor_unico:
+                click.echo(f"escritor: {resultado['escritor']}")
+            for operacao, dados in resultado["operacoes"].items():
+                click.echo(
+                    f"  {operacao:8s} {dados['requisicoes']:7d} req "
+                    f"({dados['por_segundo']:.1f}/s)  p50 {dados['p50_ms']:.1f} ms  "
+                    f"p95 {dados['p95_ms']:.1f} ms  p99 {dados['p99_ms']:.1f} ms  "
+                    f"{dados['categorias']}"
+                )
+            for chave, valor in resultado["consistencia"].items():
+                click.echo(f"{chave}: {valor}")
+        if resultado["consistencia"]["violacoes"]:
+            raise click.ClickException("Violações de consistência do estoque detectadas.")
+
+    @app.cli.command("backup")
+    @click.option("--destino", default=None, help="Diretório dos backups (padrão: BACKUP_DIR ou ./backups ao lado do banco).")
+    @click.option("--retencao", type=int, default=None, help="Backups mantidos (0 mantém todos; padrão BACKUP_RETENCAO).")
+    @click.option("--sem-compressao", is_flag=True, help="Grava o .db sem gzip.")
+    @click.option("--sem-verificacao", is_flag=True, help="Não roda PRAGMA integrity_check na cópia.")
+    @click.option("--paginas-por-passo", type=int, default=None, help="Páginas copiadas por passo.")
+    @click.option("--pausa-ms", type=float, default=None, help="Pausa entre os passos.")
+    @click.option("--listar", is_flag=True, help="Só lista os backups existentes.")
+    def backup_comando(
+        destino, retencao, sem_compressao, sem_verificacao, paginas_por_passo, pausa_ms, listar
+    ):
+        """Backup online do banco (API de backup do SQLite), sem parar a aplicação."""
+        if not listar:
+            try:
+                resultado = criar_backup(
+                    diretorio=destino,
+                    retencao=retencao,
+                    comprimir=False if sem_compressao else None,
+                    verificar=not sem_verificacao,
+                    paginas_por_passo=paginas_por_passo,
+                    pausa_ms=pausa_ms,
+                )
+            except (ValueError, BackupEmAndamento, sqlite3.Error) as e:
+                raise click.ClickException(str(e))
+            tempos = ", ".join(f"{k} {v:.3f}" for k, v in resultado["tempos"].items())
+            click.echo(
+                f"Backup {resultado['caminho']}: {resultado['paginas']} páginas em "
+                f"{resultado['passos']} passos, {resultado['bytes_banco']} -> "
+                f"{resultado['bytes']} bytes, integridade: {resultado['integridade'] or 'não verificada'} "
+                f"({tempos})"
+            )
+            for arquivo in resultado["removidos"]:
+                click.echo(f"Removido pela retenção: {arquivo}")
+            return
+        for backup in listar_backups(destino):
+            click.echo(f"{backup['criado_em']}  {backup['bytes']:>12d}  {backup['arquivo']}")
@@ -5,31 +5,981 @@ Versão compatível com Python 3.13
 
 import logging
 import datetime
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, request
 from werkzeug.security import generate_password_hash
 import sqlite3
+import base64
+import binascii
+import itertools
+import json
 import os
+import random
+import re
+import urllib.parse
+
+import eventos
+import metricas
+from planos_consulta import obter_plano, varreduras_completas
+from registro_logs import LOGGER_CONSULTAS_LENTAS, caminho_log_consultas_lentas
 
 
 logger = logging.getLogger(__name__)
+logger_consultas_lentas = logging.getLogger(LOGGER_CONSULTAS_LENTAS)
+
+
+# Caminho do arquivo ou URI SQLite ("file:..."); create_app(config) e
+# configurar_pool() substituem.
+DATABASE_NAME = os.getenv("DATABASE", "estoque.db")
+
+SQL_INSERT_MOVIMENTO = """
+    INSERT INTO estoque_movimentacao
+    (produto_id, usuario_id, tipo, quantidade, estoque_anterior, estoque_atual, observacao, venda_id, data_movimento, classificacao)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+"""
+
+# Resumo diário de vendas (vendas_diarias_produto): uma linha por dia,
+# produto e operador (usuario_id 0 = sem operador). Conta como vendido o
+# movimento 'venda' ou 'saida' classificado como venda, e como devolvido a
+# 'entrada' classificada como devolução.
+SQL_ACUMULAR_VENDAS_DIARIAS = """
+    INSERT INTO vendas_diarias_produto
+    (dia, produto_id, usuario_id, quantidade_vendida, quantidade_devolvida)
+    VALUES (date('now'), ?, ?, ?, ?)
+    ON CONFLICT (produto_id, dia, usuario_id) DO UPDATE SET
+        quantidade_vendida = quantidade_vendida + excluded.quantidade_vendida,
+        quantidade_devolvida = quantidade_devolvida + excluded.quantidade_devolvida
+"""
+
+SQL_RECONSTRUIR_VENDAS_DIARIAS = """
+    INSERT INTO vendas_diarias_produto
+    (dia, produto_id, usuario_id, quantidade_vendida, quantidade_devolvida)
+    SELECT
+        date(data_movimento),
+        produto_id,
+        COALESCE(usuario_id, 0),
+        SUM(CASE WHEN tipo = 'venda' OR (tipo = 'saida' AND classificacao = 'venda')
+                 THEN ABS(quantidade) ELSE 0 END),
+        SUM(CASE WHEN tipo = 'entrada' AND classificacao = 'devolucao'
+                 THEN ABS(quantidade) ELSE 0 END)
+    FROM estoque_movimentacao
+    WHERE tipo = 'venda'
+       OR (tipo = 'saida' AND classificacao = 'venda')
+       OR (tipo = 'entrada' AND classificacao = 'devolucao')
+    GROUP BY date(data_movimento), produto_id, COALESCE(usuario_id, 0)
+"""
+
+# Totais movimentados por classificação (gráficos do dashboard): grupo
+# 'entrada' para entradas e 'saida' para saídas e vendas; classificação
+# ausente vira 'outro'. Ajustes não entram.
+SQL_ACUMULAR_MOVIMENTOS_CLASSIFICACAO = """
+    INSERT INTO movimentos_por_classificacao (grupo, classificacao, total)
+    VALUES (?, ?, ?)
+    ON CONFLICT (grupo, classificacao) DO UPDATE SET total = total + excluded.total
+"""
+
+SQL_RECONSTRUIR_MOVIMENTOS_CLASSIFICACAO = """
+    INSERT INTO movimentos_por_classificacao (grupo, classificacao, total)
+    SELECT
+        CASE WHEN tipo = 'entrada' THEN 'entrada' ELSE 'saida' END,
+        COALESCE(classificacao, 'outro'),
+        SUM(ABS(quantidade))
+    FROM estoque_movimentacao
+    WHERE tipo IN ('entrada', 'saida', 'venda')
+    GROUP BY 1, 2
+"""
+
+# Tabelas derivadas de estoque_movimentacao e o SQL que as recalcula do
+# zero. Mantidas incrementalmente por _atualizar_agregados_movimentos.
+AGREGADOS_MOVIMENTOS = {
+    "vendas_diarias_produto": SQL_RECONSTRUIR_VENDAS_DIARIAS,
+    "movimentos_por_classificacao": SQL_RECONSTRUIR_MOVIMENTOS_CLASSIFICACAO,
+}
+
+# Contadores do dashboard (linha única de dashboard_contadores, mantida por
+# gatilhos em produto, categoria e fornecedores). Este SQL recalcula os mesmos
+# valores do zero, com uma leitura de produto e agregações condicionais; é
+# usado na carga inicial e pela verificação de divergências.
+COLUNAS_CONTADORES_DASHBOARD = (
+    "total_produtos",
+    "valor_total_estoque",
+    "produtos_estoque_baixo",
+    "produtos_sem_estoque",
+    "produtos_inativos",
+    "total_categorias",
+    "total_fornecedores_ativos",
+)
+
+SQL_RECALCULAR_CONTADORES_DASHBOARD = """
+    SELECT
+        COALESCE(SUM(CASE WHEN ativo = 1 THEN 1 ELSE 0 END), 0) AS total_produtos,
+        COALESCE(SUM(CASE WHEN ativo = 1 AND estoque > 0 AND preco_compra > 0
+                          THEN estoque * preco_compra END), 0.0) AS valor_total_estoque,
+        COALESCE(SUM(CASE WHEN ativo = 1 AND estoque <= estoque_minimo AND estoque > 0
+                          THEN 1 ELSE 0 END), 0) AS produtos_estoque_baixo,
+        COALESCE(SUM(CASE WHEN ativo = 1 AND estoque = 0 THEN 1 ELSE 0 END), 0) AS produtos_sem_estoque,
+        COALESCE(SUM(CASE WHEN ativo = 0 THEN 1 ELSE 0 END), 0) AS produtos_inativos,
+        (SELECT COUNT(id) FROM categoria) AS total_categorias,
+        (SELECT COUNT(id) FROM fornecedores WHERE ativo = 1) AS total_fornecedores_ativos
+    FROM (
+        SELECT COALESCE(ativo, 1) AS ativo, estoque, estoque_minimo, preco_compra
+        FROM produto
+    )
+"""
+
+# Vendas por dia (contagem e valor final), mantidas por gatilhos em venda.
+SQL_RECONSTRUIR_VENDAS_POR_DIA = """
+    INSERT INTO vendas_por_dia (dia, contagem, valor)
+    SELECT date(data_venda), COUNT(id), COALESCE(SUM(valor_final), 0)
+    FROM venda
+    WHERE data_venda IS NOT NULL
+    GROUP BY date(data_venda)
+"""
+
+# Total vendido (vendas - devoluções) por produto, lido do resumo diário.
+# Base dos relatórios de mais/menos vendidos.
+SQL_TOTAL_VENDIDO_POR_PRODUTO = """
+    SELECT produto_id, SUM(quantidade_vendida - quantidade_devolvida) AS total_vendido
+    FROM vendas_diarias_produto
+    GROUP BY produto_id
+"""
+
+DB_POOL_SIZE_PADRAO = 8
+DB_POOL_TIMEOUT_PADRAO = 10.0
+# Pool somente leitura (relatórios e listagens, ver somente_leitura): cache
+# de páginas maior e E/S mapeada em memória, por conexão.
+DB_LEITURA_CACHE_KIB_PADRAO = 64 * 1024
+DB_LEITURA_MMAP_PADRAO = 256 * 1024 * 1024
+# Quanto uma instrução espera pelo lock de escrita antes de SQLITE_BUSY.
+DB_BUSY_TIMEOUT_MS_PADRAO = 5000
+# Repetição de transações que falharam com SQLITE_BUSY/SQLITE_LOCKED (ver
+# repetir_se_ocupado): novas tentativas e espera exponencial com jitter.
+DB_RETRY_TENTATIVAS = int(os.environ.get("DB_RETRY_TENTATIVAS", 3))
+DB_RETRY_BASE_MS = float(os.environ.get("DB_RETRY_BASE_MS", 25))
+DB_RETRY_MAXIMO_MS = float(os.environ.get("DB_RETRY_MAXIMO_MS", 1000))
+
+
+# Instruções cujo tempo (execute + fetch*) atinge este limite são gravadas no
+# log de consultas lentas com parâmetros, endpoint e EXPLAIN QUERY PLAN.
+# Zero ou negativo desativa.
+SQL_LENTA_LIMITE_MS = float(os.environ.get("SQL_LENTA_LIMITE_MS", 200))
+_PREFIXOS_COM_PLANO = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _parametro_para_log(valor):
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return f"<blob {len(valor)} bytes>"
+    if isinstance(valor, str) and len(valor) > 200:
+        return valor[:200] + "..."
+    return valor
+
+
+def _registrar_consulta_lenta(conn, sql, parametros, duracao, rotulo, em_lote=False):
+    """Grava uma linha JSON no log de consultas lentas."""
+    plano = None
+    varreduras = None
+    if not em_lote and sql.lstrip().upper().startswith(_PREFIXOS_COM_PLANO):
+        try:
+            # Cursor simples: o EXPLAIN não entra nas métricas.
+            plano = obter_plano(sqlite3.Cursor(conn), sql, parametros)
+            varreduras = varreduras_completas(plano)
+        except sqlite3.Error as e:
+            plano = [f"indisponível: {e}"]
+
+    if isinstance(parametros, dict):
+        parametros_log = {k: _parametro_para_log(v) for k, v in parametros.items()}
+    elif em_lote:
+        parametros_log = None
+    else:
+        parametros_log = [_parametro_para_log(v) for v in parametros]
+
+    registro = {
+        "timestamp": datetime.datetime.now().astimezone().isoformat(timespec="milliseconds"),
+        "duracao_ms": round(duracao * 1000, 3),
+        "endpoint": (
+            request.endpoint or request.path
+            if has_request_context()
+            else threading.current_thread().name
+        ),
+        "sql_normalizado": rotulo,
+        "sql": sql.strip(),
+        "parametros": parametros_log,
+        "executemany": em_lote,
+        "plano": plano,
+        "varreduras_completas": varreduras,
+    }
+    logger_consultas_lentas.info(json.dumps(registro, ensure_ascii=False, default=str))
+    logger.warning(
+        "Consulta lenta (%.1f ms) em %s: %s",
+        registro["duracao_ms"],
+        registro["endpoint"],
+        rotulo[:200],
+    )
+
+
+# Estado da repetição de transações na thread atual (ver repetir_se_ocupado).
+_repeticao = threading.local()
+
+
+def erro_ocupado(erro):
+    """True para SQLITE_BUSY e SQLITE_LOCKED (e seus códigos estendidos)."""
+    codigo = getattr(erro, "sqlite_errorcode", None)
+    if codigo is None:
+        return isinstance(erro, sqlite3.OperationalError) and (
+            "locked" in str(erro) or "busy" in str(erro)
+        )
+    return codigo & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def _registrar_erro_sql(erro):
+    metricas.registrar_erro_sql(erro)
+    # Views tratam sqlite3.Error e respondem 500: a marca avisa
+    # repetir_se_ocupado que a falha foi de contenção.
+    if erro_ocupado(erro):
+        _repeticao.ocupado = True
+
+
+class CursorMedido(sqlite3.Cursor):
+    """
+    Cursor que mede cada instrução executada (ver metricas.py). O tempo do
+    execute vai para o histograma do SQL normalizado; o dos fetch* é somado
+    ao mesmo SQL. Dentro de uma requisição, g.consultas_sql conta as
+    instruções executadas. Quando execute + fetch* ultrapassa SQL_LENTA_LIMITE_MS, a
+    instrução é registrada no log de consultas lentas (uma vez por execute).
+    """
+
+    _rotulo_sql = None
+    _sql = None
+    _parametros = ()
+    _em_lote = False
+    _tempo_acumulado = 0.0
+    _lenta_registrada = False
+
+    def _iniciar_medicao(self, sql, parametros, duracao, em_lote=False):
+        self._sql = sql
+        self._parametros = parametros
+        self._em_lote = em_lote
+        self._tempo_acumulado = duracao
+        self._lenta_registrada = False
+        self._rotulo_sql = metricas.registrar_sql(sql, duracao)
+        if has_request_context():
+            g.consultas_sql = g.get("consultas_sql", 0) + 1
+        self._verificar_lentidao()
+
+    def _verificar_lentidao(self):
+        if (
+            SQL_LENTA_LIMITE_MS > 0
+            and not self._lenta_registrada
+            and self._tempo_acumulado * 1000 >= SQL_LENTA_LIMITE_MS
+        ):
+            self._lenta_registrada = True
+            try:
+                _registrar_consulta_lenta(
+                    self.connection,
+                    self._sql,
+                    self._parametros,
+                    self._tempo_acumulado,
+                    self._rotulo_sql,
+                    em_lote=self._em_lote,
+                )
+            except Exception:
+                logger.warning("Falha ao registrar consulta lenta.", exc_info=True)
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        except sqlite3.Error as e:
+            _registrar_erro_sql(e)
+            raise
+        finally:
+            self._iniciar_medicao(sql, parametros, time.perf_counter() - inicio)
+
+    def executemany(self, sql, sequencia):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, sequencia)
+        except sqlite3.Error as e:
+            _registrar_erro_sql(e)
+            raise
+        finally:
+            self._iniciar_medicao(
+                sql, None, time.perf_counter() - inicio, em_lote=True)
+
+    def executescript(self, script):
+        inicio = time.perf_counter()
+        try:
+            return super().executescript(script)
+        except sqlite3.Error as e:
+            _registrar_erro_sql(e)
+            raise
+        finally:
+            self._iniciar_medicao(
+                script, None, time.perf_counter() - inicio, em_lote=True)
+
+    def _medir_leitura(self, leitura, *args):
+        inicio = time.perf_counter()
+        try:
+            return leitura(*args)
+        finally:
+            if self._rotulo_sql is not None:
+                duracao = time.perf_counter() - inicio
+                metricas.registrar_leitura(self._rotulo_sql, duracao)
+                self._tempo_acumulado += duracao
+                self._verificar_lentidao()
+
+    def fetchone(self):
+        return self._medir_leitura(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._medir_leitura(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._medir_leitura(super().fetchall)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Conexão SQLite emprestada de um PoolConexoes.
+
+    Chamar close() devolve a conexão ao pool em vez de fechá-la. Quando a
+    conexão está vinculada ao contexto Flask (g), close() não faz nada: ela
+    só é devolvida no teardown, permitindo que várias funções da mesma
+    requisição reutilizem a mesma conexão.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._pid = os.getpid()
+        self._emprestada = False
+        self._vinculada_contexto = False
+        # Lista em que escritas aninhadas deixam seus eventos para o dono da
+        # transação publicar após o commit (ver _publicar_evento).
+        self.eventos_pendentes = None
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    # Os atalhos da conexão criam o cursor em C, sem passar por cursor();
+    # redirecioná-los garante que toda instrução seja medida.
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def close(self):
+        if self._vinculada_contexto:
+            return
+        if self._pool is not None:
+            self._pool.devolver(self)
+        else:
+            super().close()
+
+    def fechar_definitivamente(self):
+        """Fecha a conexão de fato, sem devolvê-la ao pool."""
+        super().close()
+
+
+_identificadores_pool = itertools.count(1)
+
+
+class PoolConexoes:
+    """
+    Pool limitado de conexões SQLite já configuradas (PRAGMAs aplicados uma
+    única vez, na criação da conexão).
+
+    `database` pode ser um caminho ou uma URI "file:...". Bancos em memória
+    precisam de cache compartilhado para que todas as conexões do pool vejam
+    o mesmo banco ("file::memory:?cache=shared" ou
+    "file:nome?mode=memory&cache=shared"; ":memory:" vira uma URI própria
+    deste pool). Uma conexão âncora mantém o banco vivo enquanto o pool
+    existir, mesmo sem conexões emprestadas. No cache compartilhado os
+    bloqueios são por tabela e um conflito falha na hora com SQLITE_LOCKED,
+    sem busy_timeout: serve para testes, não para escrita concorrente.
+    """
+
+    def __init__(
+        self,
+        database,
+        tamanho_maximo=DB_POOL_SIZE_PADRAO,
+        timeout=DB_POOL_TIMEOUT_PADRAO,
+        somente_leitura=False,
+        busy_timeout_ms=None,
+    ):
+        self.identificador = next(_identificadores_pool)
+        self.somente_leitura = somente_leitura
+        if database == ":memory:":
+            database = f"file:gep_memoria_{self.identificador}?mode=memory&cache=shared"
+        self.database = database
+        self._uri = database.startswith("file:")
+        self._ancora = (
+            sqlite3.connect(database, uri=True, check_same_thread=False)
+            if banco_em_memoria(database)
+            else None
+        )
+        self.tamanho_maximo = max(1, int(tamanho_maximo))
+        self.timeout = float(timeout)
+        self.busy_timeout_ms = float(
+            busy_timeout_ms
+            if busy_timeout_ms is not None
+            else os.getenv("DB_BUSY_TIMEOUT_MS", DB_BUSY_TIMEOUT_MS_PADRAO)
+        )
+        self._condicao = threading.Condition()
+        self._ociosas = []
+        self._abertas = 0
+        self._em_uso = 0
+        self._fechado = False
+        self._pid = os.getpid()
+        self._herdadas = []
+
+        self._emprestimos = 0
+        self._esperas = 0
+        self._esgotamentos = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_maximo = 0.0
+
+    def _criar_conexao(self):
+        if self.somente_leitura:
+            return self._criar_conexao_leitura()
+        conn = sqlite3.connect(
+            database=self.database,
+            check_same_thread=False,
+            factory=PooledConnection,
+            timeout=self.busy_timeout_ms / 1000,
+            uri=self._uri,
+        )
+        conn.row_factory = sqlite3.Row
+
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA cache_size = -2000;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn._pool = self
+        return conn
+
+    def _criar_conexao_leitura(self):
+        """
+        Conexão aberta com mode=ro e query_only: não escreve nem por engano
+        e, no WAL, lê um instantâneo sem bloquear o escritor.
+        """
+        if self._uri:
+            separador = "&" if "?" in self.database else "?"
+            uri = f"{self.database}{separador}mode=ro"
+        else:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.database))}?mode=ro"
+        conn = sqlite3.connect(
+            database=uri,
+            check_same_thread=False,
+            factory=PooledConnection,
+            timeout=self.busy_timeout_ms / 1000,
+            uri=True,
+        )
+        conn.row_factory = sqlite3.Row
+
+        conn.execute("PRAGMA query_only = ON;")
+        conn.execute(
+            "PRAGMA cache_size = -%d;"
+            % int(os.getenv("DB_LEITURA_CACHE_KIB", DB_LEITURA_CACHE_KIB_PADRAO))
+        )
+        conn.execute(
+            "PRAGMA mmap_size = %d;"
+            % int(os.getenv("DB_LEITURA_MMAP_BYTES", DB_LEITURA_MMAP_PADRAO))
+        )
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn._pool = self
+        return conn
+
+    def _verificar_processo(self):
+        # Depois de um fork (gunicorn --preload) o filho não pode usar as
+        # conexões herdadas do pai: o SQLite proíbe levar uma conexão aberta
+        # através de fork(). O pool recomeça vazio no filho; as herdadas
+        # ficam referenciadas, sem close(), para que nem o coletor de lixo as
+        # finalize neste processo.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._condicao = threading.Condition()
+        self._herdadas.extend(self._ociosas)
+        self._ociosas = []
+        self._abertas = 0
+        self._em_uso = 0
+
+    def obter(self):
+        """
+        Empresta uma conexão do pool, criando uma nova se o limite ainda não
+        foi atingido. Aguarda até `timeout` segundos por uma conexão livre.
+
+        Raises:
+            sqlite3.OperationalError: Se nenhuma conexão ficar livre a tempo.
+        """
+        self._verificar_processo()
+        inicio = time.perf_counter()
+        esperou = False
+        conn = None
+        with self._condicao:
+            while True:
+                if self._fechado:
+                    raise sqlite3.OperationalError("Pool de conexões fechado.")
+                if self._ociosas:
+                    conn = self._ociosas.pop()
+                    break
+                if self._abertas < self.tamanho_maximo:
+                    self._abertas += 1
+                    break
+                restante = self.timeout - (time.perf_counter() - inicio)
+                if restante <= 0:
+                    self._esgotamentos += 1
+                    raise sqlite3.OperationalError(
+                        f"Pool de conexões esgotado ({self.tamanho_maximo} em uso) "
+                        f"após aguardar {self.timeout:.1f}s."
+                    )
+                esperou = True
+                self._condicao.wait(restante)
+
+            self._em_uso += 1
+            self._emprestimos += 1
+            if esperou:
+                espera = time.perf_counter() - inicio
+                self._esperas += 1
+                self._tempo_espera_total += espera
+                self._tempo_espera_maximo = max(self._tempo_espera_maximo, espera)
+
+        if conn is None:
+            try:
+                conn = self._criar_conexao()
+            except Exception:
+                with self._condicao:
+                    self._abertas -= 1
+                    self._em_uso -= 1
+                    self._condicao.notify()
+                raise
+
+        conn._emprestada = True
+        return conn
+
+    def devolver(self, conn):
+        """Devolve uma conexão ao pool, desfazendo transações pendentes."""
+        if not conn._emprestada:
+            return
+        conn._emprestada = False
+        self._verificar_processo()
+        if conn._pid != self._pid:
+            # Emprestada antes do fork: não conta no pool deste processo.
+            self._herdadas.append(conn)
+            return
+
+        descartar = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            logger.warning(
+                "Conexão descartada: falha ao desfazer transação pendente.", exc_info=True
+            )
+            descartar = True
+
+        with self._condicao:
+            self._em_uso -= 1
+            if descartar or self._fechado:
+                self._abertas -= 1
+            else:
+                self._ociosas.append(conn)
+                conn = None
+            self._condicao.notify()
+
+        if conn is not None:
+            conn.fechar_definitivamente()
+
+    def fechar(self):
+        """Fecha as conexões ociosas; as emprestadas são fechadas ao voltar."""
+        self._verificar_processo()
+        with self._condicao:
+            self._fechado = True
+            ociosas, self._ociosas = self._ociosas, []
+            self._abertas -= len(ociosas)
+            self._condicao.notify_all()
+            ancora, self._ancora = self._ancora, None
+        for conn in ociosas:
+            conn.fechar_definitivamente()
+        if ancora is not None:
+            ancora.close()
+
+    def estatisticas(self):
+        """Retorna contadores de uso e de espera do pool."""
+        self._verificar_processo()
+        with self._condicao:
+            return {
+                "database": self.database,
+                "somente_leitura": self.somente_leitura,
+                "tamanho_maximo": self.tamanho_maximo,
+                "busy_timeout_ms": self.busy_timeout_ms,
+                "conexoes_abertas": self._abertas,
+                "em_uso": self._em_uso,
+                "ociosas": len(self._ociosas),
+                "emprestimos": self._emprestimos,
+                "esperas": self._esperas,
+                "esgotamentos": self._esgotamentos,
+                "tempo_espera_total_ms": round(self._tempo_espera_total * 1000, 3),
+                "tempo_espera_medio_ms": (
+                    round(self._tempo_espera_total * 1000 / self._esperas, 3)
+                    if self._esperas
+                    else 0.0
+                ),
+                "tempo_espera_maximo_ms": round(self._tempo_espera_maximo * 1000, 3),
+            }
+
+
+_pool = None
+_pool_leitura = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna o pool global, criando-o na primeira chamada."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(
+                    DATABASE_NAME,
+                    tamanho_maximo=int(
+                        os.getenv("DB_POOL_SIZE", DB_POOL_SIZE_PADRAO)),
+                    timeout=float(
+                        os.getenv("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT_PADRAO)),
+                )
+    return _pool
+
+
+def get_pool_leitura():
+    """
+    Retorna o pool somente leitura, criando-o na primeira chamada. Bancos em
+    memória não aceitam mode=ro: nesse caso é o próprio pool principal.
+    """
+    global _pool_leitura
+    principal = get_pool()
+    if principal._ancora is not None:
+        return principal
+    if _pool_leitura is None or _pool_leitura.database != principal.database:
+        with _pool_lock:
+            if _pool_leitura is None or _pool_leitura.database != principal.database:
+                anterior = _pool_leitura
+                _pool_leitura = PoolConexoes(
+                    principal.database,
+                    tamanho_maximo=int(
+                        os.getenv("DB_LEITURA_POOL_SIZE", principal.tamanho_maximo)),
+                    timeout=principal.timeout,
+                    somente_leitura=True,
+                    busy_timeout_ms=principal.busy_timeout_ms,
+                )
+                if anterior is not None:
+                    anterior.fechar()
+    return _pool_leitura
+
+
+def configurar_pool(database=None, tamanho_maximo=None, timeout=None, busy_timeout_ms=None):
+    """
+    Substitui o pool global, fechando o anterior (e o pool somente leitura,
+    recriado no próximo uso). Útil para apontar a aplicação para outro
+    arquivo de banco de dados.
+
+    `timeout` é a espera (s) por uma conexão livre do pool; `busy_timeout_ms`
+    a espera de cada instrução pelo lock do SQLite (padrão: variável de
+    ambiente DB_BUSY_TIMEOUT_MS ou DB_BUSY_TIMEOUT_MS_PADRAO).
+    """
+    global _pool, _pool_leitura, DATABASE_NAME
+    with _pool_lock:
+        anterior = _pool
+        anterior_leitura, _pool_leitura = _pool_leitura, None
+        if database is not None:
+            DATABASE_NAME = database
+        _pool = PoolConexoes(
+            DATABASE_NAME,
+            tamanho_maximo=(
+                tamanho_maximo
+                if tamanho_maximo is not None
+                else int(os.getenv("DB_POOL_SIZE", DB_POOL_SIZE_PADRAO))
+            ),
+            timeout=(
+                timeout
+                if timeout is not None
+                else float(os.getenv("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT_PADRAO))
+            ),
+            busy_timeout_ms=busy_timeout_ms,
+        )
+    if anterior is not None:
+        anterior.fechar()
+    if anterior_leitura is not None:
+        anterior_leitura.fechar()
+    return _pool
+
 
+def clonar_banco(modelo):
+    """
+    Substitui o conteúdo do banco do pool atual por uma cópia de `modelo`
+    (caminho ou URI), usando a API de backup do SQLite. Com um modelo já
+    migrado, preparar um banco novo custa só a cópia das páginas.
+    """
+    origem = sqlite3.connect(modelo, uri=modelo.startswith("file:"))
+    conn = get_pool().obter()
+    try:
+        origem.backup(conn)
+    finally:
+        conn.close()
+        origem.close()
+
+
+_conexao_thread = threading.local()
+
+
+@contextmanager
+def usar_conexao(conn):
+    """
+    Faz get_db() retornar `conn` nesta thread enquanto o bloco durar, com ou
+    sem contexto Flask. Usado por threads que mantêm a própria conexão (o
+    escritor único), para que as funções de escrita rodem nela.
+    """
+    anterior = getattr(_conexao_thread, "conn", None)
+    _conexao_thread.conn = conn
+    try:
+        yield conn
+    finally:
+        _conexao_thread.conn = anterior
 
-DATABASE_NAME = "estoque.db"
+
+def _publicar_evento(conn, transacao_propria, tipo, **dados):
+    """
+    Publica o evento de uma escrita. Com transação própria ela já foi
+    confirmada e o evento sai na hora. Dentro da transação de um chamador,
+    o evento fica em conn.eventos_pendentes se o chamador os recolhe para
+    publicar depois do próprio commit; caso contrário é descartado e o
+    chamador publica o seu (como no cancelamento de venda).
+    """
+    if transacao_propria:
+        eventos.publicar_evento(tipo, **dados)
+    elif conn.eventos_pendentes is not None:
+        conn.eventos_pendentes.append((tipo, dados))
 
 
 def get_db():
-    """Obtém uma conexão com o banco de dados."""
+    """
+    Obtém uma conexão com o banco de dados.
 
-    conn = sqlite3.connect(database=DATABASE_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    Dentro de um contexto de aplicação Flask a conexão fica vinculada a `g`:
+    chamadas repetidas na mesma requisição retornam a mesma conexão, e
+    close() só a devolve ao pool no teardown. Fora de contexto, close()
+    devolve a conexão ao pool imediatamente. Dentro de usar_conexao(), a
+    conexão da thread tem precedência.
+    """
+    conn = getattr(_conexao_thread, "conn", None)
+    if conn is not None:
+        return conn
+    if has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            pool = get_pool_leitura() if g.get("_somente_leitura") else get_pool()
+            conn = pool.obter()
+            conn._vinculada_contexto = True
+            g._db_conn = conn
+        return conn
+    return get_pool().obter()
+
+
+def somente_leitura(view):
+    """
+    Faz as requisições GET/HEAD da view usarem o pool somente leitura
+    (mode=ro, query_only, cache maior e mmap), para que relatórios e
+    listagens longas não disputem conexões com as escritas. Deve ficar logo
+    abaixo de @route, antes dos decoradores que já consultam o banco.
+    Outros métodos da mesma rota (POST, PUT...) seguem no pool normal.
+    """
+
+    @functools.wraps(view)
+    def decorada(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and g.get("_db_conn") is None:
+            g._somente_leitura = True
+        return view(*args, **kwargs)
 
-    conn.execute("PRAGMA foreign_keys = ON;")
-    conn.execute("PRAGMA journal_mode = WAL;")
-    conn.execute("PRAGMA synchronous = NORMAL;")
-    conn.execute("PRAGMA cache_size = -2000;")
-    conn.execute("PRAGMA temp_store = MEMORY;")
+    return decorada
+
+
+def _conexao_atual():
+    """Conexão que get_db() retornaria nesta thread, se já houver uma."""
+    conn = getattr(_conexao_thread, "conn", None)
+    if conn is None and has_app_context():
+        conn = g.get("_db_conn")
     return conn
 
 
+def _resposta_de_erro(resultado):
+    """True se o retorno de uma view for uma resposta 5xx."""
+    if isinstance(resultado, tuple) and len(resultado) > 1 and isinstance(resultado[1], int):
+        return resultado[1] >= 500
+    return getattr(resultado, "status_code", 200) >= 500
+
+
+def _espera_repeticao(tentativa):
+    # Backoff exponencial com "full jitter": espera sorteada entre zero e o
+    # teto da tentativa, para que os concorrentes não voltem juntos.
+    teto = min(DB_RETRY_MAXIMO_MS, DB_RETRY_BASE_MS * 2 ** tentativa)
+    return random.uniform(0, teto) / 1000
+
+
+def repetir_se_ocupado(funcao):
+    """
+    Repete a transação inteira de `funcao` quando ela falha por contenção
+    (SQLITE_BUSY/SQLITE_LOCKED), até DB_RETRY_TENTATIVAS vezes, com espera
+    exponencial e jitter entre as tentativas.
+
+    Serve para funções de escrita, que relançam o sqlite3.Error, e para
+    views, que o tratam e respondem 500: nesse caso a repetição acontece se
+    a resposta for 5xx e o cursor tiver registrado um erro de contenção.
+    Antes de cada nova tentativa a transação pendente é desfeita.
+
+    Só o escopo mais externo repete: chamadas aninhadas (uma view decorada
+    que chama registrar_movimento) ou feitas dentro da transação de outro
+    chamador (escritor único, cancelamento de venda) executam uma vez e
+    deixam a falha para quem é dono da transação.
+    """
+    operacao = funcao.__name__
+
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        conn = _conexao_atual()
+        if getattr(_repeticao, "ativa", False) or (conn is not None and conn.in_transaction):
+            return funcao(*args, **kwargs)
+
+        _repeticao.ativa = True
+        try:
+            tentativa = 0
+            while True:
+                _repeticao.ocupado = False
+                try:
+                    resultado = funcao(*args, **kwargs)
+                except sqlite3.Error as e:
+                    if not erro_ocupado(e):
+                        raise
+                    if tentativa >= DB_RETRY_TENTATIVAS:
+                        metricas.registrar_desistencia(operacao)
+                        logger.warning(
+                            "%s: banco ocupado após %d tentativas, desistindo: %s",
+                            operacao, tentativa + 1, e,
+                        )
+                        raise
+                    motivo = e
+                else:
+                    if not (_repeticao.ocupado and _resposta_de_erro(resultado)):
+                        return resultado
+                    if tentativa >= DB_RETRY_TENTATIVAS:
+                        metricas.registrar_desistencia(operacao)
+                        logger.warning(
+                            "%s: banco ocupado após %d tentativas, desistindo.",
+                            operacao, tentativa + 1,
+                        )
+                        return resultado
+                    motivo = "resposta 5xx após erro de contenção"
+
+                conn = _conexao_atual()
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                espera = _espera_repeticao(tentativa)
+                tentativa += 1
+                metricas.registrar_repeticao(operacao)
+                logger.info(
+                    "%s: banco ocupado (%s); tentativa %d em %.0f ms.",
+                    operacao, motivo, tentativa + 1, espera * 1000,
+                )
+                time.sleep(espera)
+        finally:
+            _repeticao.ativa = False
+
+    return envoltorio
+
+
+def liberar_db(exc=None):
+    """Devolve ao pool a conexão vinculada ao contexto atual (teardown)."""
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn._vinculada_contexto = False
+        conn.close()
+
+
+def estatisticas_pool():
+    """Retorna as estatísticas do pool global de conexões."""
+    return get_pool().estatisticas()
+
+
+def estatisticas_pool_leitura():
+    """Estatísticas do pool somente leitura (None se ainda não foi usado)."""
+    pool = _pool_leitura
+    return pool.estatisticas() if pool is not None else None
+
+
+def init_app(app):
+    """Registra o teardown que devolve as conexões ao pool."""
+    app.teardown_appcontext(liberar_db)
+
+
+def banco_em_memoria(database):
+    """Indica se o caminho/URI aponta para um banco SQLite em memória."""
+    return database == ":memory:" or database.startswith("file::memory:") or (
+        database.startswith("file:") and "mode=memory" in database
+    )
+
+
+def caminho_arquivo_banco(database):
+    """Caminho no disco de um banco dado por caminho ou URI (file:...?...)."""
+    caminho = database.split("?", 1)[0]
+    return caminho[len("file:"):] if caminho.startswith("file:") else caminho
+
+
+@contextmanager
+def trava_arquivo(caminho, bloquear=True):
+    """
+    Trava exclusiva entre processos baseada em arquivo (fcntl no Unix,
+    msvcrt no Windows). Bloqueia até obter a trava; com bloquear=False
+    levanta BlockingIOError se outro processo já a tiver.
+    """
+    with open(caminho, "a+") as arquivo:
+        if os.name == "nt":
+            import msvcrt
+
+            arquivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(
+                        arquivo.fileno(), msvcrt.LK_LOCK if bloquear else msvcrt.LK_NBLCK, 1
+                    )
+                    break
+                except OSError:
+                    if not bloquear:
+                        raise BlockingIOError(f"Trava ocupada: {caminho}")
+                    continue
+            try:
+                yield
+            finally:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(
+                arquivo.fileno(), fcntl.LOCK_EX if bloquear else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
 def inicializar_dados_exemplo():
     """Insere dados de exemplo no banco de dados, se não existirem."""
     conn = None
@@ -235,106 +1185,124 @@ def inicializar_dados_exemplo():
             conn.close()
 
 
-def obter_estatisticas():
-    """Retorna estatísticas gerais do sistema para o dashboard."""
-    conn = None
+@contextmanager
+def _cronometrar(tempos, secao):
+    """Acumula em tempos[secao] a duração, em ms, do bloco."""
+    inicio = time.perf_counter()
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        resultado = {}
-
-        cursor.execute(
-            "SELECT COUNT(id) FROM produto WHERE COALESCE(ativo, 1) = 1")
-        resultado["total_produtos"] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(id) FROM categoria")
-        resultado["total_categorias"] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(id) FROM fornecedores WHERE ativo = 1")
-        resultado["total_fornecedores_ativos"] = cursor.fetchone()[0]
-
-        cursor.execute(
-            "SELECT SUM(estoque * preco_compra) FROM produto WHERE estoque > 0 AND preco_compra > 0 AND COALESCE(ativo, 1) = 1"
-        )
-        resultado["valor_total_estoque"] = cursor.fetchone()[0] or 0.0
-
-        cursor.execute(
-            "SELECT COUNT(id) FROM produto WHERE estoque <= estoque_minimo AND estoque > 0 AND COALESCE(ativo, 1) = 1"
+        yield
+    finally:
+        tempos[secao] = round(
+            tempos.get(secao, 0.0) + (time.perf_counter() - inicio) * 1000, 3
         )
-        resultado["produtos_estoque_baixo"] = cursor.fetchone()[0]
 
-        cursor.execute(
-            "SELECT COUNT(id) FROM produto WHERE estoque = 0 AND COALESCE(ativo, 1) = 1"
-        )
-        resultado["produtos_sem_estoque"] = cursor.fetchone()[0]
 
-        cursor.execute(
-            "SELECT COUNT(id) FROM produto WHERE COALESCE(ativo, 1) = 0")
-        resultado["produtos_inativos"] = cursor.fetchone()[0]
+def obter_estatisticas(incluir_tempos=False):
+    """
+    Retorna estatísticas gerais do sistema para o dashboard.
 
-        trinta_dias_atras = (
-            datetime.datetime.now() - datetime.timedelta(days=30)
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute(
-            "SELECT COUNT(id), COALESCE(SUM(valor_final), 0) FROM venda WHERE data_venda >= ?",
-            (trinta_dias_atras,),
-        )
-        vendas_dados = cursor.fetchone()
-        resultado["vendas_ultimos_30_dias_contagem"] = vendas_dados[0]
-        resultado["vendas_ultimos_30_dias_valor"] = vendas_dados[1] or 0.0
+    Tudo vem de tabelas mantidas incrementalmente: os contadores de
+    produtos, categorias e fornecedores são uma linha de
+    `dashboard_contadores`, as vendas dos últimos 30 dias somam no máximo
+    31 linhas de `vendas_por_dia` e os totais por classificação vêm de
+    `movimentos_por_classificacao`.
 
-        cursor.execute(
-            """
-            SELECT m.id, p.nome as produto_nome, m.tipo, m.quantidade, m.data_movimento, u.nome as usuario_nome
-            FROM estoque_movimentacao m
-            JOIN produto p ON m.produto_id = p.id
-            LEFT JOIN usuario u ON m.usuario_id = u.id
-            WHERE COALESCE(p.ativo, 1) = 1
-            ORDER BY m.data_movimento DESC
-            LIMIT 5
-        """
-        )
-        mov_recentes_raw = cursor.fetchall()
-        resultado["movimentacoes_recentes"] = []
-        for row in mov_recentes_raw:
-            mov_dict = dict(row)
+    Args:
+        incluir_tempos: Se True, inclui "tempos_ms" com a duração de cada
+            seção da consulta (diagnóstico).
+    """
+    conn = None
+    tempos = {}
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
 
-            try:
-                dt_obj = datetime.datetime.fromisoformat(
-                    mov_dict["data_movimento"])
-                mov_dict["data_movimento_fmt"] = dt_obj.strftime(
-                    "%d/%m/%y %H:%M")
-            except Exception:
+        resultado = {}
 
-                mov_dict["data_movimento_fmt"] = mov_dict["data_movimento"]
-            resultado["movimentacoes_recentes"].append(mov_dict)
+        with _cronometrar(tempos, "contadores"):
+            cursor.execute(
+                f"SELECT {', '.join(COLUNAS_CONTADORES_DASHBOARD)} "
+                "FROM dashboard_contadores WHERE id = 1"
+            )
+            contadores = cursor.fetchone()
+            if contadores is None:
+                cursor.execute(SQL_RECALCULAR_CONTADORES_DASHBOARD)
+                contadores = cursor.fetchone()
+            resultado.update(dict(contadores))
+
+        with _cronometrar(tempos, "vendas_30_dias"):
+            trinta_dias_atras = (
+                datetime.datetime.now() - datetime.timedelta(days=30)
+            ).strftime("%Y-%m-%d %H:%M:%S")
+            # Dias inteiros vêm de vendas_por_dia; só o dia do corte, que
+            # entra parcialmente, é lido de venda (pelo índice de data).
+            cursor.execute(
+                """
+                SELECT COALESCE(SUM(contagem), 0), COALESCE(SUM(valor), 0)
+                FROM (
+                    SELECT contagem, valor FROM vendas_por_dia WHERE dia > date(?)
+                    UNION ALL
+                    SELECT COUNT(id), COALESCE(SUM(valor_final), 0) FROM venda
+                    WHERE data_venda >= ? AND data_venda < date(?, '+1 day')
+                )
+                """,
+                (trinta_dias_atras, trinta_dias_atras, trinta_dias_atras),
+            )
+            vendas_dados = cursor.fetchone()
+            resultado["vendas_ultimos_30_dias_contagem"] = vendas_dados[0]
+            resultado["vendas_ultimos_30_dias_valor"] = vendas_dados[1] or 0.0
 
-        cursor.execute(
-            """
-            SELECT COALESCE(classificacao, 'outro') as classif, SUM(ABS(quantidade)) as total
-            FROM estoque_movimentacao
-            WHERE tipo = 'entrada'
-            GROUP BY classif
+        with _cronometrar(tempos, "movimentacoes_recentes"):
+            cursor.execute(
+                """
+                SELECT m.id, p.nome as produto_nome, m.tipo, m.quantidade, m.data_movimento, u.nome as usuario_nome
+                -- CROSS JOIN fixa a ordem: percorre idx_mov_data do fim e para nas 5
+                -- primeiras. Com estatísticas (ANALYZE) de um histórico grande o
+                -- planejador preferia varrer produto e ordenar tudo.
+                FROM estoque_movimentacao m
+                CROSS JOIN produto p ON m.produto_id = p.id
+                LEFT JOIN usuario u ON m.usuario_id = u.id
+                WHERE COALESCE(p.ativo, 1) = 1
+                ORDER BY m.data_movimento DESC
+                LIMIT 5
             """
-        )
-        entradas_rows = cursor.fetchall()
-        resultado["entradas_por_classificacao"] = {
-            row["classif"]: row["total"] for row in entradas_rows
-        }
+            )
+            mov_recentes_raw = cursor.fetchall()
+            resultado["movimentacoes_recentes"] = []
+            for row in mov_recentes_raw:
+                mov_dict = dict(row)
+
+                try:
+                    dt_obj = datetime.datetime.fromisoformat(
+                        mov_dict["data_movimento"])
+                    mov_dict["data_movimento_fmt"] = dt_obj.strftime(
+                        "%d/%m/%y %H:%M")
+                except Exception:
+
+                    mov_dict["data_movimento_fmt"] = mov_dict["data_movimento"]
+                resultado["movimentacoes_recentes"].append(mov_dict)
+
+        with _cronometrar(tempos, "classificacoes"):
+            cursor.execute(
+                """
+                SELECT grupo, classificacao, total
+                FROM movimentos_por_classificacao
+                WHERE total != 0
+                """
+            )
+            resultado["entradas_por_classificacao"] = {}
+            resultado["saidas_por_classificacao"] = {}
+            for row in cursor.fetchall():
+                chave = (
+                    "entradas_por_classificacao"
+                    if row["grupo"] == "entrada"
+                    else "saidas_por_classificacao"
+                )
+                resultado[chave][row["classificacao"]] = row["total"]
 
-        cursor.execute(
-            """
-            SELECT COALESCE(classificacao, 'outro') as classif, SUM(ABS(quantidade)) as total
-            FROM estoque_movimentacao
-            WHERE tipo IN ('saida', 'venda')
-            GROUP BY classif
-            """
-        )
-        saidas_rows = cursor.fetchall()
-        resultado["saidas_por_classificacao"] = {
-            row["classif"]: row["total"] for row in saidas_rows
-        }
+        if incluir_tempos:
+            tempos["total"] = round(sum(tempos.values()), 3)
+            resultado["tempos_ms"] = tempos
 
         return resultado
 
@@ -361,6 +1329,118 @@ def obter_estatisticas():
             conn.close()
 
 
+def _aplicar_movimento(
+    cursor,
+    produto_id,
+    tipo,
+    quantidade,
+    usuario_id=None,
+    observacao=None,
+    venda_id=None,
+    classificacao=None,
+):
+    """
+    Aplica um movimento de estoque na transação já aberta do cursor.
+
+    Entradas e saídas são resolvidas por um único UPDATE atômico com
+    RETURNING: a saída só acontece se `estoque >= quantidade`, então duas
+    saídas concorrentes nunca leem o mesmo saldo. O saldo anterior é
+    derivado do valor retornado. Para 'ajuste' o saldo anterior é lido
+    antes do UPDATE, o que é seguro porque a transação já detém o lock de
+    escrita (BEGIN IMMEDIATE).
+
+    Returns:
+        dict: Informações sobre o movimento realizado.
+
+    Raises:
+        ValueError: Se o produto não existir ou o estoque for insuficiente.
+    """
+    if tipo == "entrada":
+        cursor.execute(
+            """
+            UPDATE produto SET estoque = estoque + ?, ultima_atualizacao = CURRENT_TIMESTAMP
+            WHERE id = ?
+            RETURNING nome, estoque
+            """,
+            (quantidade, produto_id),
+        )
+        linhas = cursor.fetchall()
+        if not linhas:
+            raise ValueError(f"Produto com ID {produto_id} não encontrado.")
+        produto_nome, estoque_novo = linhas[0]["nome"], linhas[0]["estoque"]
+        estoque_anterior = estoque_novo - quantidade
+        db_mov_quantidade = quantidade
+    elif tipo == "saida" or tipo == "venda":
+        cursor.execute(
+            """
+            UPDATE produto SET estoque = estoque - ?, ultima_atualizacao = CURRENT_TIMESTAMP
+            WHERE id = ? AND estoque >= ?
+            RETURNING nome, estoque
+            """,
+            (quantidade, produto_id, quantidade),
+        )
+        linhas = cursor.fetchall()
+        if not linhas:
+            cursor.execute(
+                "SELECT nome, estoque FROM produto WHERE id = ?", (produto_id,)
+            )
+            produto = cursor.fetchone()
+            if not produto:
+                raise ValueError(
+                    f"Produto com ID {produto_id} não encontrado.")
+            raise ValueError(
+                f"Estoque insuficiente para '{produto['nome']}'. Disponível: {produto['estoque']}, Solicitado: {quantidade}."
+            )
+        produto_nome, estoque_novo = linhas[0]["nome"], linhas[0]["estoque"]
+        estoque_anterior = estoque_novo + quantidade
+        db_mov_quantidade = -quantidade
+    elif tipo == "ajuste":
+        cursor.execute(
+            "SELECT nome, estoque FROM produto WHERE id = ?", (produto_id,)
+        )
+        produto = cursor.fetchone()
+        if not produto:
+            raise ValueError(f"Produto com ID {produto_id} não encontrado.")
+        produto_nome, estoque_anterior = produto["nome"], produto["estoque"]
+        estoque_novo = quantidade
+        db_mov_quantidade = estoque_novo - estoque_anterior
+        cursor.execute(
+            "UPDATE produto SET estoque = ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
+            (estoque_novo, produto_id),
+        )
+    else:
+        raise ValueError(f"Tipo de movimento desconhecido: {tipo}")
+
+    linha = (
+        produto_id,
+        usuario_id,
+        tipo,
+        db_mov_quantidade,
+        estoque_anterior,
+        estoque_novo,
+        observacao,
+        venda_id,
+        classificacao,
+    )
+    cursor.execute(SQL_INSERT_MOVIMENTO, linha)
+    movimento_id = cursor.lastrowid
+    _atualizar_agregados_movimentos(cursor, [linha])
+
+    return {
+        "id": movimento_id,
+        "produto_id": produto_id,
+        "produto_nome": produto_nome,
+        "tipo": tipo,
+        "quantidade_movimentada": db_mov_quantidade,
+        "estoque_anterior": estoque_anterior,
+        "estoque_atual": estoque_novo,
+        "usuario_id": usuario_id,
+        "observacao": observacao,
+        "data_movimento": datetime.datetime.now().isoformat(),
+    }
+
+
+@repetir_se_ocupado
 def registrar_movimento(
     produto_id,
     tipo,
@@ -372,7 +1452,8 @@ def registrar_movimento(
 ):
     """
     Registra um movimento de estoque e atualiza o estoque do produto.
-    Agora inclui transação e lida com 'ajuste' e 'venda'.
+    Usa BEGIN IMMEDIATE e um UPDATE condicional (ver _aplicar_movimento),
+    de modo que movimentos concorrentes não perdem atualizações.
 
     Args:
         produto_id (int): ID do produto.
@@ -409,102 +1490,396 @@ def registrar_movimento(
         )
 
     conn = None
+    transacao_propria = False
     try:
         conn = get_db()
         cursor = conn.cursor()
-        conn.execute("BEGIN TRANSACTION")
 
-        cursor.execute(
-            "SELECT id, nome, estoque FROM produto WHERE id = ?", (produto_id,)
+        # Na mesma requisição a conexão é compartilhada: se o chamador já
+        # abriu uma transação (ex.: cancelamento de venda), o movimento
+        # participa dela e o commit/rollback fica a cargo do chamador.
+        transacao_propria = not conn.in_transaction
+        if transacao_propria:
+            conn.execute("BEGIN IMMEDIATE")
+
+        movimento = _aplicar_movimento(
+            cursor,
+            produto_id,
+            tipo,
+            quantidade,
+            usuario_id=usuario_id,
+            observacao=observacao,
+            venda_id=venda_id,
+            classificacao=classificacao,
+        )
+        if transacao_propria:
+            conn.commit()
+        _publicar_evento(
+            conn, transacao_propria, "movimento", movimento_ids=[movimento["id"]]
         )
-        produto = cursor.fetchone()
 
-        if not produto:
-            raise ValueError(f"Produto com ID {produto_id} não encontrado.")
+        logger.info(
+            "Movimento de estoque ID %s registrado: %s, Produto ID %s (%s), "
+            "Qtd: %s, Estoque: %s -> %s, Usuário ID: %s",
+            movimento["id"],
+            tipo,
+            produto_id,
+            movimento["produto_nome"],
+            movimento["quantidade_movimentada"],
+            movimento["estoque_anterior"],
+            movimento["estoque_atual"],
+            usuario_id,
+        )
 
-        estoque_anterior = produto["estoque"]
-        quantidade_movimentada = 0
+        return movimento
 
-        if tipo == "entrada":
-            estoque_novo = estoque_anterior + quantidade
-            quantidade_movimentada = quantidade
-        elif tipo == "saida" or tipo == "venda":
-            if estoque_anterior < quantidade:
-                raise ValueError(
-                    f"Estoque insuficiente para '{produto['nome']}'. Disponível: {estoque_anterior}, Solicitado: {quantidade}."
-                )
-            estoque_novo = estoque_anterior - quantidade
-            quantidade_movimentada = -quantidade
-        elif tipo == "ajuste":
-            estoque_novo = quantidade
-            quantidade_movimentada = estoque_novo - estoque_anterior
-        else:
+    except (ValueError, sqlite3.Error) as e:
+        if conn and transacao_propria:
+            conn.rollback()
+        logger.error(
+            "Erro ao registrar movimento de estoque para produto ID %s: %s",
+            produto_id,
+            e,
+            exc_info=True,
+        )
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+LIMITE_LOTE_MOVIMENTOS = 1000
+TIPOS_MOVIMENTO_LOTE = ("entrada", "saida")
 
-            raise ValueError(f"Tipo de movimento desconhecido: {tipo}")
 
+def _consultar_produtos_por_id(cursor, produto_ids, tamanho_bloco=500):
+    """Busca id, nome e estoque de vários produtos com consultas WHERE id IN (...)."""
+    produtos = {}
+    produto_ids = list(produto_ids)
+    for inicio in range(0, len(produto_ids), tamanho_bloco):
+        bloco = produto_ids[inicio: inicio + tamanho_bloco]
+        placeholders = ",".join(["?"] * len(bloco))
         cursor.execute(
-            "UPDATE produto SET estoque = ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
-            (estoque_novo, produto_id),
+            f"SELECT id, nome, estoque FROM produto WHERE id IN ({placeholders})",
+            bloco,
         )
+        for row in cursor.fetchall():
+            produtos[row["id"]] = row
+    return produtos
 
-        db_mov_quantidade = (
-            quantidade_movimentada
-            if tipo == "ajuste"
-            else (quantidade if tipo == "entrada" else -quantidade)
-        )
 
-        cursor.execute(
-            """
-            INSERT INTO estoque_movimentacao
-            (produto_id, usuario_id, tipo, quantidade, estoque_anterior, estoque_atual, observacao, venda_id, data_movimento, classificacao)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
-            """,
+@repetir_se_ocupado
+def registrar_movimentos_lote(movimentos, usuario_id=None, atomico=True):
+    """
+    Registra um lote de entradas/saídas em uma única transação.
+
+    Os saldos de todos os produtos do lote são lidos com uma consulta
+    WHERE id IN (...) sob BEGIN IMMEDIATE; os movimentos são aplicados em
+    memória, na ordem recebida, e gravados com executemany e um único
+    commit.
+
+    Args:
+        movimentos (list): Itens com produto_id, tipo ('entrada' ou 'saida'),
+            quantidade e, opcionalmente, observacao e classificacao.
+        usuario_id (int, opcional): Usuário responsável pelo lote.
+        atomico (bool): Se True, qualquer item inválido cancela o lote
+            inteiro; se False, apenas os itens inválidos são descartados.
+
+    Returns:
+        dict: {"aplicados", "rejeitados", "resultados"}, com um resultado por
+        item, na mesma ordem da entrada.
+
+    Raises:
+        ValueError: Se o lote estiver vazio ou exceder LIMITE_LOTE_MOVIMENTOS.
+        sqlite3.Error: Em caso de erro no banco de dados.
+    """
+    if not movimentos or not isinstance(movimentos, list):
+        raise ValueError("Lista de movimentos é obrigatória.")
+    if len(movimentos) > LIMITE_LOTE_MOVIMENTOS:
+        raise ValueError(
+            f"O lote excede o limite de {LIMITE_LOTE_MOVIMENTOS} movimentos."
+        )
+
+    resultados = []
+    normalizados = []
+    for indice, item in enumerate(movimentos):
+        resultado = {"indice": indice, "status": "erro"}
+        resultados.append(resultado)
+        if not isinstance(item, dict):
+            resultado["erro"] = "Movimento inválido."
+            continue
+
+        produto_id = item.get("produto_id")
+        tipo = item.get("tipo")
+        resultado.update({"produto_id": produto_id, "tipo": tipo})
+        try:
+            produto_id = int(produto_id)
+            resultado["produto_id"] = produto_id
+        except (ValueError, TypeError):
+            resultado["erro"] = "ID do produto é obrigatório."
+            continue
+        if tipo not in TIPOS_MOVIMENTO_LOTE:
+            resultado["erro"] = "Tipo de movimento inválido. Use 'entrada' ou 'saida'."
+            continue
+        try:
+            quantidade = int(item.get("quantidade"))
+            if quantidade <= 0:
+                raise ValueError
+        except (ValueError, TypeError):
+            resultado["erro"] = "Quantidade inválida. Deve ser um número inteiro positivo."
+            continue
+
+        resultado["quantidade"] = quantidade
+        normalizados.append(
             (
+                resultado,
                 produto_id,
-                usuario_id,
                 tipo,
-                db_mov_quantidade,
-                estoque_anterior,
-                estoque_novo,
-                observacao,
-                venda_id,
-                classificacao,
-            ),
-        )
-        movimento_id = cursor.lastrowid
-        conn.commit()
-
-        logger.info(
-            f"Movimento de estoque ID {movimento_id} registrado: {tipo}, Produto ID {produto_id} ({produto['nome']}), "
-            f"Qtd: {db_mov_quantidade}, Estoque: {estoque_anterior} -> {estoque_novo}, Usuário ID: {usuario_id}"
+                quantidade,
+                item.get("observacao")
+                or ("Entrada em lote" if tipo == "entrada" else "Saída em lote"),
+                item.get("classificacao"),
+            )
         )
 
+    def _contagem():
+        aplicados = sum(1 for r in resultados if r["status"] == "ok")
         return {
-            "id": movimento_id,
-            "produto_id": produto_id,
-            "produto_nome": produto["nome"],
-            "tipo": tipo,
-            "quantidade_movimentada": db_mov_quantidade,
-            "estoque_anterior": estoque_anterior,
-            "estoque_atual": estoque_novo,
-            "usuario_id": usuario_id,
-            "observacao": observacao,
-            "data_movimento": datetime.datetime.now().isoformat(),
+            "aplicados": aplicados,
+            "rejeitados": len(resultados) - aplicados,
+            "resultados": resultados,
         }
 
-    except (ValueError, sqlite3.Error) as e:
-        if conn:
+    if atomico and len(normalizados) != len(movimentos):
+        for resultado, *_ in normalizados:
+            resultado["erro"] = "Lote cancelado: há movimentos inválidos."
+        return _contagem()
+
+    conn = None
+    transacao_propria = False
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+
+        transacao_propria = not conn.in_transaction
+        if transacao_propria:
+            conn.execute("BEGIN IMMEDIATE")
+
+        produtos = _consultar_produtos_por_id(
+            cursor, {n[1] for n in normalizados})
+        saldos = {pid: row["estoque"] for pid, row in produtos.items()}
+
+        aceitos = []
+        for resultado, produto_id, tipo, quantidade, obs, classificacao in normalizados:
+            if produto_id not in produtos:
+                resultado["erro"] = f"Produto com ID {produto_id} não encontrado."
+                continue
+            estoque_anterior = saldos[produto_id]
+            if tipo == "saida" and estoque_anterior < quantidade:
+                resultado["erro"] = (
+                    f"Estoque insuficiente para '{produtos[produto_id]['nome']}'. "
+                    f"Disponível: {estoque_anterior}, Solicitado: {quantidade}."
+                )
+                continue
+            delta = quantidade if tipo == "entrada" else -quantidade
+            saldos[produto_id] = estoque_anterior + delta
+            resultado.update(
+                {
+                    "produto_nome": produtos[produto_id]["nome"],
+                    "quantidade_movimentada": delta,
+                    "estoque_anterior": estoque_anterior,
+                    "estoque_atual": saldos[produto_id],
+                }
+            )
+            aceitos.append(
+                (
+                    resultado,
+                    (
+                        produto_id,
+                        usuario_id,
+                        tipo,
+                        delta,
+                        estoque_anterior,
+                        saldos[produto_id],
+                        obs,
+                        None,
+                        classificacao,
+                    ),
+                )
+            )
+
+        if not aceitos or (atomico and len(aceitos) != len(movimentos)):
+            if transacao_propria:
+                conn.rollback()
+            for resultado, _ in aceitos:
+                for chave in ("quantidade_movimentada", "estoque_anterior", "estoque_atual"):
+                    resultado.pop(chave, None)
+                resultado["erro"] = "Lote cancelado: há movimentos inválidos."
+            return _contagem()
+
+        deltas = {}
+        for _, linha in aceitos:
+            deltas[linha[0]] = deltas.get(linha[0], 0) + linha[3]
+        cursor.executemany(
+            "UPDATE produto SET estoque = estoque + ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
+            [(delta, produto_id) for produto_id, delta in deltas.items()],
+        )
+        _inserir_movimentos(cursor, [linha for _, linha in aceitos])
+
+        # Sob o lock de escrita os ids AUTOINCREMENT do lote são contíguos.
+        cursor.execute(
+            "SELECT id FROM estoque_movimentacao ORDER BY id DESC LIMIT ?",
+            (len(aceitos),),
+        )
+        movimento_ids = sorted(row["id"] for row in cursor.fetchall())
+
+        if transacao_propria:
+            conn.commit()
+
+        for (resultado, _), movimento_id in zip(aceitos, movimento_ids):
+            resultado["status"] = "ok"
+            resultado["movimento_id"] = movimento_id
+        _publicar_evento(
+            conn, transacao_propria, "movimento", movimento_ids=movimento_ids
+        )
+
+        logger.info(
+            "Lote de movimentos registrado: %d aplicados, %d rejeitados, Usuário ID: %s",
+            len(aceitos),
+            len(resultados) - len(aceitos),
+            usuario_id,
+        )
+        return _contagem()
+
+    except sqlite3.Error as e:
+        if conn and transacao_propria and conn.in_transaction:
             conn.rollback()
         logger.error(
-            f"Erro ao registrar movimento de estoque para produto ID {produto_id}: {e}",
-            exc_info=True,
-        )
+            "Erro ao registrar lote de movimentos: %s", e, exc_info=True)
         raise
     finally:
         if conn:
             conn.close()
 
 
+# Pesos do bm25 na ordem das colunas de produto_busca:
+# codigo, nome, descricao, categoria, fornecedor.
+PESOS_BUSCA_PRODUTOS = "10.0, 5.0, 1.0, 2.0, 2.0"
+
+
+def _expressao_busca_fts(termo):
+    """
+    Converte o termo digitado em uma expressão MATCH do FTS5: cada palavra
+    vira um prefixo entre aspas ("cad"*), combinadas com AND. Aspas e
+    operadores do usuário não chegam ao FTS5, evitando erros de sintaxe.
+
+    Returns:
+        str | None: A expressão, ou None se o termo não tiver palavras.
+    """
+    palavras = re.findall(r"\w+", termo)
+    if not palavras:
+        return None
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+
+# Colunas aceitas em `ordenar_por`. Todas têm índice (migração 4); como o
+# índice do SQLite termina no rowid, (coluna, p.id) é lido em ordem sem sort.
+COLUNAS_ORDENACAO_PRODUTOS = [
+    "p.nome",
+    "p.preco",
+    "p.estoque",
+    "p.data_criacao",
+]
+
+# Totais das buscas em modo cursor ficam em cache por alguns segundos: a
+# contagem percorre todas as linhas do filtro e não precisa ser exata a cada
+# página.
+TOTAL_PRODUTOS_CACHE_TTL = float(os.environ.get("PRODUTOS_TOTAL_CACHE_TTL", 30))
+TOTAL_PRODUTOS_CACHE_MAXIMO = 256
+_cache_totais_produtos = {}
+_cache_totais_lock = threading.Lock()
+
+
+def codificar_cursor(dados):
+    """Gera um cursor de paginação opaco (base64 de JSON) a partir de um dict."""
+    return base64.urlsafe_b64encode(
+        json.dumps(dados, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(texto):
+    """
+    Decodifica um cursor gerado por codificar_cursor.
+
+    Raises:
+        ValueError: Se o cursor estiver malformado.
+    """
+    try:
+        preenchimento = "=" * (-len(texto) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(texto + preenchimento))
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Cursor de paginação inválido.")
+    if not isinstance(dados, dict):
+        raise ValueError("Cursor de paginação inválido.")
+    return dados
+
+
+def _decodificar_cursor_produtos(texto):
+    dados = decodificar_cursor(texto)
+    try:
+        ordenar_por, direcao = dados["o"], dados["d"]
+        valor, produto_id = dados["v"], int(dados["id"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Cursor de paginação inválido.")
+    if ordenar_por not in COLUNAS_ORDENACAO_PRODUTOS or direcao not in ("ASC", "DESC"):
+        raise ValueError("Cursor de paginação inválido.")
+    if valor is not None and not isinstance(valor, (str, int, float)):
+        raise ValueError("Cursor de paginação inválido.")
+    return ordenar_por, direcao, valor, produto_id
+
+
+def _condicao_apos_cursor(coluna, direcao, valor, produto_id):
+    """
+    Condição WHERE que busca as linhas posteriores a (valor, produto_id) na
+    ordem `coluna direcao, p.id direcao`. NULLs vêm primeiro em ASC e por
+    último em DESC, como no ORDER BY do SQLite.
+    """
+    if direcao == "ASC":
+        if valor is None:
+            return f"(({coluna} IS NULL AND p.id > ?) OR {coluna} IS NOT NULL)", [produto_id]
+        return f"({coluna}, p.id) > (?, ?)", [valor, produto_id]
+    if valor is None:
+        return f"({coluna} IS NULL AND p.id < ?)", [produto_id]
+    return f"(({coluna}, p.id) < (?, ?) OR {coluna} IS NULL)", [valor, produto_id]
+
+
+def _contar_produtos_com_cache(cursor, sql, params):
+    chave = (sql, tuple(params))
+    agora = time.monotonic()
+    with _cache_totais_lock:
+        item = _cache_totais_produtos.get(chave)
+        if item and agora - item[1] < TOTAL_PRODUTOS_CACHE_TTL:
+            return item[0]
+
+    cursor.execute(sql, params)
+    total = cursor.fetchone()[0]
+
+    with _cache_totais_lock:
+        if len(_cache_totais_produtos) >= TOTAL_PRODUTOS_CACHE_MAXIMO:
+            mais_antiga = min(
+                _cache_totais_produtos, key=lambda k: _cache_totais_produtos[k][1]
+            )
+            del _cache_totais_produtos[mais_antiga]
+        _cache_totais_produtos[chave] = (total, agora)
+    return total
+
+
+def limpar_cache_totais_produtos():
+    """Descarta os totais em cache (ex.: após uma importação de produtos)."""
+    with _cache_totais_lock:
+        _cache_totais_produtos.clear()
+
+
 def buscar_produtos(
     termo=None,
     categoria_id=None,
@@ -513,12 +1888,38 @@ def buscar_produtos(
     incluir_inativos=False,
     page=1,
     per_page=10,
-    ordenar_por="p.nome",
+    ordenar_por=None,
     direcao="ASC",
+    cursor_pagina=None,
+    incluir_total=True,
 ):
     """
     Busca produtos com base em diferentes filtros, com ordenação e paginação.
+
+    Quando `termo` é informado, a busca usa o índice FTS5 `produto_busca`
+    (código, nome, descrição, categoria e fornecedor), com cada palavra do
+    termo tratada como prefixo. Sem `ordenar_por`, os resultados da busca
+    vêm ordenados por relevância (bm25); sem termo, por nome.
+
+    Paginação:
+        - Por página (padrão): `page`/`per_page` com LIMIT/OFFSET e total exato.
+        - Por cursor: quando `cursor_pagina` não é None ("" = primeira página).
+          A consulta continua a partir da última linha da página anterior
+          (keyset em `ordenar_por, p.id`), com custo constante em qualquer
+          profundidade. O cursor carrega a própria ordenação, que prevalece
+          sobre `ordenar_por`/`direcao`. Relevância não é paginável por
+          cursor; nesse modo a ordenação padrão é por nome. O total só é
+          calculado com `incluir_total=True` e fica em cache por
+          TOTAL_PRODUTOS_CACHE_TTL segundos.
+
+    Raises:
+        ValueError: Se `cursor_pagina` for inválido.
     """
+    modo_cursor = cursor_pagina is not None
+    apos = None
+    if modo_cursor and cursor_pagina:
+        apos = _decodificar_cursor_produtos(cursor_pagina)
+
     conn = None
     try:
         if isinstance(estoque_baixo, str):
@@ -534,7 +1935,8 @@ def buscar_produtos(
                 p.id, p.codigo, p.nome, p.descricao, p.preco, p.preco_compra,
                 p.estoque, p.estoque_minimo, p.ativo, p.imagem_url,
                 p.categoria_id, c.nome as categoria_nome,
-                p.fornecedor_id, f.nome as fornecedor_nome
+                p.fornecedor_id, f.nome as fornecedor_nome,
+                p.data_criacao
             FROM produto p
             LEFT JOIN categoria c ON p.categoria_id = c.id
             LEFT JOIN fornecedores f ON p.fornecedor_id = f.id
@@ -544,13 +1946,21 @@ def buscar_produtos(
         where_clauses = []
         params = []
 
+        expressao_fts = _expressao_busca_fts(termo) if termo else None
+        if expressao_fts:
+            juncao_fts = " JOIN produto_busca ON produto_busca.rowid = p.id"
+            query_select += juncao_fts
+            query_count += juncao_fts
+            where_clauses.append("produto_busca MATCH ?")
+            params.append(expressao_fts)
+
         if incluir_inativos:
             where_clauses.append("COALESCE(p.ativo, 1) = 0")
         else:
             where_clauses.append("COALESCE(p.ativo, 1) = 1")
 
-        if termo:
-
+        if termo and not expressao_fts:
+            # Termo sem nenhuma palavra indexável (ex.: só pontuação).
             where_clauses.append(
                 "(p.codigo LIKE ? OR p.nome LIKE ? OR p.descricao LIKE ?)"
             )
@@ -569,23 +1979,81 @@ def buscar_produtos(
         if where_clauses:
             where_sql = " WHERE " + " AND ".join(where_clauses)
 
+        direcao_segura = "DESC" if (direcao or "").upper() == "DESC" else "ASC"
+
+        if modo_cursor:
+            if apos:
+                ordenar_por, direcao_segura, valor_apos, id_apos = apos
+            elif ordenar_por not in COLUNAS_ORDENACAO_PRODUTOS:
+                ordenar_por = "p.nome"
+
+            total_items = None
+            if incluir_total:
+                total_items = _contar_produtos_com_cache(
+                    cursor, query_count + where_sql, params
+                )
+
+            params_pagina = list(params)
+            if apos:
+                condicao, params_condicao = _condicao_apos_cursor(
+                    ordenar_por, direcao_segura, valor_apos, id_apos
+                )
+                where_sql = (where_sql + " AND " if where_sql else " WHERE ") + condicao
+                params_pagina.extend(params_condicao)
+
+            final_query = (
+                query_select
+                + where_sql
+                + f" ORDER BY {ordenar_por} {direcao_segura}, p.id {direcao_segura}"
+                + " LIMIT ?"
+            )
+            cursor.execute(final_query, params_pagina + [per_page + 1])
+            produtos_list = [dict(row) for row in cursor.fetchall()]
+
+            tem_mais = len(produtos_list) > per_page
+            produtos_list = produtos_list[:per_page]
+            proximo_cursor = None
+            if tem_mais:
+                ultimo = produtos_list[-1]
+                coluna = ordenar_por.split(".", 1)[1]
+                proximo_cursor = codificar_cursor(
+                    {
+                        "o": ordenar_por,
+                        "d": direcao_segura,
+                        "v": ultimo[coluna],
+                        "id": ultimo["id"],
+                    }
+                )
+
+            resultado = {
+                "produtos": produtos_list,
+                "per_page": per_page,
+                "ordenar_por": ordenar_por,
+                "direcao": direcao_segura,
+                "tem_mais": tem_mais,
+                "proximo_cursor": proximo_cursor,
+            }
+            if total_items is not None:
+                resultado["total"] = total_items
+            return resultado
+
         cursor.execute(query_count + where_sql, params)
         total_items = cursor.fetchone()[0]
         total_pages = (total_items + per_page -
                        1) // per_page if per_page > 0 else 1
 
-        allowed_sort_columns = [
-            "p.nome",
-            "p.preco",
-            "p.estoque",
-            "p.data_criacao",
-        ]
-        if ordenar_por not in allowed_sort_columns:
-            ordenar_por = "p.nome"
-
-        direcao_segura = "DESC" if direcao.upper() == "DESC" else "ASC"
+        if ordenar_por is None and expressao_fts:
+            ordenar_por = "relevancia"
 
-        order_by_sql = f" ORDER BY {ordenar_por} {direcao_segura}"
+        if ordenar_por == "relevancia" and expressao_fts:
+            # bm25 é menor para os mais relevantes; código e nome pesam mais.
+            order_by_sql = (
+                f" ORDER BY bm25(produto_busca, {PESOS_BUSCA_PRODUTOS}), p.nome ASC"
+            )
+        else:
+            if ordenar_por not in COLUNAS_ORDENACAO_PRODUTOS:
+                ordenar_por = "p.nome"
+            order_by_sql = f" ORDER BY {ordenar_por} {direcao_segura}"
 
         limit_offset_sql = " LIMIT ? OFFSET ?"
         pagination_params = [per_page, (page - 1) * per_page]
@@ -691,56 +2159,445 @@ def obter_dados_movimentacao_grafico(dias=30):
             conn.close()
 
 
-def adicionar_venda(
-    cliente_nome, itens, usuario_id, desconto=0.0, forma_pagamento=None, observacao=None
-):
+def _inserir_movimentos(cursor, movimentos):
+    """
+    Insere linhas em estoque_movimentacao usando a transação do cursor.
+
+    Cada item de `movimentos` é uma tupla na ordem de SQL_INSERT_MOVIMENTO:
+    (produto_id, usuario_id, tipo, quantidade, estoque_anterior,
+    estoque_atual, observacao, venda_id, classificacao).
     """
-    Registra uma nova venda com múltiplos itens, incluindo transação.
+    cursor.executemany(SQL_INSERT_MOVIMENTO, movimentos)
+    _atualizar_agregados_movimentos(cursor, movimentos)
+
+
+def _atualizar_agregados_movimentos(cursor, movimentos):
+    """
+    Soma `movimentos` (tuplas de SQL_INSERT_MOVIMENTO) às tabelas de
+    AGREGADOS_MOVIMENTOS, na mesma transação do ledger. Os movimentos são
+    agregados em memória antes do upsert, um por chave.
+    """
+    vendas = {}
+    classificacoes = {}
+    for produto_id, usuario_id, tipo, quantidade, *_, classificacao in movimentos:
+        if tipo in ("entrada", "saida", "venda"):
+            chave = ("entrada" if tipo == "entrada" else "saida", classificacao or "outro")
+            classificacoes[chave] = classificacoes.get(chave, 0) + abs(quantidade)
+
+        if tipo == "venda" or (tipo == "saida" and classificacao == "venda"):
+            vendida, devolvida = abs(quantidade), 0
+        elif tipo == "entrada" and classificacao == "devolucao":
+            vendida, devolvida = 0, abs(quantidade)
+        else:
+            continue
+        chave = (produto_id, usuario_id or 0)
+        anterior = vendas.get(chave, (0, 0))
+        vendas[chave] = (anterior[0] + vendida, anterior[1] + devolvida)
+
+    if vendas:
+        cursor.executemany(
+            SQL_ACUMULAR_VENDAS_DIARIAS,
+            [chave + totais for chave, totais in vendas.items()],
+        )
+    if classificacoes:
+        cursor.executemany(
+            SQL_ACUMULAR_MOVIMENTOS_CLASSIFICACAO,
+            [chave + (total,) for chave, total in classificacoes.items()],
+        )
+
+
+def reconstruir_agregados(tabelas=None):
+    """
+    Recalcula as tabelas de AGREGADOS_MOVIMENTOS a partir de
+    estoque_movimentacao, em uma única transação (carga inicial ou correção
+    após importações diretas no banco).
+
+    Args:
+        tabelas: Nomes das tabelas a recalcular (padrão: todas).
+
+    Returns:
+        dict: Linhas geradas por tabela e duração em ms.
     """
+    tabelas = list(tabelas or AGREGADOS_MOVIMENTOS)
+    desconhecidas = [t for t in tabelas if t not in AGREGADOS_MOVIMENTOS]
+    if desconhecidas:
+        raise ValueError(f"Agregado desconhecido: {', '.join(desconhecidas)}")
+
+    inicio = time.perf_counter()
     conn = None
     try:
         conn = get_db()
         cursor = conn.cursor()
-        conn.execute("BEGIN TRANSACTION")
+        conn.execute("BEGIN IMMEDIATE")
+        linhas = {}
+        for tabela in tabelas:
+            cursor.execute(f"DELETE FROM {tabela}")
+            cursor.execute(AGREGADOS_MOVIMENTOS[tabela])
+            linhas[tabela] = cursor.rowcount
+        conn.commit()
+        duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(f"Agregados reconstruídos em {duracao_ms} ms: {linhas}")
+        return {"linhas": linhas, "duracao_ms": duracao_ms}
+    except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro ao reconstruir agregados: {e}", exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
 
-        codigo_venda = f"V{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{os.urandom(2).hex().upper()}"
-        data_venda_iso = datetime.datetime.now().isoformat()
 
-        valor_total_bruto = 0.0
+def _regravar_contadores_dashboard(cursor):
+    """Regrava os contadores do dashboard e vendas_por_dia; retorna os dias."""
+    colunas = ", ".join(COLUNAS_CONTADORES_DASHBOARD)
+    cursor.execute(
+        f"INSERT OR REPLACE INTO dashboard_contadores (id, {colunas}) "
+        f"SELECT 1, {colunas} FROM ({SQL_RECALCULAR_CONTADORES_DASHBOARD})"
+    )
+    cursor.execute("DELETE FROM vendas_por_dia")
+    cursor.execute(SQL_RECONSTRUIR_VENDAS_POR_DIA)
+    return cursor.rowcount
 
-        for item_data in itens:
-            if not all(
-                k in item_data for k in ("produto_id", "quantidade", "preco_unitario")
-            ):
-                raise ValueError(
-                    "Dados do item incompletos (produto_id, quantidade, preco_unitario)."
-                )
-            if (
-                not isinstance(item_data["quantidade"], (int, float))
-                or item_data["quantidade"] <= 0
-            ):
-                raise ValueError(
-                    f"Quantidade inválida para produto ID {item_data['produto_id']}."
+
+def reconstruir_contadores_dashboard():
+    """
+    Recalcula do zero os contadores do dashboard e as vendas por dia, sem
+    compará-los com os valores atuais (carga com os gatilhos suspensos). Ao
+    contrário de verificar_contadores_dashboard(corrigir=True), não registra
+    aviso: aqui a diferença é esperada, não um desvio dos gatilhos.
+
+    Returns:
+        dict: Dias gravados em vendas_por_dia e duração em ms.
+    """
+    inicio = time.perf_counter()
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        conn.execute("BEGIN IMMEDIATE")
+        dias = _regravar_contadores_dashboard(cursor)
+        conn.commit()
+        duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(f"Contadores do dashboard reconstruídos em {duracao_ms} ms.")
+        return {"dias_vendas": dias, "duracao_ms": duracao_ms}
+    except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
+        logger.error(
+            f"Erro ao reconstruir contadores do dashboard: {e}", exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def verificar_contadores_dashboard(corrigir=False, tolerancia_valor=0.01):
+    """
+    Recalcula do zero os contadores do dashboard e as vendas por dia e os
+    compara com as tabelas mantidas pelos gatilhos.
+
+    Args:
+        corrigir: Se True, grava os valores recalculados quando houver
+            divergência.
+        tolerancia_valor: Diferença aceita nos valores em reais (somas de
+            ponto flutuante acumulam arredondamento).
+
+    Returns:
+        dict: {"divergencias": [...], "corrigido": bool}. Cada divergência
+        tem "tabela", "chave", "armazenado" e "recalculado".
+    """
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        conn.execute("BEGIN IMMEDIATE" if corrigir else "BEGIN")
+        divergencias = []
+
+        def diverge(armazenado, recalculado):
+            if isinstance(armazenado, float) or isinstance(recalculado, float):
+                return abs((armazenado or 0) - (recalculado or 0)) > tolerancia_valor
+            return armazenado != recalculado
+
+        cursor.execute(
+            f"SELECT {', '.join(COLUNAS_CONTADORES_DASHBOARD)} "
+            "FROM dashboard_contadores WHERE id = 1"
+        )
+        linha = cursor.fetchone()
+        armazenados = dict(linha) if linha else {}
+        cursor.execute(SQL_RECALCULAR_CONTADORES_DASHBOARD)
+        recalculados = dict(cursor.fetchone())
+        for coluna in COLUNAS_CONTADORES_DASHBOARD:
+            if diverge(armazenados.get(coluna), recalculados[coluna]):
+                divergencias.append(
+                    {
+                        "tabela": "dashboard_contadores",
+                        "chave": coluna,
+                        "armazenado": armazenados.get(coluna),
+                        "recalculado": recalculados[coluna],
+                    }
                 )
-            if (
-                not isinstance(item_data["preco_unitario"], (int, float))
-                or item_data["preco_unitario"] < 0
+
+        cursor.execute("SELECT dia, contagem, valor FROM vendas_por_dia")
+        dias_armazenados = {row["dia"]: (row["contagem"], row["valor"]) for row in cursor.fetchall()}
+        cursor.execute(
+            """
+            SELECT date(data_venda) AS dia, COUNT(id) AS contagem,
+                   COALESCE(SUM(valor_final), 0) AS valor
+            FROM venda WHERE data_venda IS NOT NULL
+            GROUP BY date(data_venda)
+            """
+        )
+        dias_recalculados = {row["dia"]: (row["contagem"], row["valor"]) for row in cursor.fetchall()}
+        for dia in sorted(set(dias_armazenados) | set(dias_recalculados)):
+            armazenado = dias_armazenados.get(dia, (0, 0.0))
+            recalculado = dias_recalculados.get(dia, (0, 0.0))
+            if armazenado[0] != recalculado[0] or diverge(
+                float(armazenado[1]), float(recalculado[1])
             ):
-                raise ValueError(
-                    f"Preço unitário inválido para produto ID {item_data['produto_id']}."
+                divergencias.append(
+                    {
+                        "tabela": "vendas_por_dia",
+                        "chave": dia,
+                        "armazenado": list(armazenado),
+                        "recalculado": list(recalculado),
+                    }
                 )
 
-            valor_total_bruto += item_data["quantidade"] * \
-                item_data["preco_unitario"]
+        corrigido = False
+        if corrigir and divergencias:
+            _regravar_contadores_dashboard(cursor)
+            corrigido = True
+        conn.commit()
 
+        if divergencias:
+            logger.warning(
+                f"{len(divergencias)} divergência(s) nos contadores do dashboard"
+                + (" (corrigidas)." if corrigido else ".")
+            )
+        return {"divergencias": divergencias, "corrigido": corrigido}
+    except sqlite3.Error as e:
+        if conn:
+            conn.rollback()
+        logger.error(
+            f"Erro ao verificar contadores do dashboard: {e}", exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+ORDENACOES_CONSULTAS_LENTAS = {
+    "total": "total_ms",
+    "maximo": "maximo_ms",
+    "quantidade": "quantidade",
+}
+
+
+def resumir_consultas_lentas(limite=20, ordenar_por="total"):
+    """
+    Agrupa o log de consultas lentas (arquivo atual e rotacionados) por SQL
+    normalizado.
+
+    Args:
+        limite (int): Quantidade de grupos retornados.
+        ordenar_por (str): 'total' (tempo somado), 'maximo' ou 'quantidade'.
+
+    Returns:
+        dict: {"limite_ms", "registros", "consultas": [...]}, cada consulta
+        com quantidade, total/média/máximo em ms, endpoints e a ocorrência
+        mais lenta (SQL, parâmetros e plano).
+
+    Raises:
+        ValueError: Se `ordenar_por` for inválido.
+    """
+    if ordenar_por not in ORDENACOES_CONSULTAS_LENTAS:
+        raise ValueError(
+            "Ordenação inválida. Use: " + ", ".join(ORDENACOES_CONSULTAS_LENTAS)
+        )
+
+    caminho = caminho_log_consultas_lentas()
+    arquivos = [caminho] + [f"{caminho}.{n}" for n in range(1, 100)]
+    grupos = {}
+    registros = 0
+    for arquivo in arquivos:
+        if not os.path.exists(arquivo):
+            if arquivo != caminho:
+                break
+            continue
+        with open(arquivo, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue
+                registros += 1
+                chave = registro.get("sql_normalizado") or registro.get("sql")
+                duracao = registro.get("duracao_ms", 0.0)
+                grupo = grupos.get(chave)
+                if grupo is None:
+                    grupo = grupos[chave] = {
+                        "sql_normalizado": chave,
+                        "quantidade": 0,
+                        "total_ms": 0.0,
+                        "maximo_ms": 0.0,
+                        "endpoints": {},
+                        "ultima_ocorrencia": None,
+                        "pior_ocorrencia": None,
+                    }
+                grupo["quantidade"] += 1
+                grupo["total_ms"] += duracao
+                endpoint = registro.get("endpoint")
+                grupo["endpoints"][endpoint] = grupo["endpoints"].get(endpoint, 0) + 1
+                if (grupo["ultima_ocorrencia"] or "") < registro.get("timestamp", ""):
+                    grupo["ultima_ocorrencia"] = registro.get("timestamp")
+                if duracao >= grupo["maximo_ms"]:
+                    grupo["maximo_ms"] = duracao
+                    grupo["pior_ocorrencia"] = {
+                        campo: registro.get(campo)
+                        for campo in (
+                            "timestamp",
+                            "endpoint",
+                            "sql",
+                            "parametros",
+                            "plano",
+                            "varreduras_completas",
+                        )
+                    }
+
+    consultas = sorted(
+        grupos.values(),
+        key=lambda g: g[ORDENACOES_CONSULTAS_LENTAS[ordenar_por]],
+        reverse=True,
+    )[:limite]
+    for grupo in consultas:
+        grupo["total_ms"] = round(grupo["total_ms"], 3)
+        grupo["media_ms"] = round(grupo["total_ms"] / grupo["quantidade"], 3)
+        grupo["endpoints"] = dict(
+            sorted(grupo["endpoints"].items(), key=lambda e: e[1], reverse=True)
+        )
+    return {
+        "limite_ms": SQL_LENTA_LIMITE_MS,
+        "registros": registros,
+        "consultas": consultas,
+    }
+
+
+def _normalizar_produto_id(produto_id):
+    if isinstance(produto_id, bool):
+        raise ValueError(f"ID de produto inválido: {produto_id!r}.")
+    if isinstance(produto_id, float) and produto_id.is_integer():
+        return int(produto_id)
+    if isinstance(produto_id, (int, str)):
+        try:
+            return int(produto_id)
+        except ValueError:
+            pass
+    raise ValueError(f"ID de produto inválido: {produto_id!r}.")
+
+
+def _validar_itens_venda(itens):
+    """Valida os itens de uma venda e retorna o valor total bruto."""
+    valor_total_bruto = 0.0
+    for item_data in itens:
+        if not isinstance(item_data, dict) or not all(
+            k in item_data for k in ("produto_id", "quantidade", "preco_unitario")
+        ):
+            raise ValueError(
+                "Dados do item incompletos (produto_id, quantidade, preco_unitario)."
+            )
+        # O id vem do JSON como número ou texto ("6"): normalizado para int
+        # antes de agregar as quantidades e casar com produto.id.
+        item_data["produto_id"] = _normalizar_produto_id(item_data["produto_id"])
         if (
-            not isinstance(desconto, (int, float))
-            or desconto < 0
-            or desconto > valor_total_bruto
+            not isinstance(item_data["quantidade"], int)
+            or isinstance(item_data["quantidade"], bool)
+            or item_data["quantidade"] <= 0
         ):
-            raise ValueError("Valor de desconto inválido.")
+            raise ValueError(
+                f"Quantidade inválida para produto ID {item_data['produto_id']}."
+            )
+        if (
+            not isinstance(item_data["preco_unitario"], (int, float))
+            or item_data["preco_unitario"] < 0
+        ):
+            raise ValueError(
+                f"Preço unitário inválido para produto ID {item_data['produto_id']}."
+            )
+
+        valor_total_bruto += item_data["quantidade"] * \
+            item_data["preco_unitario"]
+    return valor_total_bruto
+
+
+@repetir_se_ocupado
+def adicionar_venda(
+    cliente_nome, itens, usuario_id, desconto=0.0, forma_pagamento=None, observacao=None
+):
+    """
+    Registra uma nova venda com múltiplos itens em uma única transação.
+
+    Todo o trabalho usa a mesma conexão: o estoque de todos os produtos é
+    conferido com uma só consulta (WHERE id IN (...)), as baixas, os
+    movimentos e os itens são gravados em lote e há um único commit.
+    BEGIN IMMEDIATE reserva a escrita logo no início, então o estoque lido
+    na conferência não pode mudar antes das baixas.
+
+    Raises:
+        ValueError: Se os itens forem inválidos ou o estoque insuficiente.
+        sqlite3.Error: Em caso de erro no banco de dados.
+    """
+    if not itens or not isinstance(itens, list):
+        raise ValueError("Lista de itens é obrigatória.")
+
+    valor_total_bruto = _validar_itens_venda(itens)
+
+    if (
+        not isinstance(desconto, (int, float))
+        or desconto < 0
+        or desconto > valor_total_bruto
+    ):
+        raise ValueError("Valor de desconto inválido.")
+
+    valor_final_venda = valor_total_bruto - desconto
+
+    quantidade_por_produto = {}
+    for item_data in itens:
+        produto_id = item_data["produto_id"]
+        quantidade_por_produto[produto_id] = (
+            quantidade_por_produto.get(produto_id, 0) + item_data["quantidade"]
+        )
+
+    conn = None
+    transacao_propria = False
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+
+        transacao_propria = not conn.in_transaction
+        if transacao_propria:
+            conn.execute("BEGIN IMMEDIATE")
+
+        produto_ids = list(quantidade_por_produto.keys())
+        placeholders = ",".join(["?"] * len(produto_ids))
+        cursor.execute(
+            f"SELECT id, nome, estoque FROM produto WHERE id IN ({placeholders})",
+            produto_ids,
+        )
+        produtos = {row["id"]: row for row in cursor.fetchall()}
+
+        for produto_id, quantidade_total in quantidade_por_produto.items():
+            produto = produtos.get(produto_id)
+            if not produto:
+                raise ValueError(
+                    f"Produto com ID {produto_id} não encontrado.")
+            if produto["estoque"] < quantidade_total:
+                raise ValueError(
+                    f"Estoque insuficiente para '{produto['nome']}'. Disponível: {produto['estoque']}, Solicitado: {quantidade_total}."
+                )
 
-        valor_final_venda = valor_total_bruto - desconto
+        codigo_venda = f"V{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{os.urandom(2).hex().upper()}"
+        data_venda_iso = datetime.datetime.now().isoformat()
 
         cursor.execute(
             """
@@ -761,45 +2618,93 @@ def adicionar_venda(
         )
         venda_id = cursor.lastrowid
 
-        itens_processados = []
+        cursor.executemany(
+            "UPDATE produto SET estoque = estoque - ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
+            [
+                (quantidade_total, produto_id)
+                for produto_id, quantidade_total in quantidade_por_produto.items()
+            ],
+        )
+
+        estoque_corrente = {pid: row["estoque"]
+                            for pid, row in produtos.items()}
+        movimentos = []
+        linhas_itens = []
         for item_data in itens:
             produto_id = item_data["produto_id"]
             quantidade = item_data["quantidade"]
             preco_unitario = item_data["preco_unitario"]
-            subtotal = quantidade * preco_unitario
 
-            registrar_movimento(
-                produto_id=produto_id,
-                tipo="venda",
-                quantidade=quantidade,
-                usuario_id=usuario_id,
-                observacao=f"Venda Cód: {codigo_venda}",
-                venda_id=venda_id,
+            estoque_anterior = estoque_corrente[produto_id]
+            estoque_corrente[produto_id] = estoque_anterior - quantidade
+            movimentos.append(
+                (
+                    produto_id,
+                    usuario_id,
+                    "venda",
+                    -quantidade,
+                    estoque_anterior,
+                    estoque_corrente[produto_id],
+                    f"Venda Cód: {codigo_venda}",
+                    venda_id,
+                    None,
+                )
             )
-
-            cursor.execute(
-                """
-                INSERT INTO item_venda (venda_id, produto_id, quantidade, preco_unitario, subtotal)
-                VALUES (?, ?, ?, ?, ?)
-            """,
-                (venda_id, produto_id, quantidade, preco_unitario, subtotal),
+            linhas_itens.append(
+                (venda_id, produto_id, quantidade,
+                 preco_unitario, quantidade * preco_unitario)
             )
 
-            itens_processados.append(
-                {
-                    "item_venda_id": cursor.lastrowid,
-                    "produto_id": produto_id,
-                    "quantidade": quantidade,
-                    "preco_unitario": preco_unitario,
-                    "subtotal": subtotal,
-                }
-            )
+        _inserir_movimentos(cursor, movimentos)
+        cursor.executemany(
+            """
+            INSERT INTO item_venda (venda_id, produto_id, quantidade, preco_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            linhas_itens,
+        )
+        cursor.execute(
+            "SELECT id FROM item_venda WHERE venda_id = ? ORDER BY id", (venda_id,)
+        )
+        item_ids = [row["id"] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT id FROM estoque_movimentacao WHERE venda_id = ? ORDER BY id",
+            (venda_id,),
+        )
+        movimento_ids = [row["id"] for row in cursor.fetchall()]
 
-        conn.commit()
+        if transacao_propria:
+            conn.commit()
+        _publicar_evento(
+            conn,
+            transacao_propria,
+            "venda",
+            venda_id=venda_id,
+            codigo=codigo_venda,
+            cliente_nome=cliente_nome,
+            valor_final=valor_final_venda,
+            itens=len(itens),
+            movimento_ids=movimento_ids,
+        )
         logger.info(
-            f"Venda ID {venda_id} (Cód: {codigo_venda}) registrada com sucesso. Valor: {valor_final_venda}, Itens: {len(itens)}."
+            "Venda ID %s (Cód: %s) registrada com sucesso. Valor: %s, Itens: %d.",
+            venda_id,
+            codigo_venda,
+            valor_final_venda,
+            len(itens),
         )
 
+        itens_processados = [
+            {
+                "item_venda_id": item_id,
+                "produto_id": linha[1],
+                "quantidade": linha[2],
+                "preco_unitario": linha[3],
+                "subtotal": linha[4],
+            }
+            for item_id, linha in zip(item_ids, linhas_itens)
+        ]
+
         return {
             "venda_id": venda_id,
             "codigo": codigo_venda,
@@ -812,10 +2717,221 @@ def adicionar_venda(
         }
 
     except (ValueError, sqlite3.Error) as e:
+        if conn and transacao_propria and conn.in_transaction:
+            conn.rollback()
+        logger.error("Erro ao adicionar venda: %s", e, exc_info=True)
+        raise
+    finally:
         if conn:
+            conn.close()
+
+
+@repetir_se_ocupado
+def estornar_venda(venda_id, usuario_id=None):
+    """
+    Cancela uma venda: devolve os itens ao estoque com movimentos de entrada
+    e exclui a venda e seus itens, em uma única transação. O histórico de
+    movimentos é preservado; os movimentos da venda apenas deixam de
+    apontar para ela (a observação mantém o código).
+
+    Returns:
+        dict | None: {"venda_id", "codigo", "movimento_ids"}, ou None se a
+        venda não existir.
+
+    Raises:
+        ValueError: Se um movimento de estorno for inválido.
+        sqlite3.Error: Em caso de erro no banco de dados.
+    """
+    conn = None
+    transacao_propria = False
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+
+        transacao_propria = not conn.in_transaction
+        if transacao_propria:
+            conn.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("SELECT id, codigo FROM venda WHERE id = ?", (venda_id,))
+        venda = cursor.fetchone()
+        if not venda:
+            if transacao_propria:
+                conn.rollback()
+            return None
+
+        cursor.execute(
+            "SELECT produto_id, quantidade FROM item_venda WHERE venda_id = ?",
+            (venda_id,),
+        )
+        movimento_ids = []
+        for item in cursor.fetchall():
+            movimento = registrar_movimento(
+                produto_id=item["produto_id"],
+                tipo="entrada",
+                quantidade=item["quantidade"],
+                usuario_id=usuario_id,
+                observacao=f"Cancelamento da Venda Cód: {venda['codigo']}",
+            )
+            movimento_ids.append(movimento["id"])
+
+        cursor.execute(
+            "UPDATE estoque_movimentacao SET venda_id = NULL WHERE venda_id = ?",
+            (venda_id,),
+        )
+        cursor.execute("DELETE FROM item_venda WHERE venda_id = ?", (venda_id,))
+        cursor.execute("DELETE FROM venda WHERE id = ?", (venda_id,))
+
+        if transacao_propria:
+            conn.commit()
+        _publicar_evento(
+            conn,
+            transacao_propria,
+            "cancelamento",
+            venda_id=venda_id,
+            codigo=venda["codigo"],
+            movimento_ids=movimento_ids,
+        )
+        logger.info(
+            "Venda ID %s (Cód: %s) cancelada por usuário ID %s.",
+            venda_id,
+            venda["codigo"],
+            usuario_id,
+        )
+        return {"venda_id": venda_id, "codigo": venda["codigo"], "movimento_ids": movimento_ids}
+
+    except (ValueError, sqlite3.Error) as e:
+        if conn and transacao_propria and conn.in_transaction:
+            conn.rollback()
+        logger.error("Erro ao cancelar venda %s: %s", venda_id, e, exc_info=True)
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def _inverter_status(tabela, registro_id):
+    # Um único UPDATE ... RETURNING: lê e inverte o status sob o mesmo lock
+    # de escrita, sem a janela entre SELECT e UPDATE.
+    conn = None
+    transacao_propria = False
+    try:
+        conn = get_db()
+        transacao_propria = not conn.in_transaction
+        linha = conn.execute(
+            f"""
+            UPDATE {tabela}
+            SET ativo = CASE WHEN COALESCE(ativo, 1) THEN 0 ELSE 1 END,
+                ultima_atualizacao = CURRENT_TIMESTAMP
+            WHERE id = ?
+            RETURNING ativo
+            """,
+            (registro_id,),
+        ).fetchone()
+        if transacao_propria:
+            conn.commit()
+        return None if linha is None else bool(linha["ativo"])
+    except sqlite3.Error:
+        if conn and transacao_propria and conn.in_transaction:
             conn.rollback()
-        logger.error(f"Erro ao adicionar venda: {e}", exc_info=True)
         raise
     finally:
         if conn:
             conn.close()
+
+
+@repetir_se_ocupado
+def inverter_status_produto(produto_id):
+    """
+    Alterna o produto entre ativo e inativo.
+
+    Returns:
+        bool | None: O novo status, ou None se o produto não existir.
+    """
+    return _inverter_status("produto", produto_id)
+
+
+@repetir_se_ocupado
+def inverter_status_fornecedor(fornecedor_id):
+    """
+    Alterna o fornecedor entre ativo e inativo.
+
+    Returns:
+        bool | None: O novo status, ou None se o fornecedor não existir.
+    """
+    return _inverter_status("fornecedores", fornecedor_id)
+
+
+_TABELAS_CADASTRO = ("categoria", "produto", "fornecedores", "usuario")
+
+
+def _gravar_cadastro(tabela, sql, params):
+    # Um comando de escrita em uma tabela de cadastro, com commit próprio
+    # só se não houver transação do chamador (como em _inverter_status).
+    if tabela not in _TABELAS_CADASTRO:
+        raise ValueError(f"Tabela de cadastro inválida: {tabela}.")
+    conn = None
+    transacao_propria = False
+    try:
+        conn = get_db()
+        transacao_propria = not conn.in_transaction
+        cursor = conn.execute(sql, params)
+        if transacao_propria:
+            conn.commit()
+        return cursor
+    except sqlite3.Error:
+        if conn and transacao_propria and conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+@repetir_se_ocupado
+def inserir_registro(tabela, campos, carimbos=()):
+    """
+    Insere um registro em uma tabela de cadastro (categoria, produto,
+    fornecedores, usuario).
+
+    As views validam a requisição e mexem em arquivos; só o INSERT passa
+    por aqui, para que uma repetição por banco ocupado não refaça o resto.
+
+    Args:
+        tabela (str): Nome da tabela.
+        campos (dict): Valor de cada coluna.
+        carimbos (tuple): Colunas preenchidas com CURRENT_TIMESTAMP.
+
+    Returns:
+        int: O id do registro inserido.
+    """
+    colunas = list(campos) + list(carimbos)
+    valores = ["?"] * len(campos) + ["CURRENT_TIMESTAMP"] * len(carimbos)
+    sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(valores)})"
+    return _gravar_cadastro(tabela, sql, list(campos.values())).lastrowid
+
+
+@repetir_se_ocupado
+def atualizar_registro(tabela, registro_id, campos, carimbos=()):
+    """
+    Atualiza as colunas `campos` de um registro de cadastro.
+
+    Returns:
+        bool: True se o registro existia.
+    """
+    atribuicoes = [f"{coluna} = ?" for coluna in campos]
+    atribuicoes += [f"{coluna} = CURRENT_TIMESTAMP" for coluna in carimbos]
+    sql = f"UPDATE {tabela} SET {', '.join(atribuicoes)} WHERE id = ?"
+    params = list(campos.values()) + [registro_id]
+    return _gravar_cadastro(tabela, sql, params).rowcount > 0
+
+
+@repetir_se_ocupado
+def excluir_registro(tabela, registro_id):
+    """
+    Exclui um registro de cadastro.
+
+    Returns:
+        bool: True se o registro existia.
+    """
+    sql = f"DELETE FROM {tabela} WHERE id = ?"
+    return _gravar_cadastro(tabela, sql, (registro_id,)).rowcount > 0
@@ -0,0 +1,253 @@
+"""
+Escritor único: uma thread dona da conexão de escrita.
+
+Com o modo ativo (ESCRITOR_UNICO=1 ou app.config["ESCRITOR_UNICO"]), as
+requisições não abrem transação para registrar movimentos e vendas:
+enfileiram o comando e esperam o resultado em um Future. A thread
+escritora junta o que estiver na fila em um lote e o executa em uma única
+transação BEGIN IMMEDIATE ... COMMIT (group commit). Cada comando roda em
+um SAVEPOINT próprio, então um comando inválido (estoque insuficiente,
+produto inexistente) é desfeito sozinho sem derrubar os demais do lote.
+
+ESCRITOR_JANELA_MS é a janela de commit: depois do primeiro comando, a
+thread espera até esse tempo por outros antes de abrir a transação. Com 0
+(padrão) o lote é o que chegou enquanto o lote anterior era gravado, o que
+já agrupa os comandos em picos sem atrasar escritas isoladas.
+
+O escritor é por processo; entre processos a serialização continua sendo
+o lock de escrita do SQLite.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import database_utils
+import eventos
+import metricas
+
+
+logger = logging.getLogger(__name__)
+
+
+ESCRITOR_JANELA_MS = float(os.environ.get("ESCRITOR_JANELA_MS", 0))
+ESCRITOR_LOTE_MAXIMO = int(os.environ.get("ESCRITOR_LOTE_MAXIMO", 256))
+# Tempo máximo que uma requisição espera pelo resultado do seu comando.
+ESCRITOR_TIMEOUT = float(os.environ.get("ESCRITOR_TIMEOUT", 30))
+
+
+@database_utils.repetir_se_ocupado
+def _iniciar_lote(conn):
+    # Outros processos podem estar com o lock de escrita: repete o BEGIN
+    # antes de dar o lote inteiro como falho.
+    conn.execute("BEGIN IMMEDIATE")
+
+
+class _Comando:
+    __slots__ = ("funcao", "args", "kwargs", "futuro", "eventos")
+
+    def __init__(self, funcao, args, kwargs):
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.futuro = Future()
+        self.eventos = []
+
+
+class EscritorUnico:
+    """Executa funções de escrita em lotes, uma transação por lote."""
+
+    def __init__(self, janela_ms=ESCRITOR_JANELA_MS, lote_maximo=ESCRITOR_LOTE_MAXIMO):
+        self.janela = max(0.0, float(janela_ms)) / 1000
+        self.lote_maximo = max(1, int(lote_maximo))
+        self._fila = queue.Queue()
+        self._trava = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+        self._comandos = 0
+        self._lotes = 0
+        self._maior_lote = 0
+        self._falhas = 0
+        self._lotes_com_erro = 0
+        self._tempo_transacao_total = 0.0
+
+    def submeter(self, funcao, *args, **kwargs):
+        """Enfileira funcao(*args, **kwargs) e retorna o Future do resultado."""
+        comando = _Comando(funcao, args, kwargs)
+        with self._trava:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._executar, name="escritor-unico", daemon=True
+                )
+                self._thread.start()
+        self._fila.put(comando)
+        return comando.futuro
+
+    def executar(self, funcao, *args, **kwargs):
+        """
+        Submete o comando e espera o resultado. Exceções da função (ValueError,
+        sqlite3.Error) são relançadas na thread chamadora.
+
+        Raises:
+            sqlite3.OperationalError: Se o resultado não vier em
+                ESCRITOR_TIMEOUT segundos.
+        """
+        futuro = self.submeter(funcao, *args, **kwargs)
+        try:
+            return futuro.result(timeout=ESCRITOR_TIMEOUT)
+        except TimeoutError:
+            # O comando ainda pode ser gravado depois; quem chamou só
+            # deixa de esperar por ele.
+            raise sqlite3.OperationalError(
+                f"Escritor único sem resposta em {ESCRITOR_TIMEOUT:.0f}s."
+            )
+
+    def _coletar_lote(self):
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + self.janela
+        while len(lote) < self.lote_maximo:
+            restante = prazo - time.monotonic()
+            try:
+                if restante > 0:
+                    lote.append(self._fila.get(timeout=restante))
+                else:
+                    lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _conexao(self):
+        # Depois de configurar_pool() a conexão antiga aponta para o banco
+        # anterior, e depois de um fork pertence ao processo pai: troca pela
+        # do pool atual.
+        pool = database_utils.get_pool()
+        conn = self._conn
+        if conn is not None and (conn._pool is not pool or conn._pid != os.getpid()):
+            conn._vinculada_contexto = False
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = pool.obter()
+            # close() das funções de escrita não devolve a conexão ao pool.
+            conn._vinculada_contexto = True
+            self._conn = conn
+        return conn
+
+    def _executar(self):
+        while True:
+            lote = self._coletar_lote()
+            try:
+                conn = self._conexao()
+            except Exception as e:
+                for comando in lote:
+                    comando.futuro.set_exception(e)
+                logger.error("Escritor único sem conexão: %s", e)
+                continue
+            self._comandos += len(lote)
+            self._lotes += 1
+            self._maior_lote = max(self._maior_lote, len(lote))
+            inicio = time.perf_counter()
+            with database_utils.usar_conexao(conn):
+                self._executar_lote(conn, lote)
+            self._tempo_transacao_total += time.perf_counter() - inicio
+
+    def _executar_lote(self, conn, lote):
+        concluidos = []
+        rejeitados = 0
+        try:
+            _iniciar_lote(conn)
+            for comando in lote:
+                conn.eventos_pendentes = comando.eventos
+                conn.execute("SAVEPOINT comando")
+                try:
+                    resultado = comando.funcao(*comando.args, **comando.kwargs)
+                except Exception as e:
+                    if not conn.in_transaction:
+                        # O SQLite desfez a transação inteira (ex.: disco
+                        # cheio): os comandos anteriores do lote se perderam.
+                        raise
+                    conn.execute("ROLLBACK TO comando")
+                    conn.execute("RELEASE comando")
+                    rejeitados += 1
+                    self._falhas += 1
+                    comando.futuro.set_exception(e)
+                    continue
+                conn.execute("RELEASE comando")
+                concluidos.append((comando, resultado))
+            conn.commit()
+        except Exception as e:
+            self._lotes_com_erro += 1
+            logger.error(
+                "Erro no lote do escritor único (%d comandos): %s", len(lote), e
+            )
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            for comando in lote:
+                if not comando.futuro.done():
+                    comando.futuro.set_exception(e)
+            metricas.registrar_lote_escritor(0, rejeitados, len(lote) - rejeitados)
+            return
+        finally:
+            conn.eventos_pendentes = None
+
+        metricas.registrar_lote_escritor(len(concluidos), rejeitados, 0)
+
+        for comando, resultado in concluidos:
+            comando.futuro.set_result(resultado)
+            for tipo, dados in comando.eventos:
+                eventos.publicar_evento(tipo, **dados)
+
+    def estatisticas(self):
+        lotes = self._lotes
+        return {
+            "ativo": escritor_ativo(),
+            "janela_ms": self.janela * 1000,
+            "lote_maximo": self.lote_maximo,
+            "fila": self._fila.qsize(),
+            "comandos": self._comandos,
+            "lotes": lotes,
+            "comandos_por_lote": round(self._comandos / lotes, 2) if lotes else 0,
+            "maior_lote": self._maior_lote,
+            "comandos_rejeitados": self._falhas,
+            "lotes_com_erro": self._lotes_com_erro,
+            "tempo_medio_lote_ms": (
+                round(self._tempo_transacao_total / lotes * 1000, 3) if lotes else 0
+            ),
+        }
+
+
+escritor = EscritorUnico()
+_ativo = os.environ.get("ESCRITOR_UNICO", "").lower() in ("1", "true", "sim")
+
+
+def escritor_ativo():
+    return _ativo
+
+
+def executar_escrita(funcao, *args, **kwargs):
+    """
+    Executa uma função de escrita (registrar_movimento, adicionar_venda): pelo
+    escritor único, se o modo estiver ativo, ou diretamente na thread atual.
+    """
+    if _ativo:
+        return escritor.executar(funcao, *args, **kwargs)
+    return funcao(*args, **kwargs)
+
+
+def estatisticas_escritor():
+    """Contadores do escritor único deste processo."""
+    return escritor.estatisticas()
+
+
+def init_app(app):
+    """Ativa o escritor único se app.config["ESCRITOR_UNICO"] pedir."""
+    global _ativo
+    if "ESCRITOR_UNICO" in app.config:
+        _ativo = bool(app.config["ESCRITOR_UNICO"])
@@ -1,17 +1,28 @@
 from flask import Blueprint, request, jsonify, render_template, session, current_app
 from database_utils import (
     adicionar_venda,
+    codificar_cursor,
+    decodificar_cursor,
+    estornar_venda,
     get_db,
     registrar_movimento,
+    registrar_movimentos_lote,
     obter_dados_movimentacao_grafico,
+    somente_leitura,
 )
 from auth import (
     login_required,
     acesso_requerido,
 )
 from datetime import datetime
+from escritor import executar_escrita
 import sqlite3
 
+
+# Limite da contagem aproximada de movimentações: acima disso o histórico
+# informa apenas "mais de N".
+LIMITE_CONTAGEM_MOVIMENTACOES = 10000
+
 estoque_bp = Blueprint("estoque", __name__, url_prefix="/estoque")
 
 
@@ -44,7 +55,8 @@ def entrada_produto():
 
     try:
 
-        movimento_info = registrar_movimento(
+        movimento_info = executar_escrita(
+            registrar_movimento,
             produto_id=produto_id,
             tipo="entrada",
             quantidade=quantidade,
@@ -104,7 +116,8 @@ def saida_produto():
         )
 
     try:
-        movimento_info = registrar_movimento(
+        movimento_info = executar_escrita(
+            registrar_movimento,
             produto_id=produto_id,
             tipo="saida",
             quantidade=quantidade,
@@ -165,7 +178,8 @@ def ajuste_estoque():
 
     try:
 
-        movimento_info = registrar_movimento(
+        movimento_info = executar_escrita(
+            registrar_movimento,
             produto_id=produto_id,
             tipo="ajuste",
             quantidade=novo_estoque,
@@ -202,10 +216,94 @@ def ajuste_estoque():
         return jsonify({"error": "Erro inesperado ao processar a solicitação."}), 500
 
 
+@estoque_bp.route("/lote", methods=["POST"])
+@login_required
+@acesso_requerido(["admin", "gerente", "operador"])
+def movimentos_lote():
+    """
+    Registra um lote de entradas/saídas em uma única transação.
+
+    Corpo: {"movimentos": [...], "modo": "atomico" | "parcial"}. No modo
+    atômico (padrão) qualquer item inválido cancela o lote; no parcial os
+    itens válidos são gravados e os inválidos retornam com o erro.
+    """
+    data = request.json or {}
+    movimentos = data.get("movimentos")
+    modo = data.get("modo", "atomico")
+
+    if modo not in ("atomico", "parcial"):
+        return jsonify({"error": "Modo inválido. Use 'atomico' ou 'parcial'."}), 400
+    if not movimentos or not isinstance(movimentos, list):
+        return jsonify({"error": "Lista de movimentos é obrigatória."}), 400
+
+    if session.get("user_level") not in ["admin", "gerente"] and any(
+        isinstance(m, dict) and m.get("tipo") == "entrada" for m in movimentos
+    ):
+        return (
+            jsonify({"error": "Acesso não autorizado para registrar entradas."}),
+            403,
+        )
+
+    try:
+        resultado = executar_escrita(
+            registrar_movimentos_lote,
+            movimentos,
+            usuario_id=session.get("user_id"),
+            atomico=(modo == "atomico"),
+        )
+
+        if resultado["aplicados"] == 0:
+            return (
+                jsonify(
+                    {
+                        "error": "Nenhum movimento do lote foi registrado.",
+                        "modo": modo,
+                        **resultado,
+                    }
+                ),
+                400,
+            )
+
+        return (
+            jsonify(
+                {
+                    "message": "Lote registrado com sucesso!",
+                    "modo": modo,
+                    **resultado,
+                }
+            ),
+            201,
+        )
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        current_app.logger.error(
+            f"Erro de banco de dados ao registrar lote: {e}", exc_info=True
+        )
+        return jsonify({"error": "Erro no banco de dados ao registrar lote."}), 500
+    except Exception as e:
+        current_app.logger.error(
+            f"Erro inesperado ao registrar lote: {e}", exc_info=True
+        )
+        return jsonify({"error": "Erro inesperado ao processar a solicitação."}), 500
+
+
 @estoque_bp.route("/movimentacoes", methods=["GET"])
+@somente_leitura
 @login_required
 def listar_movimentacoes():
-    """Retorna o histórico de movimentações de estoque com filtros e paginação."""
+    """
+    Retorna o histórico de movimentações de estoque com filtros e paginação.
+
+    Paginação por página (padrão, com total exato) ou por cursor, com
+    ?cursor= (vazio na primeira página): a próxima página continua depois de
+    (data_movimento, id) da última linha, sem OFFSET e sem COUNT. No modo
+    cursor, ?total=aproximado devolve MAX(id) sem filtros ou uma contagem
+    limitada a LIMITE_CONTAGEM_MOVIMENTACOES; ?total=exato, o COUNT completo.
+    """
+    cursor_pagina = request.args.get("cursor")
+    modo_total = request.args.get("total", "").lower()
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
     produto_id_filter = request.args.get("produto_id", type=int)
@@ -219,17 +317,31 @@ def listar_movimentacoes():
         conn = get_db()
         cursor = conn.cursor()
 
+        apos = None
+        if cursor_pagina:
+            try:
+                dados_cursor = decodificar_cursor(cursor_pagina)
+                apos = (str(dados_cursor["d"]), int(dados_cursor["id"]))
+            except (ValueError, TypeError, KeyError):
+                return jsonify({"error": "Cursor de paginação inválido."}), 400
+
+        # Junção adiada: a subconsulta escolhe só os ids da página pelo
+        # índice (filtro + data_movimento, id) e as junções com produto,
+        # usuário e venda são feitas apenas para essas linhas.
         query_base = """
             SELECT m.id, m.produto_id, m.tipo, m.quantidade, m.estoque_anterior,
                    m.estoque_atual, m.observacao, m.data_movimento, m.usuario_id,
                    m.classificacao,
                    p.nome as produto_nome, p.codigo as produto_codigo,
                    u.nome as usuario_nome, v.codigo as venda_codigo
-            FROM estoque_movimentacao m
+            FROM ({pagina}) pagina
+            JOIN estoque_movimentacao m ON m.id = pagina.id
             LEFT JOIN produto p ON m.produto_id = p.id
             LEFT JOIN usuario u ON m.usuario_id = u.id
             LEFT JOIN venda v ON m.venda_id = v.id
+            ORDER BY m.data_movimento DESC, m.id DESC
         """
+        query_ids = "SELECT m.id FROM estoque_movimentacao m"
         count_query_base = "SELECT COUNT(m.id) FROM estoque_movimentacao m"
 
         conditions = []
@@ -274,18 +386,59 @@ def listar_movimentacoes():
         if conditions:
             where_clause = " WHERE " + " AND ".join(conditions)
 
-        cursor.execute(count_query_base + where_clause, params)
-        total_result = cursor.fetchone()
-        total = total_result[0] if total_result else 0
-        pages = (total + per_page - 1) // per_page if per_page > 0 else 1
-
-        query_final = query_base + where_clause + " ORDER BY m.data_movimento DESC"
-        offset = (page - 1) * per_page
-        query_final += " LIMIT ? OFFSET ?"
-        params_paginated = params + [per_page, offset]
+        ordem_ids = " ORDER BY m.data_movimento DESC, m.id DESC"
+
+        if cursor_pagina is not None:
+            total = None
+            total_limitado = False
+            if modo_total == "exato":
+                cursor.execute(count_query_base + where_clause, params)
+                total = cursor.fetchone()[0]
+            elif modo_total == "aproximado":
+                if conditions:
+                    cursor.execute(
+                        f"SELECT COUNT(*) FROM ({query_ids}{where_clause} LIMIT ?)",
+                        params + [LIMITE_CONTAGEM_MOVIMENTACOES],
+                    )
+                    total = cursor.fetchone()[0]
+                    total_limitado = total >= LIMITE_CONTAGEM_MOVIMENTACOES
+                else:
+                    # Os ids são AUTOINCREMENT: MAX(id) é lido direto da
+                    # árvore da tabela e só difere do total por exclusões.
+                    cursor.execute(
+                        "SELECT COALESCE(MAX(id), 0) FROM estoque_movimentacao")
+                    total = cursor.fetchone()[0]
+
+            condicoes_pagina = list(conditions)
+            params_pagina = list(params)
+            if apos:
+                condicoes_pagina.append("(m.data_movimento, m.id) < (?, ?)")
+                params_pagina.extend(apos)
+            where_pagina = (
+                " WHERE " + " AND ".join(condicoes_pagina) if condicoes_pagina else ""
+            )
+            cursor.execute(
+                query_base.format(
+                    pagina=query_ids + where_pagina + ordem_ids + " LIMIT ?"),
+                params_pagina + [per_page + 1],
+            )
+            movimentos_raw = cursor.fetchall()
+            tem_mais = len(movimentos_raw) > per_page
+            movimentos_raw = movimentos_raw[:per_page]
+        else:
+            cursor.execute(count_query_base + where_clause, params)
+            total_result = cursor.fetchone()
+            total = total_result[0] if total_result else 0
+            pages = (total + per_page - 1) // per_page if per_page > 0 else 1
 
-        cursor.execute(query_final, params_paginated)
-        movimentos_raw = cursor.fetchall()
+            offset = (page - 1) * per_page
+            cursor.execute(
+                query_base.format(
+                    pagina=query_ids + where_clause + ordem_ids + " LIMIT ? OFFSET ?"
+                ),
+                params + [per_page, offset],
+            )
+            movimentos_raw = cursor.fetchall()
 
         resultados = []
         for m_row in movimentos_raw:
@@ -325,6 +478,28 @@ def listar_movimentacoes():
                 }
             )
 
+        if cursor_pagina is not None:
+            resposta = {
+                "movimentacoes": resultados,
+                "per_page": per_page,
+                "tem_mais": tem_mais,
+                "proximo_cursor": (
+                    codificar_cursor(
+                        {
+                            "d": movimentos_raw[-1]["data_movimento"],
+                            "id": movimentos_raw[-1]["id"],
+                        }
+                    )
+                    if tem_mais
+                    else None
+                ),
+            }
+            if total is not None:
+                resposta["total"] = total
+                resposta["total_aproximado"] = modo_total == "aproximado"
+                resposta["total_limitado"] = total_limitado
+            return jsonify(resposta)
+
         return jsonify(
             {
                 "movimentacoes": resultados,
@@ -354,6 +529,7 @@ def listar_movimentacoes():
 
 
 @estoque_bp.route("/movimentacoes/grafico", methods=["GET"])
+@somente_leitura
 @login_required
 def movimentacoes_grafico_endpoint():
     """Retorna dados agregados de movimentação para gráficos."""
@@ -373,6 +549,7 @@ def movimentacoes_grafico_endpoint():
 
 
 @estoque_bp.route("/vendas", methods=["GET", "POST"])
+@somente_leitura
 @login_required
 def gerenciar_vendas():
     """Lista vendas (GET) ou registra uma nova venda (POST)."""
@@ -462,7 +639,8 @@ def gerenciar_vendas():
 
             try:
 
-                venda_registrada = adicionar_venda(
+                venda_registrada = executar_escrita(
+                    adicionar_venda,
                     cliente_nome=cliente_nome,
                     itens=itens,
                     usuario_id=usuario_id,
@@ -514,6 +692,7 @@ def gerenciar_vendas():
 
 
 @estoque_bp.route("/vendas/<int:venda_id>", methods=["GET"])
+@somente_leitura
 @login_required
 def detalhes_venda(venda_id):
     """Retorna os detalhes de uma venda específica, incluindo seus itens."""
@@ -602,70 +781,27 @@ def detalhes_venda(venda_id):
 @acesso_requerido(["admin", "gerente"])
 def cancelar_venda(venda_id):
     """Cancela uma venda, retornando os itens ao estoque e excluindo a venda."""
-    conn = None
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        conn.execute("BEGIN TRANSACTION")
-
-        cursor.execute(
-            "SELECT id, codigo FROM venda WHERE id = ?", (venda_id,))
-        venda = cursor.fetchone()
-        if not venda:
-            conn.rollback()
+        cancelamento = estornar_venda(venda_id, usuario_id=session.get("user_id"))
+        if cancelamento is None:
             return jsonify({"error": "Venda não encontrada."}), 404
-
-        cursor.execute(
-            "SELECT produto_id, quantidade FROM item_venda WHERE venda_id = ?",
-            (venda_id,),
-        )
-        itens_da_venda = cursor.fetchall()
-
-        for item in itens_da_venda:
-
-            registrar_movimento(
-                produto_id=item["produto_id"],
-                tipo="entrada",
-                quantidade=item["quantidade"],
-                usuario_id=session.get("user_id"),
-                observacao=f"Cancelamento da Venda Cód: {venda['codigo']}",
-                venda_id=venda_id,
-            )
-
-        cursor.execute(
-            "DELETE FROM item_venda WHERE venda_id = ?", (venda_id,))
-        cursor.execute("DELETE FROM venda WHERE id = ?", (venda_id,))
-
-        conn.commit()
-        current_app.logger.info(
-            f"Venda ID {venda_id} (Cód: {venda['codigo']}) cancelada por usuário ID {session.get('user_id')}."
-        )
         return jsonify({"message": "Venda cancelada com sucesso!"})
 
     except ValueError as e:
-        if conn:
-            conn.rollback()
         current_app.logger.warning(
             f"Erro de validação ao cancelar venda {venda_id}: {e}", exc_info=True
         )
         return jsonify({"error": str(e)}), 400
     except sqlite3.Error as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro de banco de dados ao cancelar venda {venda_id}: {e}", exc_info=True
         )
         return jsonify({"error": "Erro no banco de dados ao cancelar venda."}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro inesperado ao cancelar venda {venda_id}: {e}", exc_info=True
         )
         return jsonify({"error": "Erro inesperado ao processar o cancelamento."}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 @estoque_bp.route("/movimentacoes/page", methods=["GET"])
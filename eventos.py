@@ -0,0 +1,296 @@
+"""
+Distribuição de eventos em tempo real (Server-Sent Events).
+
+As funções de escrita chamam publicar_evento() depois do commit, apenas com
+ids. Uma thread distribuidora junta as publicações pendentes em lotes e, por
+lote, faz uma única leitura no banco (movimentos + contadores do dashboard).
+Cada evento é serializado uma vez e a mesma mensagem vai para a fila de
+todos os assinantes. As filas são limitadas: um cliente que não consome a
+tempo é desconectado em vez de acumular memória.
+
+A distribuição é por processo: cada processo de trabalho atende os clientes
+conectados a ele com os eventos gerados nele.
+"""
+
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import database_utils
+
+
+logger = logging.getLogger(__name__)
+
+
+EVENTOS_FILA_MAXIMA = int(os.environ.get("EVENTOS_FILA_MAXIMA", 100))
+EVENTOS_HEARTBEAT = float(os.environ.get("EVENTOS_HEARTBEAT", 15))
+# Espera curta antes de distribuir, para juntar escritas quase simultâneas
+# no mesmo lote.
+EVENTOS_JANELA_LOTE = 0.05
+
+
+class Assinante:
+    """Cliente conectado ao fluxo de eventos, com fila limitada."""
+
+    def __init__(self, tamanho_fila=EVENTOS_FILA_MAXIMA):
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.descartado = False
+
+    def entregar(self, mensagem):
+        """Enfileira a mensagem; retorna False se a fila estiver cheia."""
+        try:
+            self.fila.put_nowait(mensagem)
+            return True
+        except queue.Full:
+            return False
+
+    def descartar(self):
+        """Esvazia a fila e sinaliza o fim do fluxo para o gerador."""
+        self.descartado = True
+        while True:
+            try:
+                self.fila.get_nowait()
+            except queue.Empty:
+                break
+        self.fila.put_nowait(None)
+
+
+class DistribuidorEventos:
+    """Recebe publicações, lê o banco uma vez por lote e repassa aos assinantes."""
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._pendentes = []
+        self._assinantes = set()
+        self._thread = None
+        self._proximo_id = 0
+        self._contadores_anteriores = None
+
+        self._publicados = 0
+        self._lotes = 0
+        self._mensagens = 0
+        self._descartados = 0
+
+    def assinar(self):
+        assinante = Assinante()
+        with self._condicao:
+            self._assinantes.add(assinante)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._executar, name="distribuidor-eventos", daemon=True
+                )
+                self._thread.start()
+        return assinante
+
+    def cancelar(self, assinante):
+        with self._condicao:
+            self._assinantes.discard(assinante)
+
+    def publicar(self, tipo, **dados):
+        with self._condicao:
+            # Sem assinantes não há o que distribuir nem por que ler o banco.
+            if not self._assinantes:
+                return
+            self._pendentes.append((tipo, dados))
+            self._publicados += 1
+            self._condicao.notify()
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes:
+                    self._condicao.wait()
+            time.sleep(EVENTOS_JANELA_LOTE)
+            with self._condicao:
+                lote, self._pendentes = self._pendentes, []
+            try:
+                mensagens = self._montar_mensagens(lote)
+            except Exception:
+                logger.error("Erro ao montar lote de eventos.", exc_info=True)
+                continue
+            if mensagens:
+                self._distribuir("".join(mensagens))
+
+    def _mensagem(self, evento, dados):
+        self._proximo_id += 1
+        return (
+            f"id: {self._proximo_id}\n"
+            f"event: {evento}\n"
+            f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+        )
+
+    def _montar_mensagens(self, lote):
+        movimento_ids = set()
+        for _, dados in lote:
+            movimento_ids.update(dados.get("movimento_ids") or ())
+
+        movimentos, contadores = _ler_lote(movimento_ids)
+
+        mensagens = []
+        for tipo, dados in lote:
+            if tipo == "movimento":
+                continue
+            dados = {k: v for k, v in dados.items() if k != "movimento_ids"}
+            mensagens.append(self._mensagem(tipo, dados))
+        for movimento in movimentos:
+            mensagens.append(self._mensagem("movimento", movimento))
+
+        if contadores is not None:
+            anteriores = self._contadores_anteriores
+            delta = {
+                campo: round(contadores[campo] - anteriores[campo], 2)
+                for campo in contadores
+                if anteriores is not None and contadores[campo] != anteriores[campo]
+            }
+            if anteriores is None or delta:
+                mensagens.append(
+                    self._mensagem(
+                        "estatisticas", {"contadores": contadores, "delta": delta})
+                )
+            self._contadores_anteriores = contadores
+
+        self._lotes += 1
+        return mensagens
+
+    def _distribuir(self, mensagem):
+        with self._condicao:
+            assinantes = list(self._assinantes)
+        lentos = []
+        for assinante in assinantes:
+            if assinante.entregar(mensagem):
+                self._mensagens += 1
+            else:
+                lentos.append(assinante)
+        for assinante in lentos:
+            self.cancelar(assinante)
+            assinante.descartar()
+            self._descartados += 1
+            logger.warning(
+                "Assinante de eventos desconectado: fila cheia (%d mensagens).",
+                EVENTOS_FILA_MAXIMA,
+            )
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                "assinantes": len(self._assinantes),
+                "pendentes": len(self._pendentes),
+                "publicados": self._publicados,
+                "lotes": self._lotes,
+                "mensagens_entregues": self._mensagens,
+                "assinantes_descartados": self._descartados,
+                "fila_maxima": EVENTOS_FILA_MAXIMA,
+                "heartbeat_s": EVENTOS_HEARTBEAT,
+            }
+
+
+def _formatar_movimento(m):
+    """Mesmo formato de GET /estoque/movimentacoes."""
+    try:
+        data_formatada = datetime.datetime.fromisoformat(
+            str(m["data_movimento"])).strftime("%d/%m/%Y %H:%M:%S")
+    except (ValueError, TypeError):
+        data_formatada = str(m["data_movimento"])
+    return {
+        "id": m["id"],
+        "produto": (
+            {"id": m["produto_id"], "nome": m["produto_nome"], "codigo": m["produto_codigo"]}
+            if m["produto_id"]
+            else None
+        ),
+        "usuario": (
+            {"id": m["usuario_id"], "nome": m["usuario_nome"]}
+            if m["usuario_id"]
+            else {"id": None, "nome": "Sistema"}
+        ),
+        "tipo": m["tipo"],
+        "quantidade": m["quantidade"],
+        "estoque_anterior": m["estoque_anterior"],
+        "estoque_atual": m["estoque_atual"],
+        "observacao": m["observacao"],
+        "classificacao": m["classificacao"],
+        "data": data_formatada,
+        "venda_codigo": m["venda_codigo"],
+    }
+
+
+def _ler_lote(movimento_ids):
+    """Lê, em uma única conexão, os movimentos do lote e os contadores."""
+    conn = database_utils.get_db()
+    try:
+        cursor = conn.cursor()
+        movimentos = []
+        if movimento_ids:
+            cursor.execute(
+                f"""
+                SELECT m.id, m.produto_id, m.tipo, m.quantidade, m.estoque_anterior,
+                       m.estoque_atual, m.observacao, m.data_movimento, m.usuario_id,
+                       m.classificacao,
+                       p.nome as produto_nome, p.codigo as produto_codigo,
+                       u.nome as usuario_nome, v.codigo as venda_codigo
+                FROM estoque_movimentacao m
+                LEFT JOIN produto p ON m.produto_id = p.id
+                LEFT JOIN usuario u ON m.usuario_id = u.id
+                LEFT JOIN venda v ON m.venda_id = v.id
+                WHERE m.id IN ({','.join('?' * len(movimento_ids))})
+                ORDER BY m.id
+                """,
+                sorted(movimento_ids),
+            )
+            movimentos = [_formatar_movimento(row) for row in cursor.fetchall()]
+
+        cursor.execute(
+            f"SELECT {', '.join(database_utils.COLUNAS_CONTADORES_DASHBOARD)} "
+            "FROM dashboard_contadores WHERE id = 1"
+        )
+        linha = cursor.fetchone()
+        return movimentos, dict(linha) if linha else None
+    finally:
+        conn.close()
+
+
+distribuidor = DistribuidorEventos()
+
+
+def publicar_evento(tipo, **dados):
+    """
+    Publica um evento para os clientes conectados. Deve ser chamada só
+    depois do commit da escrita correspondente.
+
+    Args:
+        tipo (str): 'movimento', 'venda' ou 'cancelamento'.
+        **dados: Dados do evento; `movimento_ids` são lidos do banco pela
+            thread distribuidora e enviados como eventos 'movimento'.
+    """
+    distribuidor.publicar(tipo, **dados)
+
+
+def fluxo_eventos():
+    """
+    Gerador do corpo da resposta text/event-stream de um cliente. Envia um
+    comentário de heartbeat a cada EVENTOS_HEARTBEAT segundos sem eventos.
+    """
+    assinante = distribuidor.assinar()
+    try:
+        yield "retry: 5000\n: conectado\n\n"
+        while True:
+            try:
+                mensagem = assinante.fila.get(timeout=EVENTOS_HEARTBEAT)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            if mensagem is None:
+                yield "event: desconectado\ndata: {\"motivo\": \"fila cheia\"}\n\n"
+                return
+            yield mensagem
+    finally:
+        distribuidor.cancelar(assinante)
+
+
+def estatisticas_eventos():
+    """Contadores do distribuidor de eventos deste processo."""
+    return distribuidor.estatisticas()
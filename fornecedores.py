@@ -10,7 +10,14 @@ from flask import (
     url_for,
     current_app,
 )
-from database_utils import get_db
+from database_utils import (
+    get_db,
+    atualizar_registro,
+    excluir_registro,
+    inserir_registro,
+    inverter_status_fornecedor,
+    somente_leitura,
+)
 from auth import login_required, acesso_requerido
 
 
@@ -19,6 +26,7 @@ fornecedores_bp = Blueprint(
 
 
 @fornecedores_bp.route("/", methods=["GET", "POST"])
+@somente_leitura
 @login_required
 def gerenciar_todos_fornecedores():
     """
@@ -171,26 +179,21 @@ def gerenciar_todos_fornecedores():
                         409,
                     )
 
-            sql_insert = """
-                INSERT INTO fornecedores 
-                (nome, cnpj, email, telefone, endereco, contato, observacoes, ativo, data_cadastro, ultima_atualizacao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            """
-            params_insert = (
-                nome,
-                cnpj,
-                email,
-                telefone,
-                endereco,
-                contato,
-                observacoes,
-                ativo,
+            campos_insert = {
+                "nome": nome,
+                "cnpj": cnpj,
+                "email": email,
+                "telefone": telefone,
+                "endereco": endereco,
+                "contato": contato,
+                "observacoes": observacoes,
+                "ativo": ativo,
+            }
+            new_id = inserir_registro(
+                "fornecedores", campos_insert,
+                carimbos=("data_cadastro", "ultima_atualizacao"),
             )
 
-            cursor.execute(sql_insert, params_insert)
-            new_id = cursor.lastrowid
-            conn.commit()
-
             return (
                 jsonify(
                     {
@@ -220,6 +223,7 @@ def gerenciar_todos_fornecedores():
 
 
 @fornecedores_bp.route("/<int:fornecedor_id>", methods=["GET", "PUT", "DELETE"])
+@somente_leitura
 @login_required
 def gerenciar_fornecedor_especifico(fornecedor_id):
     """
@@ -266,8 +270,7 @@ def gerenciar_fornecedor_especifico(fornecedor_id):
                     400,
                 )
 
-            update_fields = []
-            params_update = []
+            campos_update = {}
 
             allowed_to_update = [
                 "nome",
@@ -324,24 +327,18 @@ def gerenciar_fornecedor_especifico(fornecedor_id):
                                 409,
                             )
 
-                    update_fields.append(f"{field} = ?")
-                    params_update.append(
+                    campos_update[field] = (
                         data[field] if data[field] is not None else None
                     )
 
-            if not update_fields:
+            if not campos_update:
                 return jsonify({"message": "Nenhuma alteração detectada."}), 200
 
-            update_fields.append("ultima_atualizacao = CURRENT_TIMESTAMP")
-            params_update.append(fornecedor_id)
-
-            sql_update = (
-                f"UPDATE fornecedores SET {', '.join(update_fields)} WHERE id = ?"
+            atualizar_registro(
+                "fornecedores", fornecedor_id, campos_update,
+                carimbos=("ultima_atualizacao",),
             )
 
-            cursor.execute(sql_update, params_update)
-            conn.commit()
-
             cursor.execute(
                 "SELECT * FROM fornecedores WHERE id = ?", (fornecedor_id,))
             fornecedor_atualizado = dict(cursor.fetchone())
@@ -376,9 +373,7 @@ def gerenciar_fornecedor_especifico(fornecedor_id):
                     400,
                 )
 
-            cursor.execute(
-                "DELETE FROM fornecedores WHERE id = ?", (fornecedor_id,))
-            conn.commit()
+            excluir_registro("fornecedores", fornecedor_id)
 
             return jsonify({"message": "Fornecedor excluído com sucesso."})
 
@@ -403,6 +398,7 @@ def gerenciar_fornecedor_especifico(fornecedor_id):
 
 
 @fornecedores_bp.route("/<int:fornecedor_id>/produtos", methods=["GET"])
+@somente_leitura
 @login_required
 def listar_produtos_do_fornecedor(fornecedor_id):
     """Lista produtos associados a um fornecedor específico, com paginação."""
@@ -478,25 +474,11 @@ def listar_produtos_do_fornecedor(fornecedor_id):
 @acesso_requerido(["admin", "gerente"])
 def alternar_status_fornecedor(fornecedor_id):
     """Alterna o status (ativo/inativo) de um fornecedor."""
-    conn = None
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT ativo FROM fornecedores WHERE id = ?", (fornecedor_id,))
-        fornecedor_status = cursor.fetchone()
-        if not fornecedor_status:
+        novo_status = inverter_status_fornecedor(fornecedor_id)
+        if novo_status is None:
             return jsonify({"error": "Fornecedor não encontrado."}), 404
 
-        novo_status = not fornecedor_status["ativo"]
-
-        cursor.execute(
-            "UPDATE fornecedores SET ativo = ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
-            (novo_status, fornecedor_id),
-        )
-        conn.commit()
-
         return jsonify(
             {
                 "message": f"Status do fornecedor alterado para {'ativo' if novo_status else 'inativo'}.",
@@ -505,23 +487,16 @@ def alternar_status_fornecedor(fornecedor_id):
         )
 
     except sqlite3.Error as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro ao alternar status do fornecedor {fornecedor_id}: {e}", exc_info=True
         )
         return jsonify({"error": "Erro no banco de dados ao alternar status."}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro inesperado ao alternar status do fornecedor {fornecedor_id}: {e}",
             exc_info=True,
         )
         return jsonify({"error": "Erro inesperado no servidor."}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 @fornecedores_bp.route("/page", methods=["GET"])
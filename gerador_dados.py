@@ -0,0 +1,490 @@
+"""
+Gerador de dados sintéticos em volume (flask gerar-dados).
+
+Produz usuários, categorias, fornecedores, produtos, vendas com itens e um
+histórico de movimentações coerente: cada linha de estoque_movimentacao
+encadeia estoque_anterior -> estoque_atual do produto, saídas nunca deixam o
+estoque negativo (falta de estoque gera antes uma reposição) e o estoque
+final de cada produto é o do último movimento. A popularidade dos produtos
+segue uma distribuição de Pareto, então poucos produtos concentram a maior
+parte das vendas, como em um catálogo real.
+
+A carga usa uma conexão própria com PRAGMAs de carga (synchronous=OFF,
+cache grande, foreign_keys=OFF), grava com executemany em transações de
+`tamanho_lote` linhas e, durante a carga, remove os gatilhos das tabelas
+carregadas e os índices secundários do histórico e das vendas. Ao final
+tudo é recriado e as tabelas derivadas (busca, resumos de vendas e
+contadores do dashboard) são recalculadas de uma vez.
+"""
+
+import datetime
+import itertools
+import math
+import random
+import sqlite3
+import time
+
+from werkzeug.security import generate_password_hash
+
+import database_utils
+from database_utils import (
+    banco_em_memoria,
+    limpar_cache_totais_produtos,
+    reconstruir_agregados,
+    reconstruir_contadores_dashboard,
+)
+from models import SQL_SELECT_PRODUTO_BUSCA, init_db_sqlite
+
+
+# Tabelas cujos gatilhos são suspensos durante a carga.
+TABELAS_CARGA = (
+    "usuario",
+    "categoria",
+    "fornecedores",
+    "produto",
+    "venda",
+    "item_venda",
+    "estoque_movimentacao",
+)
+# Tabelas cujos índices secundários são recriados depois da carga.
+TABELAS_INDICES_RECRIADOS = ("estoque_movimentacao", "item_venda", "venda")
+
+SQL_INSERT_MOVIMENTO_DATADO = """
+    INSERT INTO estoque_movimentacao
+    (produto_id, usuario_id, tipo, quantidade, estoque_anterior, estoque_atual,
+     observacao, venda_id, data_movimento, classificacao)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_TIPOS_PRODUTO = (
+    "Caderno", "Caneta", "Lápis", "Borracha", "Mochila", "Estojo", "Régua",
+    "Marcador", "Pasta", "Agenda", "Calculadora", "Grampeador", "Tesoura",
+    "Cola", "Papel", "Envelope", "Etiqueta", "Pincel", "Tinta", "Bloco",
+)
+_ADJETIVOS = (
+    "Universitário", "Escolar", "Profissional", "Premium", "Básico", "Colorido",
+    "Reciclado", "Executivo", "Infantil", "Compacto", "Grande", "Neon",
+)
+_MARCAS = (
+    "Tilibra", "Faber", "Bic", "Pilot", "Stabilo", "Acrilex", "Chamex",
+    "Maped", "Cis", "Jandaia", "Foroni", "Compactor", "Dello", "Leo",
+)
+_CATEGORIAS = (
+    "Papelaria", "Escrita", "Arte", "Escritório", "Escolar", "Informática",
+    "Organização", "Presentes", "Embalagens", "Limpeza",
+)
+_NOMES = (
+    "Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabriela", "Hugo",
+    "Isabel", "João", "Karina", "Lucas", "Marina", "Nuno", "Olívia", "Paulo",
+)
+_SOBRENOMES = (
+    "Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa",
+    "Almeida", "Ferreira", "Rodrigues", "Gomes", "Martins",
+)
+_FORMAS_PAGAMENTO = (("dinheiro", 25), ("cartao_credito", 40), ("cartao_debito", 20), ("pix", 15))
+_CLASSIFICACOES_SAIDA = (
+    ("venda", 50), ("dano", 15), ("roubo", 5), ("descarte", 10),
+    ("devolucao_fornecedor", 10), ("outro", 10),
+)
+_QUANTIDADES_VENDA = ((1, 50), (2, 25), (3, 12), (4, 8), (5, 5))
+
+
+def _escolhas(rng, pares):
+    """(valores, pesos cumulativos) para rng.choices."""
+    valores = [v for v, _ in pares]
+    return valores, list(itertools.accumulate(p for _, p in pares))
+
+
+class _Sorteador:
+    """Sorteios em blocos (rng.choices) para não pagar a chamada por item."""
+
+    def __init__(self, rng, valores, pesos_cumulativos, bloco=65536):
+        self._rng = rng
+        self._valores = valores
+        self._pesos = pesos_cumulativos
+        self._bloco = bloco
+        self._buffer = []
+
+    def __call__(self):
+        if not self._buffer:
+            self._buffer = self._rng.choices(
+                self._valores, cum_weights=self._pesos, k=self._bloco)
+        return self._buffer.pop()
+
+
+class _Gravador:
+    """Acumula linhas por instrução e grava com executemany a cada lote."""
+
+    def __init__(self, conn, tamanho_lote):
+        self.conn = conn
+        self.tamanho_lote = tamanho_lote
+        self._linhas = {}
+        self._pendentes = 0
+        self.gravadas = {}
+
+    def adicionar(self, sql, linha):
+        self._linhas.setdefault(sql, []).append(linha)
+        self._pendentes += 1
+        if self._pendentes >= self.tamanho_lote:
+            self.gravar()
+
+    def gravar(self):
+        if not self._pendentes:
+            return
+        self.conn.execute("BEGIN")
+        for sql, linhas in self._linhas.items():
+            self.conn.executemany(sql, linhas)
+            self.gravadas[sql] = self.gravadas.get(sql, 0) + len(linhas)
+        self.conn.execute("COMMIT")
+        self._linhas = {}
+        self._pendentes = 0
+
+
+def _proximo_id(conn, tabela):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {tabela}").fetchone()[0]
+
+
+def _suspender_objetos(conn):
+    """Remove gatilhos e índices secundários; retorna o SQL para recriá-los."""
+    gatilhos = conn.execute(
+        f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND tbl_name IN ({','.join('?' * len(TABELAS_CARGA))})
+        """,
+        TABELAS_CARGA,
+    ).fetchall()
+    indices = conn.execute(
+        f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL
+          AND tbl_name IN ({','.join('?' * len(TABELAS_INDICES_RECRIADOS))})
+        """,
+        TABELAS_INDICES_RECRIADOS,
+    ).fetchall()
+    conn.execute("BEGIN")
+    for nome, _ in gatilhos:
+        conn.execute(f'DROP TRIGGER "{nome}"')
+    for nome, _ in indices:
+        conn.execute(f'DROP INDEX "{nome}"')
+    conn.execute("COMMIT")
+    return [sql for _, sql in indices] + [sql for _, sql in gatilhos]
+
+
+def gerar_dados(
+    produtos=10_000,
+    fornecedores=200,
+    categorias=30,
+    usuarios=20,
+    movimentos=1_000_000,
+    vendas=100_000,
+    itens_por_venda=2.5,
+    dias=365,
+    alfa=1.16,
+    semente=None,
+    tamanho_lote=100_000,
+    progresso=None,
+):
+    """
+    Gera dados sintéticos no banco configurado (database_utils.DATABASE_NAME).
+
+    Args:
+        produtos, fornecedores, categorias, usuarios (int): Quantidades.
+        movimentos (int): Tamanho aproximado do histórico. Inclui os
+            movimentos das vendas (um por item), as reposições e o estoque
+            inicial de cada produto; o restante é completado com entradas,
+            saídas e ajustes avulsos.
+        vendas (int): Quantidade de vendas.
+        itens_por_venda (float): Média de itens por venda.
+        dias (int): Período coberto, terminando agora.
+        alfa (float): Parâmetro da Pareto da popularidade (1.16 ~ regra 80/20).
+        semente (int, opcional): Semente do gerador aleatório.
+        tamanho_lote (int): Linhas por transação.
+        progresso (callable, opcional): Recebe mensagens de andamento.
+
+    Returns:
+        dict: Quantidades geradas e duração de cada etapa.
+
+    Raises:
+        ValueError: Se o banco configurado for em memória.
+    """
+    database = database_utils.DATABASE_NAME
+    if banco_em_memoria(database):
+        raise ValueError("gerar-dados precisa de um banco em arquivo.")
+    avisar = progresso or (lambda mensagem: None)
+    rng = random.Random(semente)
+    tempos = {}
+    inicio_total = time.perf_counter()
+
+    init_db_sqlite()
+
+    conn = sqlite3.connect(database, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA cache_size = -262144;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute("PRAGMA foreign_keys = OFF;")
+    gravador = _Gravador(conn, tamanho_lote)
+
+    recriar = _suspender_objetos(conn)
+    try:
+        etapa = time.perf_counter()
+        agora = datetime.datetime.now().replace(microsecond=0)
+        inicio_periodo = agora - datetime.timedelta(days=dias)
+
+        # Usuários (operadores), categorias e fornecedores.
+        primeiro_usuario = _proximo_id(conn, "usuario")
+        senha_hash = generate_password_hash("operador123")
+        usuario_ids = list(range(primeiro_usuario, primeiro_usuario + usuarios))
+        for uid in usuario_ids:
+            nome = f"{rng.choice(_NOMES)} {rng.choice(_SOBRENOMES)}"
+            gravador.adicionar(
+                "INSERT INTO usuario (id, nome, email, senha_hash, nivel_acesso, ativo) "
+                "VALUES (?, ?, ?, ?, 'operador', 1)",
+                (uid, nome, f"operador{uid}@gep.local", senha_hash),
+            )
+
+        primeira_categoria = _proximo_id(conn, "categoria")
+        categoria_ids = list(range(primeira_categoria, primeira_categoria + categorias))
+        for cid in categoria_ids:
+            gravador.adicionar(
+                "INSERT INTO categoria (id, nome, descricao) VALUES (?, ?, ?)",
+                (cid, f"{_CATEGORIAS[cid % len(_CATEGORIAS)]} {cid}", "Categoria gerada"),
+            )
+
+        primeiro_fornecedor = _proximo_id(conn, "fornecedores")
+        fornecedor_ids = list(range(primeiro_fornecedor, primeiro_fornecedor + fornecedores))
+        for fid in fornecedor_ids:
+            gravador.adicionar(
+                "INSERT INTO fornecedores (id, nome, cnpj, email, telefone, ativo) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    fid,
+                    f"{rng.choice(_MARCAS)} Distribuidora {fid}",
+                    f"{fid:08d}0001{fid % 100:02d}",
+                    f"contato{fid}@fornecedor.local",
+                    f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+                    1 if rng.random() < 0.9 else 0,
+                ),
+            )
+
+        # Produtos, com estoque inicial registrado como primeira entrada.
+        primeiro_produto = _proximo_id(conn, "produto")
+        produto_ids = list(range(primeiro_produto, primeiro_produto + produtos))
+        precos = {}
+        estoque = {}
+        estoque_minimo = {}
+        data_inicial = inicio_periodo.isoformat(sep=" ")
+        for pid in produto_ids:
+            preco = round(rng.lognormvariate(3.0, 0.9), 2) + 0.5
+            precos[pid] = preco
+            estoque_minimo[pid] = rng.randint(5, 50)
+            estoque[pid] = rng.randint(0, 300)
+            gravador.adicionar(
+                "INSERT INTO produto (id, codigo, nome, descricao, categoria_id, preco, "
+                "preco_compra, estoque, estoque_minimo, ativo, fornecedor_id, data_criacao) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (
+                    pid,
+                    f"P{pid:07d}",
+                    f"{rng.choice(_TIPOS_PRODUTO)} {rng.choice(_ADJETIVOS)} "
+                    f"{rng.choice(_MARCAS)} {pid}",
+                    f"{rng.choice(_TIPOS_PRODUTO)} {rng.choice(_ADJETIVOS).lower()} "
+                    f"da linha {rng.choice(_MARCAS)}",
+                    rng.choice(categoria_ids),
+                    preco,
+                    round(preco * rng.uniform(0.4, 0.8), 2),
+                    estoque_minimo[pid],
+                    1 if rng.random() < 0.95 else 0,
+                    rng.choice(fornecedor_ids) if fornecedor_ids else None,
+                    data_inicial,
+                ),
+            )
+            if estoque[pid]:
+                gravador.adicionar(
+                    SQL_INSERT_MOVIMENTO_DATADO,
+                    (pid, None, "entrada", estoque[pid], 0, estoque[pid],
+                     "Estoque inicial", None, data_inicial, "reposicao"),
+                )
+        gravador.gravar()
+        tempos["cadastros_s"] = round(time.perf_counter() - etapa, 3)
+        avisar(
+            f"Cadastros: {usuarios} usuários, {categorias} categorias, "
+            f"{fornecedores} fornecedores, {produtos} produtos "
+            f"({tempos['cadastros_s']} s)"
+        )
+
+        # Linha do tempo: vendas e movimentos avulsos intercalados em ordem
+        # cronológica, para que o encadeamento de estoque seja válido.
+        etapa = time.perf_counter()
+        pesos = [rng.paretovariate(alfa) for _ in produto_ids]
+        sortear_produto = _Sorteador(
+            rng, produto_ids, list(itertools.accumulate(pesos)))
+        sortear_quantidade = _Sorteador(rng, *_escolhas(rng, _QUANTIDADES_VENDA))
+        sortear_forma = _Sorteador(rng, *_escolhas(rng, _FORMAS_PAGAMENTO))
+        sortear_classificacao = _Sorteador(rng, *_escolhas(rng, _CLASSIFICACOES_SAIDA))
+        sortear_usuario = _Sorteador(rng, usuario_ids, list(range(1, len(usuario_ids) + 1))) \
+            if usuario_ids else (lambda: None)
+
+        itens_estimados = int(vendas * itens_por_venda)
+        avulsos = max(0, movimentos - itens_estimados - len(produto_ids))
+        eventos = vendas + avulsos
+        passo = (agora - inicio_periodo).total_seconds() / max(eventos, 1)
+        base = inicio_periodo.timestamp()
+        # floor(Exp(taxa)) é geométrica com média 1 / (e^taxa - 1): itens
+        # além do primeiro com a média pedida.
+        taxa_extra = math.log1p(1.0 / max(itens_por_venda - 1.0, 0.01))
+
+        venda_id = _proximo_id(conn, "venda")
+        vendas_restantes = vendas
+        geradas = {"vendas": 0, "itens": 0, "movimentos": 0, "reposicoes": 0}
+        aviso_a_cada = max(eventos // 10, 1)
+
+        def repor(pid, minimo, quando, uid):
+            anterior = estoque[pid]
+            quantidade = minimo + rng.randint(estoque_minimo[pid], 10 * estoque_minimo[pid])
+            estoque[pid] = anterior + quantidade
+            gravador.adicionar(
+                SQL_INSERT_MOVIMENTO_DATADO,
+                (pid, uid, "entrada", quantidade, anterior, estoque[pid],
+                 "Reposição de estoque", None, quando, "reposicao"),
+            )
+            geradas["reposicoes"] += 1
+
+        for i in range(eventos):
+            quando = datetime.datetime.fromtimestamp(
+                base + (i + rng.random()) * passo).isoformat(sep=" ", timespec="seconds")
+            uid = sortear_usuario()
+
+            if rng.random() * (eventos - i) < vendas_restantes:
+                vendas_restantes -= 1
+                codigo = f"G{quando[:10].replace('-', '')}{venda_id:08X}"
+                total = 0.0
+                for _ in range(1 + min(int(rng.expovariate(taxa_extra)), 19)):
+                    pid = sortear_produto()
+                    quantidade = sortear_quantidade()
+                    if estoque[pid] < quantidade:
+                        repor(pid, quantidade, quando, uid)
+                    anterior = estoque[pid]
+                    estoque[pid] = anterior - quantidade
+                    subtotal = round(quantidade * precos[pid], 2)
+                    total += subtotal
+                    gravador.adicionar(
+                        "INSERT INTO item_venda (venda_id, produto_id, quantidade, "
+                        "preco_unitario, subtotal) VALUES (?, ?, ?, ?, ?)",
+                        (venda_id, pid, quantidade, precos[pid], subtotal),
+                    )
+                    gravador.adicionar(
+                        SQL_INSERT_MOVIMENTO_DATADO,
+                        (pid, uid, "venda", -quantidade, anterior, estoque[pid],
+                         f"Venda Cód: {codigo}", venda_id, quando, None),
+                    )
+                    geradas["itens"] += 1
+                desconto = round(total * 0.05, 2) if rng.random() < 0.1 else 0.0
+                gravador.adicionar(
+                    "INSERT INTO venda (id, codigo, data_venda, usuario_id, cliente_nome, "
+                    "valor_total, desconto, valor_final, forma_pagamento) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        venda_id,
+                        codigo,
+                        quando.replace(" ", "T"),
+                        uid,
+                        f"{rng.choice(_NOMES)} {rng.choice(_SOBRENOMES)}"
+                        if rng.random() < 0.3
+                        else "Consumidor Final",
+                        round(total, 2),
+                        desconto,
+                        round(total - desconto, 2),
+                        sortear_forma(),
+                    ),
+                )
+                venda_id += 1
+                geradas["vendas"] += 1
+            else:
+                pid = sortear_produto()
+                anterior = estoque[pid]
+                sorteio = rng.random()
+                if sorteio < 0.02:
+                    novo = max(0, anterior + rng.randint(-5, 5))
+                    estoque[pid] = novo
+                    linha = (pid, uid, "ajuste", novo - anterior, anterior, novo,
+                             "Ajuste de inventário", None, quando, None)
+                elif sorteio < 0.45 and anterior > 0:
+                    quantidade = rng.randint(1, min(anterior, 10))
+                    estoque[pid] = anterior - quantidade
+                    linha = (pid, uid, "saida", -quantidade, anterior, estoque[pid],
+                             "Saída avulsa", None, quando, sortear_classificacao())
+                else:
+                    quantidade = rng.randint(10, 200)
+                    estoque[pid] = anterior + quantidade
+                    classificacao = "devolucao" if rng.random() < 0.1 else "reposicao"
+                    linha = (pid, uid, "entrada", quantidade, anterior, estoque[pid],
+                             "Entrada avulsa", None, quando, classificacao)
+                gravador.adicionar(SQL_INSERT_MOVIMENTO_DATADO, linha)
+                geradas["movimentos"] += 1
+
+            if (i + 1) % aviso_a_cada == 0:
+                avisar(
+                    f"  {i + 1}/{eventos} eventos "
+                    f"({(i + 1) / (time.perf_counter() - etapa):,.0f}/s)"
+                )
+
+        # Estoque final de cada produto = estoque_atual do último movimento.
+        for pid in produto_ids:
+            gravador.adicionar(
+                "UPDATE produto SET estoque = ?, ultima_atualizacao = ? WHERE id = ?",
+                (estoque[pid], agora.isoformat(sep=" "), pid),
+            )
+        gravador.gravar()
+        tempos["historico_s"] = round(time.perf_counter() - etapa, 3)
+        total_movimentos = gravador.gravadas.get(SQL_INSERT_MOVIMENTO_DATADO, 0)
+        avisar(
+            f"Histórico: {geradas['vendas']} vendas, {geradas['itens']} itens, "
+            f"{total_movimentos} movimentos ({tempos['historico_s']} s, "
+            f"{total_movimentos / max(tempos['historico_s'], 0.001):,.0f} movimentos/s)"
+        )
+    finally:
+        etapa = time.perf_counter()
+        conn.execute("BEGIN")
+        for sql in recriar:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+        tempos["indices_gatilhos_s"] = round(time.perf_counter() - etapa, 3)
+        avisar(f"Índices e gatilhos recriados ({tempos['indices_gatilhos_s']} s)")
+
+    # Tabelas derivadas, recalculadas de uma vez.
+    etapa = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM produto_busca")
+    conn.execute(
+        "INSERT INTO produto_busca (rowid, codigo, nome, descricao, categoria, fornecedor) "
+        + SQL_SELECT_PRODUTO_BUSCA
+    )
+    conn.execute("INSERT INTO produto_busca (produto_busca) VALUES ('optimize')")
+    conn.execute("UPDATE versao_dados SET versao = versao + 1 WHERE id = 1")
+    conn.execute("COMMIT")
+    conn.execute("PRAGMA analysis_limit = 1000;")
+    conn.execute("ANALYZE;")
+    conn.close()
+
+    agregados = reconstruir_agregados()
+    contadores = reconstruir_contadores_dashboard()
+    limpar_cache_totais_produtos()
+    tempos["derivadas_s"] = round(time.perf_counter() - etapa, 3)
+    avisar(f"Busca, resumos e contadores recalculados ({tempos['derivadas_s']} s)")
+
+    tempos["total_s"] = round(time.perf_counter() - inicio_total, 3)
+    return {
+        "database": database,
+        "usuarios": usuarios,
+        "categorias": categorias,
+        "fornecedores": fornecedores,
+        "produtos": produtos,
+        "vendas": geradas["vendas"],
+        "itens_venda": geradas["itens"],
+        "movimentos": total_movimentos,
+        "reposicoes": geradas["reposicoes"],
+        "agregados": agregados["linhas"],
+        "dias_vendas": contadores["dias_vendas"],
+        "tempos": tempos,
+    }
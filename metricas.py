@@ -0,0 +1,400 @@
+"""
+Métricas de latência no formato texto do Prometheus (GET /metrics).
+
+- gep_http_request_duration_seconds: histograma por endpoint, método e
+  status, medido por before_request/after_request.
+- gep_sql_query_duration_seconds: histograma por SQL normalizado (literais
+  e listas IN trocados por ?), medido pelo cursor das conexões do pool.
+  Cobre o execute (preparação e primeiro passo); o tempo gasto nos fetch*
+  vai para gep_sql_fetch_seconds_total.
+- gep_sql_errors_total: erros do SQLite por código (SQLITE_BUSY etc.).
+- gep_sql_retries_total e gep_sql_retry_giveups_total: transações repetidas
+  por contenção e as que esgotaram as tentativas, por operação.
+- gep_writer_batches_total e gep_writer_commands_total: lotes e comandos
+  do escritor único (escritor.py), quando ativo.
+- gep_db_pool_* e gep_db_pool_leitura_*: situação dos pools de conexões.
+
+Acesso: com METRICAS_TOKEN definido, /metrics exige o cabeçalho
+"Authorization: Bearer <token>" (coletores como o Prometheus); sem ele, só
+um administrador logado na aplicação consegue ler as métricas.
+
+Modo multiprocesso (gunicorn): com PROMETHEUS_MULTIPROC_DIR definido, cada
+processo grava periodicamente seu instantâneo em
+`<dir>/metricas_<pid>.json` e /metrics soma os arquivos de todos os
+processos.
+"""
+
+import atexit
+import functools
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from flask import Response, g, request, session
+
+import database_utils
+
+
+LIMITES_LATENCIA = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Limite de textos SQL distintos; o excedente é agregado em "<outras>".
+MAXIMO_SQL_DISTINTOS = 500
+INTERVALO_GRAVACAO_MULTIPROCESSO = 1.0
+
+
+class Histograma:
+    """Histograma com rótulos; contagens cumulativas geradas na exposição."""
+
+    def __init__(self, nome, descricao, rotulos, limites=LIMITES_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observar(self, valores, duracao):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * len(self.limites), 0, 0.0]
+            for i, limite in enumerate(self.limites):
+                if duracao <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += 1
+            serie[2] += duracao
+
+    def quantidade_series(self):
+        with self._lock:
+            return len(self._series)
+
+    def possui(self, valores):
+        with self._lock:
+            return valores in self._series
+
+    def instantaneo(self):
+        with self._lock:
+            return {
+                json.dumps(valores): [list(s[0]), s[1], s[2]]
+                for valores, s in self._series.items()
+            }
+
+
+class Contador:
+    """Contador (soma) com rótulos."""
+
+    def __init__(self, nome, descricao, rotulos):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def somar(self, valores, quantidade):
+        with self._lock:
+            self._series[valores] = self._series.get(valores, 0.0) + quantidade
+
+    def instantaneo(self):
+        with self._lock:
+            return {json.dumps(valores): v for valores, v in self._series.items()}
+
+
+requisicoes = Histograma(
+    "gep_http_request_duration_seconds",
+    "Duração das requisições HTTP.",
+    ("endpoint", "method", "status"),
+)
+consultas_sql = Histograma(
+    "gep_sql_query_duration_seconds",
+    "Duração do execute das instruções SQL, por SQL normalizado.",
+    ("sql",),
+)
+leituras_sql = Contador(
+    "gep_sql_fetch_seconds_total",
+    "Tempo gasto lendo resultados (fetch*), por SQL normalizado.",
+    ("sql",),
+)
+erros_sql = Contador(
+    "gep_sql_errors_total",
+    "Erros do SQLite nas instruções executadas, por código do erro.",
+    ("codigo",),
+)
+repeticoes_sql = Contador(
+    "gep_sql_retries_total",
+    "Transações repetidas após SQLITE_BUSY/SQLITE_LOCKED, por operação.",
+    ("operacao",),
+)
+desistencias_sql = Contador(
+    "gep_sql_retry_giveups_total",
+    "Transações que esgotaram as tentativas por contenção, por operação.",
+    ("operacao",),
+)
+comandos_escritor = Contador(
+    "gep_writer_commands_total",
+    "Comandos do escritor único, por resultado (ok, rejeitado, erro).",
+    ("resultado",),
+)
+lotes_escritor = Contador(
+    "gep_writer_batches_total",
+    "Transações (lotes) gravadas pelo escritor único.",
+    (),
+)
+HISTOGRAMAS = (requisicoes, consultas_sql)
+CONTADORES = (
+    leituras_sql,
+    erros_sql,
+    repeticoes_sql,
+    desistencias_sql,
+    comandos_escritor,
+    lotes_escritor,
+)
+
+
+_RE_COMENTARIO = re.compile(r"--[^\n]*")
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_LISTA_IN = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalizar_sql(sql):
+    """Remove comentários e literais e colapsa espaços e listas IN (?, ?, ...)."""
+    texto = _RE_COMENTARIO.sub("", sql)
+    texto = _RE_STRING.sub("?", texto)
+    texto = _RE_NUMERO.sub("?", texto)
+    texto = _RE_LISTA_IN.sub("IN (?...)", texto)
+    return _RE_ESPACOS.sub(" ", texto).strip().rstrip(";")
+
+
+def registrar_sql(sql, duracao):
+    """Registra a duração do execute de uma instrução."""
+    rotulo = normalizar_sql(sql)
+    if (
+        consultas_sql.quantidade_series() >= MAXIMO_SQL_DISTINTOS
+        and not consultas_sql.possui((rotulo,))
+    ):
+        rotulo = "<outras>"
+    consultas_sql.observar((rotulo,), duracao)
+    return rotulo
+
+
+def registrar_leitura(rotulo, duracao):
+    """Soma o tempo de fetch* ao SQL normalizado já registrado."""
+    leituras_sql.somar((rotulo,), duracao)
+
+
+def registrar_erro_sql(erro):
+    """Conta um erro do SQLite pelo código (ex.: SQLITE_BUSY, SQLITE_CONSTRAINT)."""
+    codigo = getattr(erro, "sqlite_errorname", None) or type(erro).__name__
+    erros_sql.somar((codigo,), 1)
+
+
+def registrar_repeticao(operacao):
+    """Conta uma nova tentativa de transação após erro de contenção."""
+    repeticoes_sql.somar((operacao,), 1)
+
+
+def registrar_desistencia(operacao):
+    """Conta uma transação que esgotou as tentativas por contenção."""
+    desistencias_sql.somar((operacao,), 1)
+
+
+def registrar_lote_escritor(ok, rejeitados, erros):
+    """Conta um lote do escritor único e o resultado dos seus comandos."""
+    lotes_escritor.somar((), 1)
+    for resultado, quantidade in (("ok", ok), ("rejeitado", rejeitados), ("erro", erros)):
+        if quantidade:
+            comandos_escritor.somar((resultado,), quantidade)
+
+
+# --- Modo multiprocesso -----------------------------------------------------
+
+_ultima_gravacao = 0.0
+_lock_gravacao = threading.Lock()
+
+
+def _diretorio_multiprocesso():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def _instantaneo():
+    return {
+        "histogramas": {h.nome: h.instantaneo() for h in HISTOGRAMAS},
+        "contadores": {c.nome: c.instantaneo() for c in CONTADORES},
+    }
+
+
+def gravar_instantaneo(forcar=False):
+    """Grava o instantâneo deste processo no diretório multiprocesso."""
+    global _ultima_gravacao
+    diretorio = _diretorio_multiprocesso()
+    if not diretorio:
+        return
+    agora = time.monotonic()
+    with _lock_gravacao:
+        if not forcar and agora - _ultima_gravacao < INTERVALO_GRAVACAO_MULTIPROCESSO:
+            return
+        _ultima_gravacao = agora
+        os.makedirs(diretorio, exist_ok=True)
+        destino = os.path.join(diretorio, f"metricas_{os.getpid()}.json")
+        temporario = f"{destino}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(_instantaneo(), arquivo)
+        os.replace(temporario, destino)
+
+
+def _instantaneos_todos_processos():
+    diretorio = _diretorio_multiprocesso()
+    if not diretorio:
+        return [_instantaneo()]
+    gravar_instantaneo(forcar=True)
+    instantaneos = []
+    for nome in sorted(os.listdir(diretorio)):
+        if not (nome.startswith("metricas_") and nome.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(diretorio, nome), encoding="utf-8") as arquivo:
+                instantaneos.append(json.load(arquivo))
+        except (OSError, ValueError):
+            continue
+    return instantaneos
+
+
+# --- Exposição --------------------------------------------------------------
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def gerar_texto_prometheus():
+    """Texto de exposição (formato 0.0.4) de todas as métricas."""
+    instantaneos = _instantaneos_todos_processos()
+    linhas = []
+
+    for h in HISTOGRAMAS:
+        series = {}
+        for inst in instantaneos:
+            for chave, (baldes, contagem, soma) in inst["histogramas"].get(h.nome, {}).items():
+                acumulado = series.setdefault(chave, [[0] * len(h.limites), 0, 0.0])
+                for i, quantidade in enumerate(baldes):
+                    acumulado[0][i] += quantidade
+                acumulado[1] += contagem
+                acumulado[2] += soma
+        linhas.append(f"# HELP {h.nome} {h.descricao}")
+        linhas.append(f"# TYPE {h.nome} histogram")
+        for chave in sorted(series):
+            valores = json.loads(chave)
+            baldes, contagem, soma = series[chave]
+            cumulativo = 0
+            for limite, quantidade in zip(h.limites, baldes):
+                cumulativo += quantidade
+                rotulos = _rotulos(h.rotulos, valores, 'le="%s"' % limite)
+                linhas.append(f"{h.nome}_bucket{rotulos} {cumulativo}")
+            rotulos = _rotulos(h.rotulos, valores, 'le="+Inf"')
+            linhas.append(f"{h.nome}_bucket{rotulos} {contagem}")
+            linhas.append(f"{h.nome}_count{_rotulos(h.rotulos, valores)} {contagem}")
+            linhas.append(f"{h.nome}_sum{_rotulos(h.rotulos, valores)} {_numero(soma)}")
+
+    for c in CONTADORES:
+        series = {}
+        for inst in instantaneos:
+            for chave, valor in inst["contadores"].get(c.nome, {}).items():
+                series[chave] = series.get(chave, 0.0) + valor
+        linhas.append(f"# HELP {c.nome} {c.descricao}")
+        linhas.append(f"# TYPE {c.nome} counter")
+        for chave in sorted(series):
+            linhas.append(
+                f"{c.nome}{_rotulos(c.rotulos, json.loads(chave))} {_numero(series[chave])}")
+
+    # Os pools são por processo; em modo multiprocesso valem para o processo
+    # que atendeu a coleta.
+    for prefixo, pool, sufixo in (
+        ("gep_db_pool", database_utils.estatisticas_pool(), ""),
+        ("gep_db_pool_leitura", database_utils.estatisticas_pool_leitura(), " (somente leitura)"),
+    ):
+        if pool is None:
+            continue
+        for chave, tipo, descricao in (
+            ("conexoes_abertas", "gauge", "Conexões abertas no pool"),
+            ("em_uso", "gauge", "Conexões emprestadas no momento"),
+            ("esperas", "counter", "Empréstimos que precisaram aguardar"),
+            ("esgotamentos", "counter", "Empréstimos que falharam por timeout"),
+        ):
+            nome = f"{prefixo}_{chave}"
+            linhas.append(f"# HELP {nome} {descricao}{sufixo}.")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            linhas.append(f"{nome} {pool[chave]}")
+
+    return "\n".join(linhas) + "\n"
+
+
+# --- Integração com o Flask -------------------------------------------------
+
+def init_app(app):
+    """Registra a medição das requisições e a rota /metrics."""
+    if not os.environ.get("METRICAS_TOKEN"):
+        app.logger.warning(
+            "METRICAS_TOKEN não definido: /metrics responde apenas a "
+            "administradores logados e não pode ser coletado pelo Prometheus."
+        )
+
+    @app.before_request
+    def _iniciar_medicao():
+        g._inicio_requisicao = time.perf_counter()
+
+    @app.after_request
+    def _registrar_requisicao(response):
+        inicio = g.pop("_inicio_requisicao", None)
+        if inicio is not None:
+            requisicoes.observar(
+                (request.endpoint or "desconhecido", request.method, str(response.status_code)),
+                time.perf_counter() - inicio,
+            )
+            gravar_instantaneo()
+        return response
+
+    @app.teardown_request
+    def _registrar_falha(exc):
+        # after_request não roda quando a view levanta exceção não tratada.
+        inicio = g.pop("_inicio_requisicao", None)
+        if inicio is not None and exc is not None:
+            requisicoes.observar(
+                (request.endpoint or "desconhecido", request.method, "500"),
+                time.perf_counter() - inicio,
+            )
+
+    @app.route("/metrics")
+    def metricas():
+        token = os.environ.get("METRICAS_TOKEN")
+        if token:
+            autorizado = hmac.compare_digest(
+                request.headers.get("Authorization", ""), f"Bearer {token}"
+            )
+        else:
+            autorizado = session.get("user_level") == "admin"
+        if not autorizado:
+            return Response("Não autorizado.\n", status=401, mimetype="text/plain")
+        return Response(
+            gerar_texto_prometheus(),
+            mimetype="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    if _diretorio_multiprocesso():
+        atexit.register(gravar_instantaneo, True)
@@ -1,5 +1,17 @@
+import logging
 import sqlite3
-from database_utils import get_db
+import time
+from contextlib import nullcontext
+import database_utils
+from database_utils import (
+    banco_em_memoria,
+    caminho_arquivo_banco,
+    get_db,
+    trava_arquivo,
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 SQL_CREATE_USUARIO = """
@@ -137,81 +149,505 @@ CREATE TABLE IF NOT EXISTS item_venda (
 """
 
 
+def _migracao_001_esquema_inicial(cursor):
+    """
+    Esquema base. Também atualiza bancos criados antes do controle de
+    versão (user_version = 0), que podem não ter colunas adicionadas depois.
+    """
+    cursor.execute(SQL_CREATE_USUARIO)
+    cursor.execute(SQL_CREATE_CATEGORIA)
+    cursor.execute(SQL_CREATE_FORNECEDOR)
+    cursor.execute(SQL_CREATE_PRODUTO)
+
+    cursor.execute("PRAGMA table_info(produto)")
+    produto_cols = [row[1] for row in cursor.fetchall()]
+    if "ativo" not in produto_cols:
+        cursor.execute(
+            "ALTER TABLE produto ADD COLUMN ativo INTEGER DEFAULT 1")
+        cursor.execute("UPDATE produto SET ativo = 1 WHERE ativo IS NULL")
+
+    cursor.execute("PRAGMA table_info(usuario)")
+    usuario_cols = [row[1] for row in cursor.fetchall()]
+    if "manager_id" not in usuario_cols:
+        cursor.execute("ALTER TABLE usuario ADD COLUMN manager_id INTEGER")
+
+    cursor.execute(SQL_CREATE_INDEX_PRODUTO_CODIGO)
+    cursor.execute(SQL_CREATE_ESTOQUE_MOVIMENTACAO)
+
+    cursor.execute("PRAGMA table_info(estoque_movimentacao)")
+    estoque_mov_cols = [row[1] for row in cursor.fetchall()]
+    if "venda_id" not in estoque_mov_cols:
+        cursor.execute(
+            "ALTER TABLE estoque_movimentacao ADD COLUMN venda_id INTEGER"
+        )
+    if "classificacao" not in estoque_mov_cols:
+        cursor.execute(
+            "ALTER TABLE estoque_movimentacao ADD COLUMN classificacao TEXT"
+        )
+
+    cursor.execute(SQL_CREATE_GRUPO_PRODUTO)
+    cursor.execute(SQL_CREATE_PRODUTOS_GRUPOS)
+    cursor.execute(SQL_CREATE_VENDA)
+    cursor.execute(SQL_CREATE_INDEX_VENDA_CODIGO)
+    cursor.execute(SQL_CREATE_ITEM_VENDA)
+
+
+SQL_CREATE_INDICES_CONSULTAS = [
+    # Histórico de um produto, ordenado por data (/estoque/movimentacoes?produto_id=,
+    # verificação de exclusão de produto, junções dos relatórios de vendas).
+    "CREATE INDEX IF NOT EXISTS idx_mov_produto_data ON estoque_movimentacao(produto_id, data_movimento)",
+    # Listagem geral mais recente primeiro, filtros por período e
+    # "movimentações recentes" do dashboard.
+    "CREATE INDEX IF NOT EXISTS idx_mov_data ON estoque_movimentacao(data_movimento)",
+    # Filtros por tipo/classificação e agregados por classificação do
+    # dashboard (índice de cobertura: inclui quantidade).
+    "CREATE INDEX IF NOT EXISTS idx_mov_tipo_classificacao ON estoque_movimentacao(tipo, classificacao, quantidade)",
+    "CREATE INDEX IF NOT EXISTS idx_mov_classificacao_data ON estoque_movimentacao(classificacao, data_movimento)",
+    # Relatório de vendas por operador.
+    "CREATE INDEX IF NOT EXISTS idx_mov_usuario ON estoque_movimentacao(usuario_id)",
+    # Movimentos de uma venda (cancelamento e verificação da chave estrangeira
+    # ao excluir a venda).
+    "CREATE INDEX IF NOT EXISTS idx_mov_venda ON estoque_movimentacao(venda_id)",
+    "CREATE INDEX IF NOT EXISTS idx_venda_data ON venda(data_venda)",
+    "CREATE INDEX IF NOT EXISTS idx_item_venda_venda ON item_venda(venda_id)",
+    "CREATE INDEX IF NOT EXISTS idx_item_venda_produto ON item_venda(produto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_categoria ON produto(categoria_id)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_fornecedor ON produto(fornecedor_id)",
+]
+
+
+# Índice de texto completo da busca de produtos. O rowid de produto_busca é
+# o id do produto; os nomes de categoria e fornecedor são copiados para que
+# a busca também os encontre, e os gatilhos mantêm a cópia atualizada.
+SQL_CREATE_PRODUTO_BUSCA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS produto_busca USING fts5(
+    codigo, nome, descricao, categoria, fornecedor,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+SQL_SELECT_PRODUTO_BUSCA = """
+SELECT p.id, p.codigo, p.nome, p.descricao,
+       (SELECT c.nome FROM categoria c WHERE c.id = p.categoria_id),
+       (SELECT f.nome FROM fornecedores f WHERE f.id = p.fornecedor_id)
+FROM produto p
+"""
+
+SQL_CREATE_GATILHOS_PRODUTO_BUSCA = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_produto_busca_insert AFTER INSERT ON produto
+    BEGIN
+        INSERT INTO produto_busca (rowid, codigo, nome, descricao, categoria, fornecedor)
+        {SQL_SELECT_PRODUTO_BUSCA} WHERE p.id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_produto_busca_update
+    AFTER UPDATE OF codigo, nome, descricao, categoria_id, fornecedor_id ON produto
+    BEGIN
+        DELETE FROM produto_busca WHERE rowid = old.id;
+        INSERT INTO produto_busca (rowid, codigo, nome, descricao, categoria, fornecedor)
+        {SQL_SELECT_PRODUTO_BUSCA} WHERE p.id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_produto_busca_delete AFTER DELETE ON produto
+    BEGIN
+        DELETE FROM produto_busca WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_categoria_busca_update AFTER UPDATE OF nome ON categoria
+    BEGIN
+        UPDATE produto_busca SET categoria = new.nome
+        WHERE rowid IN (SELECT id FROM produto WHERE categoria_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_fornecedor_busca_update AFTER UPDATE OF nome ON fornecedores
+    BEGIN
+        UPDATE produto_busca SET fornecedor = new.nome
+        WHERE rowid IN (SELECT id FROM produto WHERE fornecedor_id = new.id);
+    END
+    """,
+]
+
+
+def _migracao_003_busca_produtos(cursor):
+    """Cria o índice FTS5 de produtos, seus gatilhos e o popula."""
+    cursor.execute(SQL_CREATE_PRODUTO_BUSCA)
+    for sql in SQL_CREATE_GATILHOS_PRODUTO_BUSCA:
+        cursor.execute(sql)
+    cursor.execute("DELETE FROM produto_busca")
+    cursor.execute(
+        "INSERT INTO produto_busca (rowid, codigo, nome, descricao, categoria, fornecedor) "
+        + SQL_SELECT_PRODUTO_BUSCA
+    )
+    cursor.execute("INSERT INTO produto_busca (produto_busca) VALUES ('optimize')")
+
+
+# Ordenações aceitas na listagem de produtos (paginação por cursor em
+# coluna + id; o rowid já faz parte de cada índice).
+SQL_CREATE_INDICES_ORDENACAO_PRODUTOS = [
+    "CREATE INDEX IF NOT EXISTS idx_produto_nome ON produto(nome)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_preco ON produto(preco)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_estoque ON produto(estoque)",
+    "CREATE INDEX IF NOT EXISTS idx_produto_data_criacao ON produto(data_criacao)",
+]
+
+# Histórico de movimentações paginado por (data_movimento, id): cada filtro
+# de igualdade tem um índice terminado em data_movimento (produto_id e
+# classificacao já criados na migração 2), de modo que a página é lida em
+# ordem direto do índice.
+SQL_CREATE_INDICES_HISTORICO_MOVIMENTOS = [
+    "CREATE INDEX IF NOT EXISTS idx_mov_tipo_data ON estoque_movimentacao(tipo, data_movimento)",
+]
+
+SQL_CREATE_VENDAS_DIARIAS = """
+CREATE TABLE IF NOT EXISTS vendas_diarias_produto (
+    dia TEXT NOT NULL,            -- date(data_movimento), em UTC
+    produto_id INTEGER NOT NULL,
+    usuario_id INTEGER NOT NULL DEFAULT 0, -- 0 = movimento sem operador
+    quantidade_vendida INTEGER NOT NULL DEFAULT 0,
+    quantidade_devolvida INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (produto_id, dia, usuario_id)
+) WITHOUT ROWID;
+"""
+SQL_CREATE_INDEX_VENDAS_DIARIAS_USUARIO = """
+CREATE INDEX IF NOT EXISTS idx_vendas_diarias_usuario ON vendas_diarias_produto(usuario_id);
+"""
+
+
+def _migracao_006_vendas_diarias(cursor):
+    """Cria o resumo diário de vendas e o preenche com o histórico."""
+    cursor.execute(SQL_CREATE_VENDAS_DIARIAS)
+    cursor.execute(SQL_CREATE_INDEX_VENDAS_DIARIAS_USUARIO)
+    cursor.execute("DELETE FROM vendas_diarias_produto")
+    cursor.execute(database_utils.SQL_RECONSTRUIR_VENDAS_DIARIAS)
+
+
+SQL_CREATE_MOVIMENTOS_POR_CLASSIFICACAO = """
+CREATE TABLE IF NOT EXISTS movimentos_por_classificacao (
+    grupo TEXT NOT NULL,          -- 'entrada' ou 'saida' (saídas e vendas)
+    classificacao TEXT NOT NULL,  -- 'outro' quando o movimento não tem
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (grupo, classificacao)
+) WITHOUT ROWID;
+"""
+
+
+def _migracao_007_movimentos_por_classificacao(cursor):
+    """Cria os totais por classificação do dashboard e os preenche."""
+    cursor.execute(SQL_CREATE_MOVIMENTOS_POR_CLASSIFICACAO)
+    cursor.execute("DELETE FROM movimentos_por_classificacao")
+    cursor.execute(database_utils.SQL_RECONSTRUIR_MOVIMENTOS_CLASSIFICACAO)
+
+
+SQL_CREATE_DASHBOARD_CONTADORES = """
+CREATE TABLE IF NOT EXISTS dashboard_contadores (
+    id INTEGER PRIMARY KEY CHECK (id = 1), -- linha única
+    total_produtos INTEGER NOT NULL DEFAULT 0,
+    valor_total_estoque REAL NOT NULL DEFAULT 0,
+    produtos_estoque_baixo INTEGER NOT NULL DEFAULT 0,
+    produtos_sem_estoque INTEGER NOT NULL DEFAULT 0,
+    produtos_inativos INTEGER NOT NULL DEFAULT 0,
+    total_categorias INTEGER NOT NULL DEFAULT 0,
+    total_fornecedores_ativos INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+SQL_CREATE_VENDAS_POR_DIA = """
+CREATE TABLE IF NOT EXISTS vendas_por_dia (
+    dia TEXT PRIMARY KEY,         -- date(data_venda)
+    contagem INTEGER NOT NULL DEFAULT 0,
+    valor REAL NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+
+def _contribuicao_produto(linha):
+    """
+    Quanto uma linha de produto (`new` ou `old` no gatilho) soma a cada
+    contador do dashboard. Mesmas regras de SQL_RECALCULAR_CONTADORES_DASHBOARD.
+    """
+    ativo = f"COALESCE({linha}.ativo, 1)"
+    return {
+        "total_produtos": f"(CASE WHEN {ativo} = 1 THEN 1 ELSE 0 END)",
+        "valor_total_estoque": (
+            f"(CASE WHEN {ativo} = 1 AND {linha}.estoque > 0 AND {linha}.preco_compra > 0 "
+            f"THEN {linha}.estoque * {linha}.preco_compra ELSE 0 END)"
+        ),
+        "produtos_estoque_baixo": (
+            f"(CASE WHEN {ativo} = 1 AND {linha}.estoque <= {linha}.estoque_minimo "
+            f"AND {linha}.estoque > 0 THEN 1 ELSE 0 END)"
+        ),
+        "produtos_sem_estoque": f"(CASE WHEN {ativo} = 1 AND {linha}.estoque = 0 THEN 1 ELSE 0 END)",
+        "produtos_inativos": f"(CASE WHEN {ativo} = 0 THEN 1 ELSE 0 END)",
+    }
+
+
+def _sql_gatilhos_dashboard():
+    novo, antigo = _contribuicao_produto("new"), _contribuicao_produto("old")
+    somar = ", ".join(f"{c} = {c} + {e}" for c, e in novo.items())
+    subtrair = ", ".join(f"{c} = {c} - {e}" for c, e in antigo.items())
+    trocar = ", ".join(f"{c} = {c} + {novo[c]} - {antigo[c]}" for c in novo)
+    fornecedor_ativo = "(CASE WHEN {}.ativo = 1 THEN 1 ELSE 0 END)"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_produto_insert AFTER INSERT ON produto
+        BEGIN
+            UPDATE dashboard_contadores SET {somar} WHERE id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_produto_update
+        AFTER UPDATE OF ativo, estoque, estoque_minimo, preco_compra ON produto
+        BEGIN
+            UPDATE dashboard_contadores SET {trocar} WHERE id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_produto_delete AFTER DELETE ON produto
+        BEGIN
+            UPDATE dashboard_contadores SET {subtrair} WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_categoria_insert AFTER INSERT ON categoria
+        BEGIN
+            UPDATE dashboard_contadores SET total_categorias = total_categorias + 1 WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_categoria_delete AFTER DELETE ON categoria
+        BEGIN
+            UPDATE dashboard_contadores SET total_categorias = total_categorias - 1 WHERE id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_fornecedor_insert AFTER INSERT ON fornecedores
+        BEGIN
+            UPDATE dashboard_contadores
+            SET total_fornecedores_ativos = total_fornecedores_ativos + {fornecedor_ativo.format("new")}
+            WHERE id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_fornecedor_update AFTER UPDATE OF ativo ON fornecedores
+        BEGIN
+            UPDATE dashboard_contadores
+            SET total_fornecedores_ativos = total_fornecedores_ativos
+                + {fornecedor_ativo.format("new")} - {fornecedor_ativo.format("old")}
+            WHERE id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_fornecedor_delete AFTER DELETE ON fornecedores
+        BEGIN
+            UPDATE dashboard_contadores
+            SET total_fornecedores_ativos = total_fornecedores_ativos - {fornecedor_ativo.format("old")}
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_por_dia_insert AFTER INSERT ON venda
+        WHEN new.data_venda IS NOT NULL
+        BEGIN
+            INSERT INTO vendas_por_dia (dia, contagem, valor)
+            VALUES (date(new.data_venda), 1, COALESCE(new.valor_final, 0))
+            ON CONFLICT (dia) DO UPDATE SET
+                contagem = contagem + 1,
+                valor = valor + excluded.valor;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_por_dia_delete AFTER DELETE ON venda
+        WHEN old.data_venda IS NOT NULL
+        BEGIN
+            UPDATE vendas_por_dia
+            SET contagem = contagem - 1, valor = valor - COALESCE(old.valor_final, 0)
+            WHERE dia = date(old.data_venda);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_por_dia_update AFTER UPDATE OF data_venda, valor_final ON venda
+        BEGIN
+            UPDATE vendas_por_dia
+            SET contagem = contagem - 1, valor = valor - COALESCE(old.valor_final, 0)
+            WHERE old.data_venda IS NOT NULL AND dia = date(old.data_venda);
+            INSERT INTO vendas_por_dia (dia, contagem, valor)
+            SELECT date(new.data_venda), 1, COALESCE(new.valor_final, 0)
+            WHERE new.data_venda IS NOT NULL
+            ON CONFLICT (dia) DO UPDATE SET
+                contagem = contagem + 1,
+                valor = valor + excluded.valor;
+        END
+        """,
+    ]
+
+
+def _migracao_008_contadores_dashboard(cursor):
+    """Cria os contadores do dashboard e as vendas por dia, com seus gatilhos."""
+    cursor.execute(SQL_CREATE_DASHBOARD_CONTADORES)
+    cursor.execute(SQL_CREATE_VENDAS_POR_DIA)
+    for sql in _sql_gatilhos_dashboard():
+        cursor.execute(sql)
+    colunas = ", ".join(database_utils.COLUNAS_CONTADORES_DASHBOARD)
+    cursor.execute(
+        f"INSERT OR REPLACE INTO dashboard_contadores (id, {colunas}) "
+        f"SELECT 1, {colunas} FROM ({database_utils.SQL_RECALCULAR_CONTADORES_DASHBOARD})"
+    )
+    cursor.execute("DELETE FROM vendas_por_dia")
+    cursor.execute(database_utils.SQL_RECONSTRUIR_VENDAS_POR_DIA)
+
+
+# Contador de escritas: cada alteração nas tabelas que alimentam o dashboard
+# incrementa versao_dados.versao. Caches comparam a versão com a do
+# momento em que foram gerados (PRAGMA data_version não serve entre
+# processos: é local a cada conexão).
+SQL_CREATE_VERSAO_DADOS = """
+CREATE TABLE IF NOT EXISTS versao_dados (
+    id INTEGER PRIMARY KEY CHECK (id = 1), -- linha única
+    versao INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+TABELAS_VERSIONADAS = {
+    "produto": ("INSERT", "UPDATE", "DELETE"),
+    "categoria": ("INSERT", "UPDATE", "DELETE"),
+    "fornecedores": ("INSERT", "UPDATE", "DELETE"),
+    "venda": ("INSERT", "UPDATE", "DELETE"),
+    "estoque_movimentacao": ("INSERT", "DELETE"),
+}
+
+
+def _migracao_009_versao_dados(cursor):
+    """Cria o contador de escritas e os gatilhos que o incrementam."""
+    cursor.execute(SQL_CREATE_VERSAO_DADOS)
+    cursor.execute("INSERT OR IGNORE INTO versao_dados (id, versao) VALUES (1, 0)")
+    for tabela, eventos in TABELAS_VERSIONADAS.items():
+        for evento in eventos:
+            cursor.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE versao_dados SET versao = versao + 1 WHERE id = 1;
+                END
+                """
+            )
+
+
+# Migrações numeradas, aplicadas em ordem. O número da última aplicada fica
+# gravado em PRAGMA user_version. Cada passo é uma função que recebe o
+# cursor ou uma lista de comandos SQL. Migrações já publicadas não devem ser
+# alteradas: mudanças de esquema entram como uma nova migração no fim.
+MIGRACOES = [
+    (1, "Esquema inicial", _migracao_001_esquema_inicial),
+    (2, "Índices das consultas mais frequentes", SQL_CREATE_INDICES_CONSULTAS),
+    (3, "Busca de produtos em texto completo (FTS5)", _migracao_003_busca_produtos),
+    (4, "Índices de ordenação da listagem de produtos", SQL_CREATE_INDICES_ORDENACAO_PRODUTOS),
+    (5, "Índices do histórico de movimentações", SQL_CREATE_INDICES_HISTORICO_MOVIMENTOS),
+    (6, "Resumo diário de vendas por produto e operador", _migracao_006_vendas_diarias),
+    (7, "Totais de movimentos por classificação", _migracao_007_movimentos_por_classificacao),
+    (8, "Contadores do dashboard mantidos por gatilhos", _migracao_008_contadores_dashboard),
+    (9, "Contador de escritas para invalidação de caches", _migracao_009_versao_dados),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+
+def _versao_atual(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _aplicar_migracoes(conn):
+    """Aplica, cada uma em sua transação, as migrações ainda pendentes."""
+    aplicadas = []
+    cursor = conn.cursor()
+    for numero, descricao, passos in MIGRACOES:
+        if numero <= _versao_atual(conn):
+            continue
+        logger.info("Aplicando migração %d: %s", numero, descricao)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if callable(passos):
+                passos(cursor)
+            else:
+                for sql in passos:
+                    cursor.execute(sql)
+            cursor.execute(f"PRAGMA user_version = {int(numero)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(numero)
+    return aplicadas
+
+
 def init_db_sqlite():
     """
-    Conecta ao banco de dados e cria as tabelas se elas não existirem.
+    Garante que o esquema do banco está na versão mais recente.
+
+    Caminho rápido: se PRAGMA user_version já é VERSAO_ESQUEMA, nada é
+    executado além dessa leitura. Caso contrário, uma trava de arquivo
+    garante que apenas um processo (ex.: um worker do gunicorn) aplique as
+    migrações; os demais aguardam e encontram o esquema já atualizado.
+
+    Returns:
+        dict: Versões antes/depois, migrações aplicadas e duração em ms.
     """
+    inicio = time.perf_counter()
     db_conn = None
+    versao_inicial = None
+    aplicadas = []
     try:
-
         db_conn = get_db()
-        cursor = db_conn.cursor()
-
-        cursor.execute("PRAGMA foreign_keys = ON;")
-
-        print("Criando tabela usuario...")
-        cursor.execute(SQL_CREATE_USUARIO)
-        print("Criando tabela categoria...")
-        cursor.execute(SQL_CREATE_CATEGORIA)
-        print("Criando tabela fornecedor...")
-        cursor.execute(SQL_CREATE_FORNECEDOR)
-        print("Criando tabela produto...")
-        cursor.execute(SQL_CREATE_PRODUTO)
-
-        cursor.execute("PRAGMA table_info(produto)")
-        produto_cols = [row[1] for row in cursor.fetchall()]
-        if "ativo" not in produto_cols:
-            print("Adicionando coluna ativo em produto...")
-            cursor.execute(
-                "ALTER TABLE produto ADD COLUMN ativo INTEGER DEFAULT 1")
-            cursor.execute("UPDATE produto SET ativo = 1 WHERE ativo IS NULL")
-
-        cursor.execute("PRAGMA table_info(usuario)")
-        usuario_cols = [row[1] for row in cursor.fetchall()]
-        if "manager_id" not in usuario_cols:
-            print("Adicionando coluna manager_id em usuario...")
-            cursor.execute("ALTER TABLE usuario ADD COLUMN manager_id INTEGER")
-
-        print("Criando índice em produto.codigo...")
-        cursor.execute(SQL_CREATE_INDEX_PRODUTO_CODIGO)
-        print("Criando tabela estoque_movimentacao...")
-        cursor.execute(SQL_CREATE_ESTOQUE_MOVIMENTACAO)
-
-        cursor.execute("PRAGMA table_info(estoque_movimentacao)")
-        estoque_mov_cols = [row[1] for row in cursor.fetchall()]
-        if "venda_id" not in estoque_mov_cols:
-            print("Adicionando coluna venda_id em estoque_movimentacao...")
-            cursor.execute(
-                "ALTER TABLE estoque_movimentacao ADD COLUMN venda_id INTEGER"
-            )
+        versao_inicial = _versao_atual(db_conn)
 
-        if "classificacao" not in estoque_mov_cols:
-            print("Adicionando coluna classificacao em estoque_movimentacao...")
-            cursor.execute(
-                "ALTER TABLE estoque_movimentacao ADD COLUMN classificacao TEXT"
+        if versao_inicial < VERSAO_ESQUEMA:
+            if db_conn.in_transaction:
+                db_conn.commit()
+            database = database_utils.DATABASE_NAME
+            trava = (
+                nullcontext()
+                if banco_em_memoria(database)
+                else trava_arquivo(caminho_arquivo_banco(database) + ".migracao.lock")
+            )
+            with trava:
+                aplicadas = _aplicar_migracoes(db_conn)
+        elif versao_inicial > VERSAO_ESQUEMA:
+            logger.warning(
+                "Banco de dados na versão %d, mais recente que a aplicação (%d).",
+                versao_inicial,
+                VERSAO_ESQUEMA,
             )
 
-        print("Criando tabela grupo_produto...")
-        cursor.execute(SQL_CREATE_GRUPO_PRODUTO)
-        print("Criando tabela produtos_grupos...")
-        cursor.execute(SQL_CREATE_PRODUTOS_GRUPOS)
-        print("Criando tabela venda...")
-        cursor.execute(SQL_CREATE_VENDA)
-        print("Criando índice em venda.codigo...")
-        cursor.execute(SQL_CREATE_INDEX_VENDA_CODIGO)
-        print("Criando tabela item_venda...")
-        cursor.execute(SQL_CREATE_ITEM_VENDA)
-
-        db_conn.commit()
-        print("Banco de dados inicializado com sucesso!")
+        resultado = {
+            "versao_anterior": versao_inicial,
+            "versao_atual": _versao_atual(db_conn),
+            "migracoes_aplicadas": aplicadas,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 3),
+        }
+        if aplicadas:
+            logger.info(
+                "Banco de dados migrado da versão %d para %d em %.1f ms.",
+                versao_inicial,
+                resultado["versao_atual"],
+                resultado["duracao_ms"],
+            )
+        else:
+            logger.debug(
+                "Esquema do banco já atualizado (versão %d), verificado em %.3f ms.",
+                resultado["versao_atual"],
+                resultado["duracao_ms"],
+            )
+        return resultado
 
     except sqlite3.Error as e:
-        print(f"Erro ao inicializar o banco de dados: {e}")
-
-        if db_conn:
-            db_conn.rollback()
+        logger.error(f"Erro ao inicializar o banco de dados: {e}", exc_info=True)
+        raise
     finally:
-
         if db_conn:
             db_conn.close()
-            print("Conexão com o banco de dados fechada.")
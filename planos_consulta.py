@@ -0,0 +1,335 @@
+"""
+Verificação dos planos de execução (EXPLAIN QUERY PLAN) das consultas mais
+frequentes da aplicação.
+
+Cada consulta registrada em CONSULTAS_CRITICAS reproduz uma consulta real
+das rotas/funções indicadas. A verificação falha quando alguma delas passa
+a ler uma tabela inteira ("SCAN <tabela>" sem índice), exceto nas tabelas
+listadas em `varredura_permitida` (ex.: a tabela de categorias, que é
+pequena e lida por inteiro de propósito).
+"""
+
+import re
+
+
+CONSULTAS_CRITICAS = {
+    "movimentacoes_recentes": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id, m.tipo, m.quantidade, m.data_movimento,
+                   p.nome, u.nome, v.codigo
+            FROM estoque_movimentacao m
+            LEFT JOIN produto p ON m.produto_id = p.id
+            LEFT JOIN usuario u ON m.usuario_id = u.id
+            LEFT JOIN venda v ON m.venda_id = v.id
+            ORDER BY m.data_movimento DESC
+            LIMIT ? OFFSET ?
+        """,
+        "params": (20, 0),
+    },
+    "movimentacoes_cursor": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id FROM estoque_movimentacao m
+            WHERE (m.data_movimento, m.id) < (?, ?)
+            ORDER BY m.data_movimento DESC, m.id DESC
+            LIMIT ?
+        """,
+        "params": ("2024-01-31 12:00:00", 1000, 21),
+    },
+    "movimentacoes_cursor_por_tipo": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id FROM estoque_movimentacao m
+            WHERE m.tipo = ? AND (m.data_movimento, m.id) < (?, ?)
+            ORDER BY m.data_movimento DESC, m.id DESC
+            LIMIT ?
+        """,
+        "params": ("saida", "2024-01-31 12:00:00", 1000, 21),
+    },
+    "movimentacoes_cursor_por_produto_e_periodo": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id FROM estoque_movimentacao m
+            WHERE m.produto_id = ? AND m.data_movimento >= ? AND m.data_movimento <= ?
+              AND (m.data_movimento, m.id) < (?, ?)
+            ORDER BY m.data_movimento DESC, m.id DESC
+            LIMIT ?
+        """,
+        "params": (1, "2024-01-01 00:00:00", "2024-01-31 23:59:59",
+                   "2024-01-31 12:00:00", 1000, 21),
+    },
+    "movimentacoes_por_produto": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id, m.tipo, m.quantidade, m.data_movimento
+            FROM estoque_movimentacao m
+            WHERE m.produto_id = ?
+            ORDER BY m.data_movimento DESC
+            LIMIT ? OFFSET ?
+        """,
+        "params": (1, 20, 0),
+    },
+    "movimentacoes_por_periodo": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id, m.tipo, m.quantidade, m.data_movimento
+            FROM estoque_movimentacao m
+            WHERE m.data_movimento >= ? AND m.data_movimento <= ?
+            ORDER BY m.data_movimento DESC
+            LIMIT ? OFFSET ?
+        """,
+        "params": ("2024-01-01 00:00:00", "2024-01-31 23:59:59", 20, 0),
+    },
+    "movimentacoes_por_tipo": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT COUNT(m.id) FROM estoque_movimentacao m WHERE m.tipo = ?
+        """,
+        "params": ("entrada",),
+    },
+    "movimentacoes_por_classificacao": {
+        "origem": "estoque.listar_movimentacoes",
+        "sql": """
+            SELECT m.id, m.tipo, m.quantidade, m.data_movimento
+            FROM estoque_movimentacao m
+            WHERE m.classificacao = ?
+            ORDER BY m.data_movimento DESC
+            LIMIT ? OFFSET ?
+        """,
+        "params": ("venda", 20, 0),
+    },
+    "dashboard_movimentacoes_recentes": {
+        "origem": "database_utils.obter_estatisticas",
+        "sql": """
+            SELECT m.id, p.nome as produto_nome, m.tipo, m.quantidade, m.data_movimento, u.nome as usuario_nome
+            -- CROSS JOIN fixa a ordem: percorre idx_mov_data do fim e para nas 5
+            -- primeiras. Com estatísticas (ANALYZE) de um histórico grande o
+            -- planejador preferia varrer produto e ordenar tudo.
+            FROM estoque_movimentacao m
+            CROSS JOIN produto p ON m.produto_id = p.id
+            LEFT JOIN usuario u ON m.usuario_id = u.id
+            WHERE COALESCE(p.ativo, 1) = 1
+            ORDER BY m.data_movimento DESC
+            LIMIT 5
+        """,
+        "params": (),
+    },
+    "dashboard_contadores_recalculo": {
+        "origem": "database_utils.verificar_contadores_dashboard",
+        "sql": """
+            SELECT COALESCE(SUM(CASE WHEN ativo = 1 THEN 1 ELSE 0 END), 0),
+                   SUM(CASE WHEN ativo = 1 AND estoque > 0 AND preco_compra > 0
+                            THEN estoque * preco_compra END)
+            FROM (
+                SELECT COALESCE(ativo, 1) AS ativo, estoque, estoque_minimo, preco_compra
+                FROM produto
+            )
+        """,
+        "params": (),
+        # Uma única leitura de produto para todos os contadores.
+        "varredura_permitida": {"produto"},
+    },
+    "dashboard_classificacoes": {
+        "origem": "database_utils.obter_estatisticas",
+        "sql": """
+            SELECT grupo, classificacao, total
+            FROM movimentos_por_classificacao
+            WHERE total != 0
+        """,
+        "params": (),
+        # Tabela mantida com poucas linhas (grupo x classificação).
+        "varredura_permitida": {"movimentos_por_classificacao"},
+    },
+    "dashboard_vendas_30_dias": {
+        "origem": "database_utils.obter_estatisticas",
+        "sql": """
+            SELECT COALESCE(SUM(contagem), 0), COALESCE(SUM(valor), 0)
+            FROM (
+                SELECT contagem, valor FROM vendas_por_dia WHERE dia > date(?)
+                UNION ALL
+                SELECT COUNT(id), COALESCE(SUM(valor_final), 0) FROM venda
+                WHERE data_venda >= ? AND data_venda < date(?, '+1 day')
+            )
+        """,
+        "params": ("2024-01-01 10:00:00",) * 3,
+    },
+    "listagem_vendas": {
+        "origem": "estoque.gerenciar_vendas",
+        "sql": """
+            SELECT v.id, v.codigo, v.data_venda, u.nome as usuario_nome,
+                   (SELECT COUNT(iv.id) FROM item_venda iv WHERE iv.venda_id = v.id) as total_itens
+            FROM venda v
+            LEFT JOIN usuario u ON v.usuario_id = u.id
+            ORDER BY v.data_venda DESC
+            LIMIT ? OFFSET ?
+        """,
+        "params": (15, 0),
+    },
+    "itens_da_venda": {
+        "origem": "estoque.detalhes_venda",
+        "sql": """
+            SELECT i.id, i.produto_id, i.quantidade, p.nome, p.codigo
+            FROM item_venda i
+            JOIN produto p ON i.produto_id = p.id
+            WHERE i.venda_id = ?
+        """,
+        "params": (1,),
+    },
+    "movimentos_da_venda": {
+        "origem": "estoque.cancelar_venda",
+        "sql": "SELECT id FROM estoque_movimentacao WHERE venda_id = ?",
+        "params": (1,),
+    },
+    "vendas_por_operador": {
+        "origem": "relatorios.get_operator_sales_report",
+        "sql": """
+            SELECT u.id, SUM(vd.quantidade_vendida), SUM(vd.quantidade_devolvida)
+            FROM usuario u
+            JOIN vendas_diarias_produto vd ON u.id = vd.usuario_id
+            LEFT JOIN produto p ON vd.produto_id = p.id
+            GROUP BY u.id
+        """,
+        "params": (),
+        "varredura_permitida": {"u"},
+    },
+    "total_vendido_por_produto": {
+        "origem": "produtos.relatorio_produtos_mais_vendidos",
+        "sql": """
+            SELECT p.id, t.total_vendido
+            FROM (
+                SELECT produto_id, SUM(quantidade_vendida - quantidade_devolvida) AS total_vendido
+                FROM vendas_diarias_produto
+                GROUP BY produto_id
+            ) t
+            JOIN produto p ON p.id = t.produto_id
+            WHERE t.total_vendido > 0
+            ORDER BY t.total_vendido DESC, p.nome ASC
+            LIMIT ? OFFSET ?
+        """,
+        "params": (10, 0),
+        # O resumo é lido por inteiro de propósito: tem produtos x dias linhas.
+        "varredura_permitida": {"vendas_diarias_produto", "t"},
+    },
+    "produtos_por_categoria": {
+        "origem": "produtos.gerenciar_categoria_especifica",
+        "sql": "SELECT id, nome, codigo, preco, estoque FROM produto WHERE categoria_id = ? ORDER BY nome",
+        "params": (1,),
+    },
+    "produtos_por_fornecedor": {
+        "origem": "fornecedores.listar_produtos_do_fornecedor",
+        "sql": "SELECT COUNT(p.id) FROM produto p WHERE p.fornecedor_id = ?",
+        "params": (1,),
+    },
+    "categorias_com_contagem": {
+        "origem": "produtos.gerenciar_categorias",
+        "sql": """
+            SELECT c.id, c.nome, c.descricao, COUNT(p.id) as total_produtos
+            FROM categoria c
+            LEFT JOIN produto p ON c.id = p.categoria_id
+            GROUP BY c.id, c.nome, c.descricao
+            ORDER BY c.nome
+        """,
+        "params": (),
+        "varredura_permitida": {"c"},
+    },
+    "produto_tem_movimentos": {
+        "origem": "produtos.gerenciar_produto_especifico",
+        "sql": "SELECT COUNT(id) FROM estoque_movimentacao WHERE produto_id = ?",
+        "params": (1,),
+    },
+    "produto_tem_vendas": {
+        "origem": "produtos.gerenciar_produto_especifico",
+        "sql": "SELECT COUNT(id) FROM item_venda WHERE produto_id = ?",
+        "params": (1,),
+    },
+    "busca_produtos_texto": {
+        "origem": "database_utils.buscar_produtos",
+        "sql": """
+            SELECT p.id, p.codigo, p.nome, c.nome as categoria_nome, f.nome as fornecedor_nome
+            FROM produto p
+            LEFT JOIN categoria c ON p.categoria_id = c.id
+            LEFT JOIN fornecedores f ON p.fornecedor_id = f.id
+            JOIN produto_busca ON produto_busca.rowid = p.id
+            WHERE COALESCE(p.ativo, 1) = 1 AND produto_busca MATCH ?
+            ORDER BY bm25(produto_busca), p.nome ASC
+            LIMIT ? OFFSET ?
+        """,
+        "params": ('"cad"*', 15, 0),
+    },
+    "listagem_produtos_cursor": {
+        "origem": "database_utils.buscar_produtos",
+        "sql": """
+            SELECT p.id, p.codigo, p.nome, c.nome as categoria_nome
+            FROM produto p
+            LEFT JOIN categoria c ON p.categoria_id = c.id
+            WHERE COALESCE(p.ativo, 1) = 1 AND (p.preco, p.id) > (?, ?)
+            ORDER BY p.preco ASC, p.id ASC
+            LIMIT ?
+        """,
+        "params": (10.0, 1, 16),
+    },
+    "produto_por_codigo": {
+        "origem": "produtos.gerenciar_todos_produtos",
+        "sql": "SELECT id FROM produto WHERE codigo = ?",
+        "params": ("CAD001",),
+    },
+}
+
+_PADRAO_VARREDURA = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$")
+# Tabela virtual consultada com alguma restrição (ex.: FTS5 com MATCH gera
+# "VIRTUAL TABLE INDEX 0:M5"); "INDEX 0:" sem nada após é leitura completa.
+_PADRAO_TABELA_VIRTUAL = re.compile(r"VIRTUAL TABLE INDEX \d+:\S+")
+
+
+def obter_plano(conn, sql, params=()):
+    """Retorna as linhas de detalhe do EXPLAIN QUERY PLAN de uma consulta."""
+    return [
+        row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    ]
+
+
+def varreduras_completas(plano, permitidas=()):
+    """
+    Lista as tabelas lidas por inteiro em um plano. Varreduras que usam um
+    índice ("SCAN m USING INDEX ...") não contam: leem o índice em ordem.
+    """
+    encontradas = []
+    for detalhe in plano:
+        correspondencia = _PADRAO_VARREDURA.match(detalhe.strip())
+        if not correspondencia:
+            continue
+        tabela, apelido, resto = correspondencia.groups()
+        if "USING" in resto and "INDEX" in resto:
+            continue
+        if _PADRAO_TABELA_VIRTUAL.search(resto):
+            continue
+        if tabela in permitidas or (apelido and apelido in permitidas):
+            continue
+        encontradas.append(apelido or tabela)
+    return encontradas
+
+
+def verificar_planos(conn, consultas=None):
+    """
+    Executa EXPLAIN QUERY PLAN para as consultas registradas.
+
+    Returns:
+        list[dict]: Um item por consulta, com o plano e as varreduras completas
+        encontradas (lista vazia quando o plano usa índices).
+    """
+    consultas = consultas or CONSULTAS_CRITICAS
+    resultados = []
+    for nome, consulta in consultas.items():
+        plano = obter_plano(conn, consulta["sql"], consulta.get("params", ()))
+        resultados.append(
+            {
+                "nome": nome,
+                "origem": consulta.get("origem"),
+                "plano": plano,
+                "varreduras": varreduras_completas(
+                    plano, consulta.get("varredura_permitida", ())
+                ),
+            }
+        )
+    return resultados
@@ -12,8 +12,14 @@ from flask import (
 )
 from database_utils import (
     get_db,
+    atualizar_registro,
+    excluir_registro,
+    inserir_registro,
+    inverter_status_produto,
     registrar_movimento,
     buscar_produtos,
+    somente_leitura,
+    SQL_TOTAL_VENDIDO_POR_PRODUTO,
 )
 from auth import (
     login_required,
@@ -34,7 +40,29 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _remover_imagem(imagem_url):
+    """Apaga do disco a imagem de upload referenciada por imagem_url."""
+    caminho = os.path.join(current_app.root_path, imagem_url.lstrip("/"))
+    if os.path.exists(caminho) and UPLOAD_FOLDER in caminho:
+        try:
+            os.remove(caminho)
+            current_app.logger.info(f"Imagem {caminho} excluída.")
+        except OSError as e_rm:
+            current_app.logger.error(
+                f"Erro ao remover imagem {caminho}: {e_rm}")
+
+
+def _descartar_upload(filepath):
+    """Apaga a imagem recém-salva de uma gravação que falhou."""
+    if filepath:
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+
 @produtos_bp.route("/categorias", methods=["GET", "POST"])
+@somente_leitura
 @login_required
 def gerenciar_categorias():
     """
@@ -83,12 +111,9 @@ def gerenciar_categorias():
                     409,
                 )
 
-            cursor.execute(
-                "INSERT INTO categoria (nome, descricao) VALUES (?, ?)",
-                (nome, descricao),
+            categoria_id = inserir_registro(
+                "categoria", {"nome": nome, "descricao": descricao}
             )
-            categoria_id = cursor.lastrowid
-            conn.commit()
 
             return (
                 jsonify(
@@ -124,6 +149,7 @@ def gerenciar_categorias():
 
 
 @produtos_bp.route("/categorias/<int:categoria_id>", methods=["GET", "PUT", "DELETE"])
+@somente_leitura
 @login_required
 def gerenciar_categoria_especifica(categoria_id):
     """
@@ -192,20 +218,17 @@ def gerenciar_categoria_especifica(categoria_id):
                         409,
                     )
 
+            campos = {"nome": novo_nome, "descricao": nova_descricao}
             try:
-                cursor.execute(
-                    "UPDATE categoria SET nome = ?, descricao = ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
-                    (novo_nome, nova_descricao, categoria_id),
+                atualizar_registro(
+                    "categoria", categoria_id, campos,
+                    carimbos=("ultima_atualizacao",),
                 )
             except sqlite3.OperationalError as oe:
                 if "no such column: ultima_atualizacao" in str(oe):
-                    cursor.execute(
-                        "UPDATE categoria SET nome = ?, descricao = ? WHERE id = ?",
-                        (novo_nome, nova_descricao, categoria_id),
-                    )
+                    atualizar_registro("categoria", categoria_id, campos)
                 else:
                     raise
-            conn.commit()
             return jsonify(
                 {
                     "message": "Categoria atualizada com sucesso!",
@@ -239,9 +262,7 @@ def gerenciar_categoria_especifica(categoria_id):
                     400,
                 )
 
-            cursor.execute("DELETE FROM categoria WHERE id = ?",
-                           (categoria_id,))
-            conn.commit()
+            excluir_registro("categoria", categoria_id)
             return jsonify({"message": "Categoria excluída com sucesso."})
 
     except sqlite3.Error as e:
@@ -264,6 +285,7 @@ def gerenciar_categoria_especifica(categoria_id):
 
 
 @produtos_bp.route("/", methods=["GET", "POST"])
+@somente_leitura
 @login_required
 def gerenciar_todos_produtos():
     """
@@ -288,20 +310,32 @@ def gerenciar_todos_produtos():
             include_inativos = (
                 request.args.get("incluir_inativos", "").lower() == "true"
             )
-            ordenar_por = request.args.get("ordenar_por", "p.nome")
+            ordenar_por = request.args.get("ordenar_por")
             direcao_ordem = request.args.get("direcao", "asc").upper()
-
-            resultado_busca = buscar_produtos(
-                termo=termo_busca,
-                categoria_id=categoria_id_filter,
-                fornecedor_id=fornecedor_id_filter,
-                estoque_baixo=estoque_baixo_filter,
-                incluir_inativos=include_inativos,
-                page=page,
-                per_page=per_page,
-                ordenar_por=ordenar_por,
-                direcao=direcao_ordem,
+            # Com ?cursor= (vazio na primeira página) a paginação é por
+            # cursor e o total só vem com ?total=true.
+            cursor_pagina = request.args.get("cursor")
+            incluir_total = (
+                cursor_pagina is None
+                or request.args.get("total", "").lower() == "true"
             )
+
+            try:
+                resultado_busca = buscar_produtos(
+                    termo=termo_busca,
+                    categoria_id=categoria_id_filter,
+                    fornecedor_id=fornecedor_id_filter,
+                    estoque_baixo=estoque_baixo_filter,
+                    incluir_inativos=include_inativos,
+                    page=page,
+                    per_page=per_page,
+                    ordenar_por=ordenar_por,
+                    direcao=direcao_ordem,
+                    cursor_pagina=cursor_pagina,
+                    incluir_total=incluir_total,
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             return jsonify(resultado_busca)
 
         elif request.method == "POST":
@@ -399,6 +433,7 @@ def gerenciar_todos_produtos():
                     409,
                 )
 
+            nova_imagem = None
             if file and allowed_file(file.filename):
                 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
                 filename_secure = secure_filename(file.filename)
@@ -406,6 +441,7 @@ def gerenciar_todos_produtos():
                 filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
                 try:
                     file.save(filepath)
+                    nova_imagem = filepath
 
                     imagem_url = f"/{filepath.replace(os.sep, '/')}"
                 except Exception as e_file:
@@ -415,26 +451,27 @@ def gerenciar_todos_produtos():
 
                     imagem_url = None
 
-            sql_insert_prod = """
-                INSERT INTO produto (codigo, nome, descricao, categoria_id, fornecedor_id, preco, preco_compra, estoque, estoque_minimo, imagem_url, ativo, data_criacao, ultima_atualizacao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-            """
-            params_insert = (
-                codigo,
-                nome,
-                descricao,
-                categoria_id,
-                fornecedor_id,
-                preco,
-                preco_compra,
-                estoque,
-                estoque_minimo,
-                imagem_url,
-                1,
-            )
-            cursor.execute(sql_insert_prod, params_insert)
-            produto_id = cursor.lastrowid
-            conn.commit()
+            campos_insert = {
+                "codigo": codigo,
+                "nome": nome,
+                "descricao": descricao,
+                "categoria_id": categoria_id,
+                "fornecedor_id": fornecedor_id,
+                "preco": preco,
+                "preco_compra": preco_compra,
+                "estoque": estoque,
+                "estoque_minimo": estoque_minimo,
+                "imagem_url": imagem_url,
+                "ativo": 1,
+            }
+            try:
+                produto_id = inserir_registro(
+                    "produto", campos_insert,
+                    carimbos=("data_criacao", "ultima_atualizacao"),
+                )
+            except Exception:
+                _descartar_upload(nova_imagem)
+                raise
 
             if estoque > 0:
                 try:
@@ -482,6 +519,7 @@ def gerenciar_todos_produtos():
 
 
 @produtos_bp.route("/<int:produto_id>", methods=["GET", "PUT", "DELETE"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def gerenciar_produto_especifico(produto_id):
@@ -554,8 +592,7 @@ def gerenciar_produto_especifico(produto_id):
             else:
                 return jsonify({"error": "Content-Type não suportado."}), 415
 
-            update_fields_sql = []
-            params_update = []
+            campos_update = {}
 
             allowed_fields = [
                 "nome",
@@ -612,11 +649,9 @@ def gerenciar_produto_especifico(produto_id):
                                 404,
                             )
 
-                    update_fields_sql.append(f"{field} = ?")
-
                     if field in ["preco", "preco_compra"] and value is not None:
                         try:
-                            params_update.append(float(value))
+                            campos_update[field] = float(value)
                         except ValueError:
                             return (
                                 jsonify(
@@ -629,7 +664,7 @@ def gerenciar_produto_especifico(produto_id):
                         and value is not None
                     ):
                         try:
-                            params_update.append(int(value) if value else None)
+                            campos_update[field] = int(value) if value else None
                         except ValueError:
                             return (
                                 jsonify(
@@ -637,10 +672,14 @@ def gerenciar_produto_especifico(produto_id):
                                 400,
                             )
                     else:
-                        params_update.append(
+                        campos_update[field] = (
                             value.strip() if isinstance(value, str) else value
                         )
 
+            # A imagem antiga só é apagada depois do UPDATE gravado; a nova,
+            # se o UPDATE falhar.
+            nova_imagem = None
+            imagem_substituida = None
             if file and allowed_file(file.filename):
                 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
                 filename_secure = secure_filename(file.filename)
@@ -648,34 +687,10 @@ def gerenciar_produto_especifico(produto_id):
                 filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
                 try:
                     file.save(filepath)
-
-                    if produto_dict_orig.get("imagem_url"):
-                        old_image_path_relative = produto_dict_orig[
-                            "imagem_url"
-                        ].lstrip("/")
-                        old_image_path_full = os.path.join(
-                            current_app.root_path, old_image_path_relative
-                        )
-                        if (
-                            os.path.exists(old_image_path_full)
-                            and UPLOAD_FOLDER in old_image_path_full
-                        ):
-                            if (
-                                produto_dict_orig["imagem_url"]
-                                != f"/{filepath.replace(os.sep, '/')}"
-                            ):
-                                try:
-                                    os.remove(old_image_path_full)
-                                    current_app.logger.info(
-                                        f"Imagem antiga {old_image_path_full} excluída."
-                                    )
-                                except OSError as e_rm:
-                                    current_app.logger.error(
-                                        f"Erro ao remover imagem antiga {old_image_path_full}: {e_rm}"
-                                    )
-
-                    update_fields_sql.append("imagem_url = ?")
-                    params_update.append(f"/{filepath.replace(os.sep, '/')}")
+                    nova_imagem = filepath
+                    campos_update["imagem_url"] = f"/{filepath.replace(os.sep, '/')}"
+                    if produto_dict_orig.get("imagem_url") != campos_update["imagem_url"]:
+                        imagem_substituida = produto_dict_orig.get("imagem_url")
                 except Exception as e_file:
                     current_app.logger.error(
                         f"Erro ao salvar nova imagem para produto {produto_id}: {e_file}",
@@ -684,43 +699,24 @@ def gerenciar_produto_especifico(produto_id):
             elif (
                 "imagem_url" in data
                 and data["imagem_url"] is None
-                and "imagem_url = ?" not in " ".join(update_fields_sql)
+                and "imagem_url" not in campos_update
             ):
-                update_fields_sql.append("imagem_url = ?")
-                params_update.append(None)
-
-                if produto_dict_orig.get("imagem_url"):
-                    old_image_path_relative = produto_dict_orig["imagem_url"].lstrip(
-                        "/"
-                    )
-                    old_image_path_full = os.path.join(
-                        current_app.root_path, old_image_path_relative
-                    )
-                    if (
-                        os.path.exists(old_image_path_full)
-                        and UPLOAD_FOLDER in old_image_path_full
-                    ):
-                        try:
-                            os.remove(old_image_path_full)
-                            current_app.logger.info(
-                                f"Imagem antiga {old_image_path_full} excluída ao setar imagem_url para None."
-                            )
-                        except OSError as e_rm:
-                            current_app.logger.error(
-                                f"Erro ao remover imagem antiga {old_image_path_full}: {e_rm}"
-                            )
+                campos_update["imagem_url"] = None
+                imagem_substituida = produto_dict_orig.get("imagem_url")
 
-            if not update_fields_sql:
+            if not campos_update:
                 return jsonify({"message": "Nenhuma alteração válida fornecida."})
 
-            update_fields_sql.append("ultima_atualizacao = CURRENT_TIMESTAMP")
-            params_update.append(produto_id)
-
-            sql_update_prod = (
-                f"UPDATE produto SET {', '.join(update_fields_sql)} WHERE id = ?"
-            )
-            cursor.execute(sql_update_prod, params_update)
-            conn.commit()
+            try:
+                atualizar_registro(
+                    "produto", produto_id, campos_update,
+                    carimbos=("ultima_atualizacao",),
+                )
+            except Exception:
+                _descartar_upload(nova_imagem)
+                raise
+            if imagem_substituida:
+                _remover_imagem(imagem_substituida)
 
             produto_atualizado_dict = dict(fetch_produto_completo(produto_id))
             return jsonify(
@@ -770,30 +766,10 @@ def gerenciar_produto_especifico(produto_id):
                     "Tabela item_venda não encontrada, pulando verificação de vendas para exclusão de produto."
                 )
 
+            excluir_registro("produto", produto_id)
             imagem_a_excluir = produto_dict_orig.get("imagem_url")
             if imagem_a_excluir:
-                try:
-                    path_relativa_app = imagem_a_excluir.lstrip("/")
-                    caminho_completo_imagem = os.path.join(
-                        current_app.root_path, path_relativa_app
-                    )
-
-                    if (
-                        os.path.exists(caminho_completo_imagem)
-                        and UPLOAD_FOLDER in caminho_completo_imagem
-                    ):
-                        os.remove(caminho_completo_imagem)
-                        current_app.logger.info(
-                            f"Imagem {caminho_completo_imagem} excluída para produto ID {produto_id}."
-                        )
-                except Exception as img_err:
-                    current_app.logger.error(
-                        f"Falha ao excluir imagem {imagem_a_excluir} para produto ID {produto_id}: {img_err}",
-                        exc_info=True,
-                    )
-
-            cursor.execute("DELETE FROM produto WHERE id = ?", (produto_id,))
-            conn.commit()
+                _remover_imagem(imagem_a_excluir)
             return jsonify({"message": "Produto excluído com sucesso."})
 
     except sqlite3.Error as e:
@@ -822,55 +798,34 @@ def gerenciar_produto_especifico(produto_id):
 @acesso_requerido(["admin", "gerente"])
 def alternar_status_produto(produto_id):
     """Alterna o status ativo/inativo de um produto sem excluí-lo."""
-    conn = None
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT id, nome, ativo FROM produto WHERE id = ?",
-            (produto_id,),
-        )
-        produto = cursor.fetchone()
-        if not produto:
+        novo_status = inverter_status_produto(produto_id)
+        if novo_status is None:
             return jsonify({"error": "Produto não encontrado."}), 404
 
-        novo_status = 0 if int(produto["ativo"]) == 1 else 1
-        cursor.execute(
-            "UPDATE produto SET ativo = ?, ultima_atualizacao = CURRENT_TIMESTAMP WHERE id = ?",
-            (novo_status, produto_id),
-        )
-        conn.commit()
-
         return jsonify(
             {
                 "message": f"Produto {'ativado' if novo_status else 'inativado'} com sucesso!",
                 "id": produto_id,
-                "ativo": bool(novo_status),
+                "ativo": novo_status,
             }
         )
     except sqlite3.Error as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro de BD ao alternar status do produto {produto_id}: {e}",
             exc_info=True,
         )
         return jsonify({"error": "Erro no banco de dados."}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
         current_app.logger.error(
             f"Erro inesperado ao alternar status do produto {produto_id}: {e}",
             exc_info=True,
         )
         return jsonify({"error": "Erro inesperado no servidor."}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 @produtos_bp.route("/mais-vendidos", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente", "operador"])
 def relatorio_produtos_mais_vendidos():
@@ -882,43 +837,26 @@ def relatorio_produtos_mais_vendidos():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
 
-        count_query = """
-            SELECT COUNT(*) FROM (
-                SELECT p.id, COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-                FROM produto p
-                LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-                GROUP BY p.id
-                HAVING total_vendido > 0
-            )
+        count_query = f"""
+            SELECT COUNT(*) FROM ({SQL_TOTAL_VENDIDO_POR_PRODUTO}) t
+            JOIN produto p ON p.id = t.produto_id
+            WHERE t.total_vendido > 0
         """
         cursor.execute(count_query)
         total_items = cursor.fetchone()[0]
 
-        query = """
+        query = f"""
             SELECT
                 p.id,
                 p.codigo,
                 p.nome,
                 c.nome as categoria_nome,
-                COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-            FROM produto p
+                t.total_vendido
+            FROM ({SQL_TOTAL_VENDIDO_POR_PRODUTO}) t
+            JOIN produto p ON p.id = t.produto_id
             LEFT JOIN categoria c ON p.categoria_id = c.id
-            LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-            GROUP BY p.id, p.codigo, p.nome, c.nome
-            HAVING total_vendido > 0
-            ORDER BY total_vendido DESC, p.nome ASC
+            WHERE t.total_vendido > 0
+            ORDER BY t.total_vendido DESC, p.nome ASC
             LIMIT ? OFFSET ?
         """
         params = (per_page, (page - 1) * per_page)
@@ -952,6 +890,7 @@ def relatorio_produtos_mais_vendidos():
 
 
 @produtos_bp.route("/menos-vendidos", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente", "operador"])
 def relatorio_produtos_menos_vendidos():
@@ -963,103 +902,35 @@ def relatorio_produtos_menos_vendidos():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 10, type=int)
 
+        # Os totais por produto são calculados uma vez (a partir do resumo
+        # diário) e usados na contagem, na exclusão dos 5 mais vendidos e na
+        # página.
         cursor.execute(
-            """
-            SELECT COUNT(*) FROM (
-                SELECT p.id, COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-                FROM produto p
-                LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-                GROUP BY p.id
-                HAVING total_vendido > 0
-            )
+            f"""
+            SELECT p.id, p.codigo, p.nome, c.nome as categoria_nome, t.total_vendido
+            FROM ({SQL_TOTAL_VENDIDO_POR_PRODUTO}) t
+            JOIN produto p ON p.id = t.produto_id
+            LEFT JOIN categoria c ON p.categoria_id = c.id
+            WHERE t.total_vendido > 0
+            ORDER BY t.total_vendido DESC, p.nome ASC
         """
         )
-        total_com_vendas = cursor.fetchone()[0]
-
-        excluir_ids = []
-        if total_com_vendas > 5:
-            cursor.execute(
-                """
-                SELECT p.id, COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-                FROM produto p
-                LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-                GROUP BY p.id
-                ORDER BY total_vendido DESC, p.nome ASC
-                LIMIT 5
-            """
-            )
-            excluir_ids = [row["id"] for row in cursor.fetchall()]
+        com_vendas = [dict(row) for row in cursor.fetchall()]
+        total_com_vendas = len(com_vendas)
 
-        where_clause = ""
-        query_params = []
-        if excluir_ids:
-            placeholders = ",".join(["?"] * len(excluir_ids))
-            where_clause = f"WHERE p.id NOT IN ({placeholders})"
-            query_params = list(excluir_ids)
+        restantes = com_vendas[5:] if total_com_vendas > 5 else com_vendas
+        restantes.sort(key=lambda produto: (produto["total_vendido"], produto["nome"]))
+        total_items = len(restantes)
 
-        count_query = f"""
-            SELECT COUNT(*) FROM (
-                SELECT p.id, COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-                FROM produto p
-                LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-                {where_clause}
-                GROUP BY p.id
-                HAVING total_vendido > 0
-            )
-        """
-        cursor.execute(count_query, query_params)
-        total_items = cursor.fetchone()[0]
-
-        query = f"""
-            SELECT
-                p.id,
-                p.codigo,
-                p.nome,
-                c.nome as categoria_nome,
-                COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) as total_vendido
-            FROM produto p
-            LEFT JOIN categoria c ON p.categoria_id = c.id
-            LEFT JOIN estoque_movimentacao em ON p.id = em.produto_id
-            {where_clause}
-            GROUP BY p.id, p.codigo, p.nome, c.nome
-            HAVING total_vendido > 0
-            ORDER BY total_vendido ASC, p.nome ASC
-            LIMIT ? OFFSET ?
-        """
-        params = query_params + [per_page, (page - 1) * per_page]
-        cursor.execute(query, params)
-        produtos_rows = cursor.fetchall()
+        inicio = (page - 1) * per_page
+        produtos_pagina = restantes[inicio:inicio + per_page] if inicio >= 0 else []
 
         total_pages = (total_items + per_page -
                        1) // per_page if per_page > 0 else 1
 
         return jsonify(
             {
-                "produtos": [dict(row) for row in produtos_rows],
+                "produtos": produtos_pagina,
                 "total": total_items,
                 "pages": total_pages,
                 "page": page,
@@ -1081,6 +952,7 @@ def relatorio_produtos_menos_vendidos():
 
 
 @produtos_bp.route("/busca", methods=["GET"])
+@somente_leitura
 @login_required
 def api_busca_produto():
     """Endpoint de API para busca avançada de produtos."""
@@ -1096,20 +968,30 @@ def api_busca_produto():
         )
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 15, type=int)
-        ordenar_por = request.args.get("ordenar_por", "p.nome")
+        ordenar_por = request.args.get("ordenar_por")
         direcao = request.args.get("direcao", "ASC")
-
-        resultado = buscar_produtos(
-            termo=termo,
-            categoria_id=categoria_id,
-            fornecedor_id=fornecedor_id,
-            estoque_baixo=estoque_baixo,
-            incluir_inativos=incluir_inativos,
-            page=page,
-            per_page=per_page,
-            ordenar_por=ordenar_por,
-            direcao=direcao,
+        cursor_pagina = request.args.get("cursor")
+        incluir_total = (
+            cursor_pagina is None
+            or request.args.get("total", "").lower() == "true"
         )
+
+        try:
+            resultado = buscar_produtos(
+                termo=termo,
+                categoria_id=categoria_id,
+                fornecedor_id=fornecedor_id,
+                estoque_baixo=estoque_baixo,
+                incluir_inativos=incluir_inativos,
+                page=page,
+                per_page=per_page,
+                ordenar_por=ordenar_por,
+                direcao=direcao,
+                cursor_pagina=cursor_pagina,
+                incluir_total=incluir_total,
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         return jsonify(resultado)
     except Exception as e:
         current_app.logger.error(
@@ -0,0 +1,188 @@
+"""
+Configuração de logs da aplicação.
+
+Os loggers da aplicação só enfileiram registros (QueueHandler); uma thread
+de fundo (QueueListener) os grava no arquivo com rotação por tamanho e no
+console. Assim, a escrita em disco e a rotação do arquivo não entram na
+latência das requisições.
+
+Variáveis de ambiente:
+    LOG_DIR           Diretório dos logs (padrão: logs).
+    LOG_FILE          Nome do arquivo (padrão: app.log).
+    LOG_MAX_BYTES     Tamanho máximo antes de rotacionar (padrão: 10 MiB).
+    LOG_BACKUP_COUNT  Arquivos rotacionados mantidos (padrão: 5).
+    LOG_JSON          "1"/"true" grava uma linha JSON por registro.
+    LOG_LEVEL         Nível mínimo (padrão: INFO).
+
+As consultas lentas (ver database_utils.CursorMedido) vão, uma linha JSON
+por consulta, para um arquivo próprio com a mesma rotação:
+    SQL_LENTA_ARQUIVO Caminho do arquivo (padrão: <LOG_DIR>/consultas_lentas.log).
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask.logging import default_handler
+
+
+LOG_MAX_BYTES_PADRAO = 10 * 1024 * 1024
+LOG_BACKUP_COUNT_PADRAO = 5
+FORMATO_TEXTO = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+# Loggers de módulo (logging.getLogger(__name__)) que passam pela fila além
+# do app.logger do Flask.
+LOGGERS_APLICACAO = (
+    "database_utils",
+    "models",
+    "cache_dashboard",
+    "eventos",
+    "escritor",
+    "backup",
+)
+
+# Logger dos registros de consultas lentas: a mensagem já é uma linha JSON.
+LOGGER_CONSULTAS_LENTAS = "consultas_lentas"
+
+_lock = threading.Lock()
+_configuracao = None
+
+
+class FormatadorJson(logging.Formatter):
+    """Uma linha JSON por registro."""
+
+    def format(self, record):
+        dados = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created)
+            .astimezone()
+            .isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+            "modulo": record.module,
+            "linha": record.lineno,
+            "thread": record.threadName,
+            "processo": record.process,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados["excecao"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class HandlerFila(QueueHandler):
+    """
+    QueueHandler que só resolve a mensagem (`msg % args`) e o traceback antes
+    de enfileirar, deixando a formatação final (texto ou JSON) para a thread
+    de gravação.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _ativado(valor):
+    return str(valor).strip().lower() in ("1", "true", "sim", "yes")
+
+
+def caminho_log_consultas_lentas():
+    """Arquivo (atual) do log de consultas lentas."""
+    return os.getenv("SQL_LENTA_ARQUIVO") or os.path.join(
+        os.getenv("LOG_DIR", "logs"), "consultas_lentas.log"
+    )
+
+
+def _arquivo_rotativo(caminho, formatador):
+    arquivo = RotatingFileHandler(
+        caminho,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", LOG_MAX_BYTES_PADRAO)),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", LOG_BACKUP_COUNT_PADRAO)),
+        encoding="utf-8",
+        delay=True,
+    )
+    arquivo.setFormatter(formatador)
+    return arquivo
+
+
+class _FiltroExcluir(logging.Filter):
+    """Rejeita os registros de um logger (e de seus filhos)."""
+
+    def filter(self, record):
+        return not super().filter(record)
+
+
+def configurar_logs(app):
+    """
+    Liga app.logger e os loggers dos módulos à fila de logs e inicia a
+    thread de gravação. Chamadas repetidas (várias instâncias da aplicação
+    no mesmo processo) reaproveitam a mesma fila e o mesmo listener.
+
+    Returns:
+        QueueListener: O listener em execução.
+    """
+    global _configuracao
+    nivel = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+    if not isinstance(nivel, int):
+        nivel = logging.INFO
+
+    with _lock:
+        if _configuracao is None:
+            diretorio = os.getenv("LOG_DIR", "logs")
+            os.makedirs(diretorio, exist_ok=True)
+            formatador = (
+                FormatadorJson()
+                if _ativado(os.getenv("LOG_JSON", ""))
+                else logging.Formatter(FORMATO_TEXTO)
+            )
+
+            arquivo = _arquivo_rotativo(
+                os.path.join(diretorio, os.getenv("LOG_FILE", "app.log")), formatador
+            )
+            console = logging.StreamHandler(sys.stderr)
+            console.setFormatter(logging.Formatter(
+                "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"))
+            for handler in (arquivo, console):
+                handler.addFilter(_FiltroExcluir(LOGGER_CONSULTAS_LENTAS))
+
+            caminho_lentas = caminho_log_consultas_lentas()
+            os.makedirs(os.path.dirname(caminho_lentas) or ".", exist_ok=True)
+            lentas = _arquivo_rotativo(
+                caminho_lentas, logging.Formatter("%(message)s"))
+            lentas.addFilter(logging.Filter(LOGGER_CONSULTAS_LENTAS))
+
+            fila = queue.SimpleQueue()
+            listener = QueueListener(
+                fila, arquivo, console, lentas, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+            _configuracao = (HandlerFila(fila), listener)
+
+        handler, listener = _configuracao
+
+    # O handler padrão do Flask escreve no stderr na própria thread da
+    # requisição; o console passa a ser atendido pelo listener.
+    app.logger.removeHandler(default_handler)
+    for logger in [app.logger] + [logging.getLogger(n) for n in LOGGERS_APLICACAO]:
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
+        logger.setLevel(nivel)
+
+    lentas = logging.getLogger(LOGGER_CONSULTAS_LENTAS)
+    if handler not in lentas.handlers:
+        lentas.addHandler(handler)
+    lentas.setLevel(logging.INFO)
+    lentas.propagate = False
+    return listener
+
@@ -6,7 +6,7 @@ from flask import (
     current_app,
     render_template,
 )
-from database_utils import get_db
+from database_utils import get_db, somente_leitura, SQL_TOTAL_VENDIDO_POR_PRODUTO
 from auth import login_required, acesso_requerido
 
 
@@ -14,12 +14,13 @@ relatorios_bp = Blueprint("relatorios", __name__, url_prefix="/relatorios")
 
 
 @relatorios_bp.route("/vendas/produtos", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_product_sales_reports():
     """
     Gera relatórios de produtos mais e menos vendidos.
-    Consulta a tabela 'estoque_movimentacao' para agregar as quantidades vendidas de forma unificada.
+    Lê o resumo diário 'vendas_diarias_produto', mantido junto com as movimentações de estoque.
     """
     conn = None
     try:
@@ -30,25 +31,18 @@ def get_product_sales_reports():
         if not (0 < limit <= 100):
             limit = 10
 
-        base_sql_vendas = """
+        base_sql_vendas = f"""
             SELECT
                 p.id as produto_id,
                 p.codigo as produto_codigo,
                 p.nome AS produto_nome,
                 c.nome AS categoria_nome,
-                COALESCE(SUM(
-                    CASE
-                        WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                        WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                        ELSE 0
-                    END
-                ), 0) AS total_vendido,
+                t.total_vendido,
                 p.estoque as estoque_atual
-            FROM produto p
+            FROM ({SQL_TOTAL_VENDIDO_POR_PRODUTO}) t
+            JOIN produto p ON p.id = t.produto_id
             LEFT JOIN categoria c ON p.categoria_id = c.id
-            JOIN estoque_movimentacao em ON p.id = em.produto_id
-            GROUP BY p.id, p.codigo, p.nome, c.nome, p.estoque
-            HAVING total_vendido > 0
+            WHERE t.total_vendido > 0
         """
 
         query_mais_vendidos = (
@@ -76,9 +70,8 @@ def get_product_sales_reports():
             FROM produto p
             LEFT JOIN categoria c ON p.categoria_id = c.id
             WHERE p.id NOT IN (
-                SELECT DISTINCT em.produto_id 
-                FROM estoque_movimentacao em 
-                WHERE em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda')
+                SELECT produto_id FROM vendas_diarias_produto
+                WHERE quantidade_vendida > 0
             )
             ORDER BY p.nome ASC
             LIMIT ? 
@@ -113,6 +106,7 @@ def get_product_sales_reports():
 
 
 @relatorios_bp.route("/estoque/niveis", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_stock_level_reports():
@@ -210,6 +204,7 @@ def get_stock_level_reports():
 
 
 @relatorios_bp.route("/fornecedores/resumo", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_supplier_summary_report():
@@ -297,6 +292,7 @@ def get_supplier_summary_report():
 
 
 @relatorios_bp.route("/fornecedores/produtos", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_supplier_products_report():
@@ -378,6 +374,7 @@ def get_supplier_products_report():
 
 
 @relatorios_bp.route("/vendas/operadores", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_operator_sales_report():
@@ -388,24 +385,19 @@ def get_operator_sales_report():
         cursor = conn.cursor()
 
         query = """
-            SELECT 
+            SELECT
                 u.id as usuario_id,
                 u.nome as usuario_nome,
                 u.email as usuario_email,
                 u.nivel_acesso as usuario_nivel,
-                SUM(CASE WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade) ELSE 0 END) as total_itens_vendidos,
-                SUM(CASE WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN ABS(em.quantidade) ELSE 0 END) as total_itens_devolvidos,
+                SUM(vd.quantidade_vendida) as total_itens_vendidos,
+                SUM(vd.quantidade_devolvida) as total_itens_devolvidos,
                 SUM(
-                    (CASE WHEN em.tipo = 'venda' OR (em.tipo = 'saida' AND em.classificacao = 'venda') THEN ABS(em.quantidade)
-                          WHEN em.tipo = 'entrada' AND em.classificacao = 'devolucao' THEN -ABS(em.quantidade)
-                          ELSE 0 END) * COALESCE(p.preco, 0)
+                    (vd.quantidade_vendida - vd.quantidade_devolvida) * COALESCE(p.preco, 0)
                 ) as receita_total
             FROM usuario u
-            JOIN estoque_movimentacao em ON u.id = em.usuario_id
-            LEFT JOIN produto p ON em.produto_id = p.id
-            WHERE em.tipo = 'venda' 
-               OR (em.tipo = 'saida' AND em.classificacao = 'venda') 
-               OR (em.tipo = 'entrada' AND em.classificacao = 'devolucao')
+            JOIN vendas_diarias_produto vd ON u.id = vd.usuario_id
+            LEFT JOIN produto p ON vd.produto_id = p.id
             GROUP BY u.id, u.nome, u.email, u.nivel_acesso
             ORDER BY receita_total DESC
         """
@@ -428,6 +420,7 @@ def get_operator_sales_report():
 
 
 @relatorios_bp.route("/registros/gerais", methods=["GET"])
+@somente_leitura
 @login_required
 @acesso_requerido(["admin", "gerente"])
 def get_general_records_report():
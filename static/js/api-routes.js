@@ -9,6 +9,7 @@ const API_ROUTES = {
   USUARIO_DETALHES: (id) => `/auth/usuarios/${id}`,
 
   DASHBOARD_STATS: "/api/dashboard/stats",
+  EVENTOS: "/api/eventos",
 
   PRODUTOS_LISTAR: "/produtos/",
   PRODUTO_DETALHES: (id) => `/produtos/${id}`,
@@ -30,6 +31,7 @@ const API_ROUTES = {
   ESTOQUE_ENTRADA: "/estoque/entrada",
   ESTOQUE_SAIDA: "/estoque/saida",
   ESTOQUE_AJUSTE: "/estoque/ajuste",
+  ESTOQUE_LOTE: "/estoque/lote",
 
   VENDAS_LISTAR_REGISTRAR: "/estoque/vendas",
   VENDA_DETALHES: (id) => `/estoque/vendas/${id}`,
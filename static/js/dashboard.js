@@ -27,6 +27,7 @@ document.addEventListener("DOMContentLoaded", () => {
       if (initialSpinner) {
         initialSpinner.style.display = "none";
       }
+      conectarEventosDashboard();
     });
 });
 
@@ -58,30 +59,7 @@ function carregarEstatisticas() {
     .get(API_ROUTES.DASHBOARD_STATS)
     .then((response) => {
       const data = response.data || {};
-      const totalProdutosEl = document.getElementById("total-produtos");
-      const totalCategoriasEl = document.getElementById("total-categorias");
-      const valorEstoqueEl = document.getElementById("valor-estoque");
-      const estoqueBaixoEl = document.getElementById("estoque-baixo");
-
-      if (totalProdutosEl)
-        totalProdutosEl.textContent = data.total_produtos ?? "0";
-      if (totalCategoriasEl)
-        totalCategoriasEl.textContent = data.total_categorias ?? "0";
-      if (estoqueBaixoEl)
-        estoqueBaixoEl.textContent = data.produtos_estoque_baixo ?? "0";
-      if (valorEstoqueEl) {
-        valorEstoqueEl.textContent = `R$ ${(
-          data.valor_total_estoque || 0
-        ).toLocaleString("pt-BR", {
-          minimumFractionDigits: 2,
-          maximumFractionDigits: 2,
-        })}`;
-      }
-
-      const inativosEl = document.getElementById("produtos-inativos");
-      if (inativosEl && data.produtos_inativos !== undefined) {
-        inativosEl.textContent = data.produtos_inativos || "0";
-      }
+      aplicarContadoresDashboard(data);
 
       criarGraficoClassificacao(
         "graficoEntradasClassificacao",
@@ -103,6 +81,63 @@ function carregarEstatisticas() {
     });
 }
 
+function aplicarContadoresDashboard(data) {
+  const totalProdutosEl = document.getElementById("total-produtos");
+  const totalCategoriasEl = document.getElementById("total-categorias");
+  const valorEstoqueEl = document.getElementById("valor-estoque");
+  const estoqueBaixoEl = document.getElementById("estoque-baixo");
+
+  if (totalProdutosEl)
+    totalProdutosEl.textContent = data.total_produtos ?? "0";
+  if (totalCategoriasEl)
+    totalCategoriasEl.textContent = data.total_categorias ?? "0";
+  if (estoqueBaixoEl)
+    estoqueBaixoEl.textContent = data.produtos_estoque_baixo ?? "0";
+  if (valorEstoqueEl) {
+    valorEstoqueEl.textContent = `R$ ${(
+      data.valor_total_estoque || 0
+    ).toLocaleString("pt-BR", {
+      minimumFractionDigits: 2,
+      maximumFractionDigits: 2,
+    })}`;
+  }
+
+  const inativosEl = document.getElementById("produtos-inativos");
+  if (inativosEl && data.produtos_inativos !== undefined) {
+    inativosEl.textContent = data.produtos_inativos || "0";
+  }
+}
+
+// Atualizações em tempo real via /api/eventos: os contadores chegam prontos
+// no evento "estatisticas"; gráficos e rankings são recarregados uma única
+// vez por rajada de movimentos.
+function conectarEventosDashboard() {
+  if (typeof EventSource === "undefined" || !API_ROUTES.EVENTOS) return;
+
+  const fonte = new EventSource(API_ROUTES.EVENTOS);
+  let recargaTimeout;
+  const agendarRecarga = () => {
+    clearTimeout(recargaTimeout);
+    recargaTimeout = setTimeout(atualizarDadosDashboard, 5000);
+  };
+
+  fonte.addEventListener("estatisticas", (e) => {
+    const dados = JSON.parse(e.data);
+    aplicarContadoresDashboard(dados.contadores || {});
+  });
+  ["movimento", "venda", "cancelamento"].forEach((tipo) =>
+    fonte.addEventListener(tipo, agendarRecarga),
+  );
+  fonte.addEventListener("desconectado", () => {
+    // Cliente lento descartado pelo servidor: reconecta e ressincroniza.
+    fonte.close();
+    setTimeout(() => {
+      atualizarDadosDashboard();
+      conectarEventosDashboard();
+    }, 5000);
+  });
+}
+
 function carregarProdutosMaisVendidos() {
   if (typeof API_ROUTES === "undefined" || !API_ROUTES.PRODUTOS_MAIS_VENDIDOS) {
     console.error(
@@ -15,6 +15,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   carregarMovimentacoes();
   configurarFiltrosMovimentacoes();
+  conectarEventosMovimentacoes();
 });
 
 let currentPageMov = 1;
@@ -123,45 +124,83 @@ function montarTabelaMovimentacoes(movimentacoes) {
   }
 
   movimentacoes.forEach((mov) => {
-    const tr = document.createElement("tr");
-    const classificacaoFmt =
-      MAP_CLASSIFICACAO[mov.classificacao] || mov.classificacao || "-";
-    tr.innerHTML = `
-            <td>${mov.id}</td>
-            <td>
-                ${mov.produto ? `${mov.produto.nome || "N/A"} <small class="text-muted d-block">(${mov.produto.codigo || "S/Cód."})</small>` : "Produto não encontrado"}
-            </td>
-            <td><span class="badge bg-${getBadgeClassForTipo(mov.tipo)}">${mov.tipo.charAt(0).toUpperCase() + mov.tipo.slice(1)}</span></td>
-            <td><span class="badge bg-secondary">${classificacaoFmt}</span></td>
-            <td>${mov.quantidade}</td>
-            <td>${mov.estoque_anterior !== null ? mov.estoque_anterior : "N/A"}</td>
-            <td>${mov.estoque_atual !== null ? mov.estoque_atual : "N/A"}</td>
-            <td>${mov.data || "N/A"}</td>
-            <td>${mov.usuario ? mov.usuario.nome || "Sistema" : "Sistema"}</td>
-        `;
-
-    const tdObs = document.createElement("td");
-    if (mov.observacao) {
-      tdObs.innerHTML = `
-                <div class="d-flex align-items-center gap-1">
-                    <span class="text-truncate" style="max-width: 150px;">${mov.observacao}</span>
-                    <button class="btn btn-xs btn-outline-primary py-0 px-1 btn-ver-obs" style="font-size: 0.75rem;" title="Ver Observação Completa">
-                        <i class="fas fa-eye"></i>
-                    </button>
-                </div>
-            `;
-      tdObs.querySelector(".btn-ver-obs").addEventListener("click", () => {
-        mostrarPopupObservacao(mov.observacao);
-      });
-    } else {
-      tdObs.textContent = "-";
-    }
-    tr.appendChild(tdObs);
+    tabelaCorpo.appendChild(criarLinhaMovimentacao(mov));
+  });
+}
+
+function criarLinhaMovimentacao(mov) {
+  const tr = document.createElement("tr");
+  const classificacaoFmt =
+    MAP_CLASSIFICACAO[mov.classificacao] || mov.classificacao || "-";
+  tr.innerHTML = `
+          <td>${mov.id}</td>
+          <td>
+              ${mov.produto ? `${mov.produto.nome || "N/A"} <small class="text-muted d-block">(${mov.produto.codigo || "S/Cód."})</small>` : "Produto não encontrado"}
+          </td>
+          <td><span class="badge bg-${getBadgeClassForTipo(mov.tipo)}">${mov.tipo.charAt(0).toUpperCase() + mov.tipo.slice(1)}</span></td>
+          <td><span class="badge bg-secondary">${classificacaoFmt}</span></td>
+          <td>${mov.quantidade}</td>
+          <td>${mov.estoque_anterior !== null ? mov.estoque_anterior : "N/A"}</td>
+          <td>${mov.estoque_atual !== null ? mov.estoque_atual : "N/A"}</td>
+          <td>${mov.data || "N/A"}</td>
+          <td>${mov.usuario ? mov.usuario.nome || "Sistema" : "Sistema"}</td>
+      `;
+
+  const tdObs = document.createElement("td");
+  if (mov.observacao) {
+    tdObs.innerHTML = `
+              <div class="d-flex align-items-center gap-1">
+                  <span class="text-truncate" style="max-width: 150px;">${mov.observacao}</span>
+                  <button class="btn btn-xs btn-outline-primary py-0 px-1 btn-ver-obs" style="font-size: 0.75rem;" title="Ver Observação Completa">
+                      <i class="fas fa-eye"></i>
+                  </button>
+              </div>
+          `;
+    tdObs.querySelector(".btn-ver-obs").addEventListener("click", () => {
+      mostrarPopupObservacao(mov.observacao);
+    });
+  } else {
+    tdObs.textContent = "-";
+  }
+  tr.appendChild(tdObs);
+
+  return tr;
+}
 
-    tabelaCorpo.appendChild(tr);
+// Novas movimentações chegam por /api/eventos e são inseridas no topo da
+// primeira página (sem filtros), sem recarregar a listagem.
+function conectarEventosMovimentacoes() {
+  if (typeof EventSource === "undefined" || !API_ROUTES.EVENTOS) return;
+
+  const fonte = new EventSource(API_ROUTES.EVENTOS);
+  fonte.addEventListener("movimento", (e) => {
+    if (currentPageMov !== 1 || Object.keys(getCurrentFiltersMov()).length) {
+      return;
+    }
+    inserirMovimentacaoNoTopo(JSON.parse(e.data));
+  });
+  fonte.addEventListener("desconectado", () => {
+    fonte.close();
+    setTimeout(() => {
+      carregarMovimentacoes(currentPageMov, getCurrentFiltersMov());
+      conectarEventosMovimentacoes();
+    }, 5000);
   });
 }
 
+function inserirMovimentacaoNoTopo(mov) {
+  const tabelaCorpo = document.getElementById("movimentacoes-tabela-corpo");
+  if (!tabelaCorpo) return;
+
+  tabelaCorpo.querySelectorAll("td[colspan]").forEach((td) =>
+    td.parentElement.remove(),
+  );
+  tabelaCorpo.prepend(criarLinhaMovimentacao(mov));
+  while (tabelaCorpo.children.length > perPageMov) {
+    tabelaCorpo.lastElementChild.remove();
+  }
+}
+
 function getBadgeClassForTipo(tipo) {
   switch (tipo) {
     case "entrada":
@@ -0,0 +1,468 @@
+"""
+Teste de carga com escrita concorrente (flask teste-carga).
+
+Sobe a aplicação em um ou mais servidores WSGI reais (werkzeug, um processo
+por servidor, todos no mesmo arquivo SQLite, como vários workers do
+gunicorn) e dispara tráfego misto de N threads ou processos clientes:
+vendas, saídas, entradas e leituras, nas proporções pedidas. Ao final
+informa vazão, percentis de latência por operação, erros SQLITE_BUSY/locked
+(contados pelos próprios servidores em gep_sql_errors_total), transações
+repetidas por contenção (gep_sql_retries_total) e violações de
+consistência do estoque:
+
+- produto.estoque deve variar exatamente a soma das quantidades dos
+  movimentos gravados durante o teste;
+- cada movimento novo deve partir do estoque_atual do movimento anterior do
+  mesmo produto (sem atualizações perdidas);
+- vendas e movimentos gravados devem bater com as respostas de sucesso.
+"""
+
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import secrets
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import database_utils
+from benchmark import EMAIL_BENCHMARK, SENHA_BENCHMARK, DADOS_PADRAO, preparar_banco
+from database_utils import configurar_pool
+
+
+MISTURA_PADRAO = {"venda": 40, "saida": 25, "entrada": 5, "leitura": 30}
+LEITURAS = ("/estoque/movimentacoes", "/produtos/busca?termo=caderno", "/api/dashboard/stats")
+# Produtos disputados pelas escritas: poucos, para forçar contenção.
+PRODUTOS_DISPUTADOS = 10
+
+_RE_ERROS_SQL = re.compile(r'^gep_sql_errors_total\{codigo="([^"]+)"\} (\S+)$', re.MULTILINE)
+_RE_REPETICOES = re.compile(
+    r'^gep_sql_(retries|retry_giveups)_total\{operacao="[^"]+"\} (\S+)$', re.MULTILINE)
+_RE_LOTES_ESCRITOR = re.compile(r'^gep_writer_batches_total (\S+)$', re.MULTILINE)
+_RE_COMANDOS_ESCRITOR = re.compile(
+    r'^gep_writer_commands_total\{resultado="([^"]+)"\} (\S+)$', re.MULTILINE)
+
+
+def interpretar_mistura(texto):
+    """'venda=40,saida=25,...' -> {"venda": 40, ...}."""
+    mistura = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        nome, _, peso = parte.partition("=")
+        nome = nome.strip()
+        if nome not in MISTURA_PADRAO:
+            raise ValueError(
+                f"Operação desconhecida: {nome} (use {', '.join(MISTURA_PADRAO)}).")
+        try:
+            mistura[nome] = float(peso)
+        except ValueError:
+            raise ValueError(f"Peso inválido para {nome}: {peso!r}")
+    if not mistura or sum(mistura.values()) <= 0:
+        raise ValueError("A mistura precisa de ao menos uma operação com peso positivo.")
+    return mistura
+
+
+# --- Servidores -------------------------------------------------------------
+
+def _servir(database, conexao, threads, escritor_unico, token_metricas):
+    """Processo servidor: aplicação completa em um werkzeug na porta livre."""
+    # Sem um registro por requisição/venda no console durante a carga.
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["METRICAS_TOKEN"] = token_metricas
+    import logging
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from app import create_app
+
+    aplicacao = create_app({"DATABASE": database, "ESCRITOR_UNICO": escritor_unico})
+    servidor = make_server("127.0.0.1", 0, aplicacao, threaded=threads)
+    conexao.send(servidor.server_port)
+    servidor.serve_forever()
+
+
+def _iniciar_servidores(database, quantidade, threads, escritor_unico, token_metricas):
+    contexto = multiprocessing.get_context("spawn")
+    servidores = []
+    for _ in range(quantidade):
+        receptor, emissor = contexto.Pipe(duplex=False)
+        processo = contexto.Process(
+            target=_servir,
+            args=(database, emissor, threads, escritor_unico, token_metricas),
+            daemon=True,
+        )
+        processo.start()
+        if not receptor.poll(60):
+            processo.terminate()
+            raise RuntimeError("Servidor de teste não iniciou em 60 s.")
+        servidores.append((processo, receptor.recv()))
+    return servidores
+
+
+def _metricas_servidor(porta, token_metricas):
+    """Erros SQL, repetições e contadores do escritor único do /metrics do servidor."""
+    conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+    try:
+        conexao.request(
+            "GET", "/metrics", headers={"Authorization": f"Bearer {token_metricas}"})
+        texto = conexao.getresponse().read().decode("utf-8")
+    finally:
+        conexao.close()
+    repeticoes = {"retries": 0.0, "retry_giveups": 0.0}
+    for nome, valor in _RE_REPETICOES.findall(texto):
+        repeticoes[nome] += float(valor)
+    return (
+        {codigo: float(valor) for codigo, valor in _RE_ERROS_SQL.findall(texto)},
+        repeticoes,
+        sum(float(valor) for valor in _RE_LOTES_ESCRITOR.findall(texto)),
+        {resultado: float(valor) for resultado, valor in _RE_COMANDOS_ESCRITOR.findall(texto)},
+    )
+
+
+# --- Clientes ---------------------------------------------------------------
+
+class _Cliente:
+    """Conexão HTTP persistente com o cookie de sessão."""
+
+    def __init__(self, porta):
+        self.porta = porta
+        self.conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=60)
+        self.cookie = None
+
+    def requisitar(self, metodo, url, corpo=None):
+        cabecalhos = {"Content-Type": "application/json", "Accept": "application/json"}
+        if self.cookie:
+            cabecalhos["Cookie"] = self.cookie
+        dados = json.dumps(corpo) if corpo is not None else None
+        try:
+            self.conexao.request(metodo, url, body=dados, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+        except (OSError, http.client.HTTPException):
+            # Reabre a conexão para a próxima requisição.
+            self.conexao.close()
+            self.conexao = http.client.HTTPConnection("127.0.0.1", self.porta, timeout=60)
+            raise
+        # O cookie de sessão é "Secure" fora do modo de desenvolvimento e um
+        # cliente HTTP comum não o reenviaria; aqui é repassado manualmente.
+        cookie = resposta.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return resposta.status, conteudo
+
+
+def _trabalhador(indice, portas, produtos, mistura, duracao, semente):
+    """Gera tráfego até o prazo; retorna as amostras (operação, categoria, ms)."""
+    rng = random.Random(semente + indice)
+    cliente = _Cliente(portas[indice % len(portas)])
+    status, _ = cliente.requisitar(
+        "POST", "/auth/login", {"email": EMAIL_BENCHMARK, "senha": SENHA_BENCHMARK})
+    if status != 200:
+        raise RuntimeError(f"Login falhou no cliente {indice}: {status}")
+
+    operacoes = list(mistura)
+    pesos = [mistura[o] for o in operacoes]
+    amostras = []
+    itens_vendidos = 0
+    inicio_trafego = time.time()
+    prazo = time.monotonic() + duracao
+    while time.monotonic() < prazo:
+        operacao = rng.choices(operacoes, weights=pesos)[0]
+        quantidade_itens = 0
+        if operacao == "venda":
+            escolhidos = rng.sample(produtos, rng.randint(1, min(3, len(produtos))))
+            quantidade_itens = len(escolhidos)
+            metodo, url, corpo = "POST", "/estoque/vendas", {
+                "itens": [
+                    {"produto_id": pid, "quantidade": rng.randint(1, 3), "preco_unitario": preco}
+                    for pid, preco in escolhidos
+                ],
+                "forma_pagamento": "pix",
+            }
+        elif operacao in ("saida", "entrada"):
+            metodo, url, corpo = "POST", f"/estoque/{operacao}", {
+                "produto_id": rng.choice(produtos)[0],
+                "quantidade": rng.randint(1, 5),
+                "classificacao": "venda" if operacao == "saida" else "reposicao",
+            }
+        else:
+            metodo, url, corpo = "GET", rng.choice(LEITURAS), None
+
+        inicio = time.perf_counter()
+        try:
+            status, conteudo = cliente.requisitar(metodo, url, corpo)
+        except (OSError, http.client.HTTPException):
+            categoria = "erro_conexao"
+        else:
+            if status < 400:
+                categoria = "ok"
+                itens_vendidos += quantidade_itens
+            elif status == 400 and "insuficiente" in conteudo.decode("utf-8", "replace"):
+                categoria = "estoque_insuficiente"
+            elif status >= 500:
+                categoria = "erro_servidor"
+            else:
+                categoria = f"http_{status}"
+        amostras.append((operacao, categoria, (time.perf_counter() - inicio) * 1000))
+    return {
+        "amostras": amostras,
+        "itens_vendidos": itens_vendidos,
+        # Relógio de parede: comparável entre processos.
+        "inicio": inicio_trafego,
+        "fim": time.time(),
+    }
+
+
+# --- Consistência -----------------------------------------------------------
+
+def _situacao_estoque(conn):
+    """{produto_id: (estoque, soma dos movimentos)} e o maior id de movimento."""
+    saldos = {
+        pid: (estoque, soma)
+        for pid, estoque, soma in conn.execute(
+            """
+            SELECT p.id, p.estoque, COALESCE(m.soma, 0)
+            FROM produto p
+            LEFT JOIN (
+                SELECT produto_id, SUM(quantidade) AS soma
+                FROM estoque_movimentacao GROUP BY produto_id
+            ) m ON m.produto_id = p.id
+            """
+        )
+    }
+    ultimo_movimento = conn.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM estoque_movimentacao").fetchone()[0]
+    ultima_venda = conn.execute("SELECT COALESCE(MAX(id), 0) FROM venda").fetchone()[0]
+    return saldos, ultimo_movimento, ultima_venda
+
+
+def _verificar_consistencia(database, antes, resumo_operacoes, itens_vendidos):
+    saldos_antes, ultimo_movimento, ultima_venda = antes
+    conn = sqlite3.connect(database)
+    try:
+        saldos_depois, _, _ = _situacao_estoque(conn)
+        divergentes = [
+            pid
+            for pid, (estoque, soma) in saldos_depois.items()
+            if estoque - saldos_antes.get(pid, (0, 0))[0] != soma - saldos_antes.get(pid, (0, 0))[1]
+        ]
+        movimentos_incoerentes = conn.execute(
+            """
+            SELECT COUNT(*) FROM estoque_movimentacao
+            WHERE id > ? AND estoque_atual - estoque_anterior != quantidade
+            """,
+            (ultimo_movimento,),
+        ).fetchone()[0]
+        encadeamento_quebrado = conn.execute(
+            """
+            SELECT COUNT(*) FROM (
+                SELECT id, estoque_anterior,
+                       LAG(estoque_atual) OVER (PARTITION BY produto_id ORDER BY id) AS atual_anterior
+                FROM estoque_movimentacao
+                WHERE produto_id IN (
+                    SELECT DISTINCT produto_id FROM estoque_movimentacao WHERE id > ?
+                )
+            )
+            WHERE id > ? AND atual_anterior IS NOT NULL AND atual_anterior != estoque_anterior
+            """,
+            (ultimo_movimento, ultimo_movimento),
+        ).fetchone()[0]
+        movimentos_gravados = conn.execute(
+            "SELECT COUNT(*) FROM estoque_movimentacao WHERE id > ?", (ultimo_movimento,)
+        ).fetchone()[0]
+        vendas_gravadas = conn.execute(
+            "SELECT COUNT(*) FROM venda WHERE id > ?", (ultima_venda,)).fetchone()[0]
+    finally:
+        conn.close()
+
+    def sucessos(operacao):
+        return resumo_operacoes.get(operacao, {}).get("categorias", {}).get("ok", 0)
+
+    movimentos_esperados = itens_vendidos + sucessos("saida") + sucessos("entrada")
+    resultado = {
+        "produtos_divergentes": len(divergentes),
+        "movimentos_incoerentes": movimentos_incoerentes,
+        "encadeamento_quebrado": encadeamento_quebrado,
+        "vendas_gravadas": vendas_gravadas,
+        "vendas_com_sucesso": sucessos("venda"),
+        "movimentos_gravados": movimentos_gravados,
+        "movimentos_esperados": movimentos_esperados,
+    }
+    resultado["violacoes"] = (
+        len(divergentes)
+        + movimentos_incoerentes
+        + encadeamento_quebrado
+        + abs(vendas_gravadas - resultado["vendas_com_sucesso"])
+        + abs(movimentos_gravados - movimentos_esperados)
+    )
+    return resultado
+
+
+# --- Execução ---------------------------------------------------------------
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(round((len(valores) - 1) * p)))]
+
+
+def _resumir(amostras, duracao):
+    por_operacao = {}
+    for operacao, categoria, ms in amostras:
+        dados = por_operacao.setdefault(operacao, {"latencias": [], "categorias": {}})
+        dados["categorias"][categoria] = dados["categorias"].get(categoria, 0) + 1
+        if categoria == "ok":
+            dados["latencias"].append(ms)
+
+    resumo = {}
+    for operacao, dados in sorted(por_operacao.items()):
+        latencias = sorted(dados["latencias"])
+        total = sum(dados["categorias"].values())
+        resumo[operacao] = {
+            "requisicoes": total,
+            "por_segundo": round(total / duracao, 1),
+            "categorias": dados["categorias"],
+            "p50_ms": round(_percentil(latencias, 0.50), 2),
+            "p95_ms": round(_percentil(latencias, 0.95), 2),
+            "p99_ms": round(_percentil(latencias, 0.99), 2),
+            "media_ms": round(statistics.fmean(latencias), 2) if latencias else 0.0,
+        }
+    return resumo
+
+
+def executar_teste_carga(
+    clientes=8,
+    processos=False,
+    servidores=1,
+    threads_servidor=True,
+    escritor_unico=False,
+    duracao=10.0,
+    mistura=None,
+    banco=None,
+    dados=None,
+    semente=42,
+    progresso=None,
+):
+    """
+    Executa o teste de carga em um banco temporário.
+
+    Args:
+        clientes (int): Threads (ou processos) clientes.
+        processos (bool): Clientes em processos em vez de threads.
+        servidores (int): Processos servidores (werkzeug) no mesmo banco.
+        threads_servidor (bool): Cada servidor atende com uma thread por
+            requisição; False serializa as requisições de cada servidor.
+        escritor_unico (bool): Servidores gravam movimentos e vendas pelo
+            escritor único (group commit) em vez de uma transação por
+            requisição.
+        duracao (float): Segundos de tráfego.
+        mistura (dict, opcional): Pesos por operação (venda, saida, entrada,
+            leitura); padrão MISTURA_PADRAO.
+        banco (str, opcional): Banco a copiar em vez de gerar dados.
+        dados (dict, opcional): Parâmetros de gerar_dados.
+        semente (int): Semente do tráfego.
+        progresso (callable, opcional): Recebe mensagens de andamento.
+
+    Returns:
+        dict: Vazão, latências por operação, erros SQL e consistência.
+    """
+    avisar = progresso or (lambda mensagem: None)
+    mistura = mistura or MISTURA_PADRAO
+    dados = {**DADOS_PADRAO, **(dados or {})}
+    database_anterior = database_utils.DATABASE_NAME
+    nivel_log_anterior = database_utils.logger.level
+    database_utils.logger.setLevel("WARNING")
+    diretorio = tempfile.mkdtemp(prefix="gep_carga_")
+    processos_servidores = []
+    try:
+        contexto = preparar_banco(diretorio, banco, dados, avisar)
+        database = database_utils.DATABASE_NAME
+        # O processo atual não usa mais o banco; os servidores abrem o seu.
+        configurar_pool(database=database_anterior)
+        produtos = contexto["produtos_com_estoque"][:PRODUTOS_DISPUTADOS]
+
+        conn = sqlite3.connect(database)
+        try:
+            antes = _situacao_estoque(conn)
+        finally:
+            conn.close()
+
+        token_metricas = secrets.token_hex(16)
+        processos_servidores = _iniciar_servidores(
+            database, servidores, threads_servidor, escritor_unico, token_metricas)
+        portas = [porta for _, porta in processos_servidores]
+        avisar(
+            f"{servidores} servidor(es) em {', '.join(map(str, portas))}; "
+            f"{clientes} cliente(s) {'em processos' if processos else 'em threads'} "
+            f"{'com escritor único ' if escritor_unico else ''}"
+            f"por {duracao:g} s"
+        )
+
+        executor = (
+            ProcessPoolExecutor(clientes, mp_context=multiprocessing.get_context("spawn"))
+            if processos
+            else ThreadPoolExecutor(clientes)
+        )
+        with executor:
+            futuros = [
+                executor.submit(_trabalhador, i, portas, produtos, mistura, duracao, semente)
+                for i in range(clientes)
+            ]
+            resultados = [f.result() for f in futuros]
+        # Só o tráfego conta: a partida dos clientes e o login ficam de fora.
+        decorrido = max(r["fim"] for r in resultados) - min(r["inicio"] for r in resultados)
+
+        erros_sql = {}
+        escritor = {"lotes": 0, "comandos": 0}
+        repeticoes = {"retries": 0, "retry_giveups": 0}
+        for porta in portas:
+            erros, repeticoes_servidor, lotes, comandos = _metricas_servidor(porta, token_metricas)
+            for nome, valor in repeticoes_servidor.items():
+                repeticoes[nome] += int(valor)
+            for codigo, valor in erros.items():
+                erros_sql[codigo] = int(erros_sql.get(codigo, 0) + valor)
+            escritor["lotes"] += int(lotes)
+            escritor["comandos"] += int(sum(comandos.values()))
+    finally:
+        for processo, _ in processos_servidores:
+            processo.terminate()
+            processo.join(10)
+        database_utils.logger.setLevel(nivel_log_anterior)
+
+    try:
+        amostras = [a for r in resultados for a in r["amostras"]]
+        operacoes = _resumir(amostras, decorrido)
+        consistencia = _verificar_consistencia(
+            database, antes, operacoes, sum(r["itens_vendidos"] for r in resultados))
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    ok = sum(1 for _, categoria, _ in amostras if categoria == "ok")
+    return {
+        "clientes": clientes,
+        "modo_clientes": "processos" if processos else "threads",
+        "servidores": servidores,
+        "escritor_unico": escritor_unico,
+        "duracao_s": round(decorrido, 2),
+        "requisicoes": len(amostras),
+        "requisicoes_por_segundo": round(len(amostras) / decorrido, 1),
+        "sucessos_por_segundo": round(ok / decorrido, 1),
+        "operacoes": operacoes,
+        "erros_sql": erros_sql,
+        "erros_busy_locked": erros_sql.get("SQLITE_BUSY", 0) + erros_sql.get("SQLITE_LOCKED", 0),
+        "transacoes_repetidas": repeticoes["retries"],
+        "transacoes_desistidas": repeticoes["retry_giveups"],
+        "consistencia": consistencia,
+        "escritor": {
+            **escritor,
+            "comandos_por_lote": (
+                round(escritor["comandos"] / escritor["lotes"], 2) if escritor["lotes"] else 0
+            ),
+        },
+    }